@@ -9,9 +9,57 @@ from parlai.core.dict import DictionaryAgent
 from parlai.core.worlds import DialogPartnerWorld
 from parlai.core.params import ParlaiParser, str2class
 from parlai.core.worlds import create_task
+from collections import defaultdict
+from multiprocessing import Process, Queue
 import copy
 import importlib
 import os
+import queue
+
+def pass_examples(world, max_exs):
+    """Does a parley for each of the first ``max_exs`` examples of the world
+    (all of them if ``max_exs`` isn't positive).
+    """
+    cnt = 0
+    for _ in world:
+        cnt += 1
+        if cnt > max_exs and max_exs > 0:
+            return True
+        world.parley()
+    return False
+
+def count_shard(world, dictionary, shard, num_shards, max_exs, counts):
+    """Counts the tokens of every ``num_shards``-th example of the world,
+    starting with the ``shard``-th, and puts them in the ``counts`` queue.
+    """
+    dictionary.build_shard = (shard, num_shards)
+    dictionary.freq = defaultdict(int)
+    pass_examples(world, max_exs)
+    counts.put(dict(dictionary.freq))
+
+def count_in_processes(world, dictionary, num_processes, max_exs):
+    """Adds the tokens of the examples to the dictionary, tokenizing them in
+    ``num_processes`` processes.
+    Every process forks the world and goes through the same examples, but
+    only its dictionary's shard of them is tokenized. The counts are summed,
+    so the sorted dictionary is the same as the one built in one process.
+    """
+    counts = Queue()
+    procs = [Process(target=count_shard, args=(world, dictionary, i,
+                                               num_processes, max_exs, counts))
+             for i in range(num_processes)]
+    for p in procs:
+        p.start()
+    merged = 0
+    while merged < num_processes:
+        try:
+            dictionary.add_counts(counts.get(timeout=1))
+            merged += 1
+        except queue.Empty:
+            if any(p.exitcode for p in procs):
+                raise RuntimeError('a dictionary building process failed')
+    for p in procs:
+        p.join()
 
 def build_dict(opt):
     if not opt.get('dict_file'):
@@ -30,20 +78,17 @@ def build_dict(opt):
         # Default dictionary class
         dictionary = DictionaryAgent(opt)
     ordered_opt = copy.deepcopy(opt)
-    cnt = 0
     # we use train set to build dictionary
     ordered_opt['datatype'] = 'train:ordered'
     ordered_opt['numthreads'] = 1
     ordered_opt['batchsize'] = 1
     world_dict = create_task(ordered_opt, dictionary)
     # pass examples to dictionary
-    for _ in world_dict:
-        cnt += 1
-        if cnt > opt['dict_maxexs'] and opt['dict_maxexs'] > 0:
-            print('Processed {} exs, moving on.'.format(opt['dict_maxexs']))
-            # don't wait too long...
-            break
-        world_dict.parley()
+    if opt.get('dict_build_processes', 1) > 1:
+        count_in_processes(world_dict, dictionary,
+                           opt['dict_build_processes'], opt['dict_maxexs'])
+    elif pass_examples(world_dict, opt['dict_maxexs']):
+        print('Processed {} exs, moving on.'.format(opt['dict_maxexs']))
     print('[ dictionary built. ]')
     dictionary.save(opt['dict_file'], sort=True)
     # print('[ num words =  %d ]' % len(dictionary))
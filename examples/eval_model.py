@@ -10,6 +10,10 @@ For example:
 `python examples/eval_model.py -t "babi:Task1k:2" -m "repeat_label"`
 or
 `python examples/eval_model.py -t "#CornellMovie" -m "ir_baseline" -mp "-lp 0.5"`
+
+Valid and test data of dialog teachers can be evaluated in several processes
+with `--eval-processes`, e.g.
+`python examples/eval_model.py -t "babi:Task1k:2" -m "repeat_label" -dt valid --eval-processes 4`
 """
 from parlai.core.params import ParlaiParser
 from parlai.core.agents import create_agent
@@ -2,31 +2,54 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree. An additional grant
 # of patent rights can be found in the PATENTS file in the same directory.
-"""Basic example which iterates through the tasks specified and load/extract the 
-image features. 
+"""Extracts the image features of all the images of the tasks specified, for
+one datatype, so that training and evaluation don't have to run the CNN.
 
 For example, to extract the image feature of COCO images:
 `python examples/extract_image_feature.py -t vqa_v1 -im resnet152`.
 
-The CNN model and layer is specified at `--image-cnntype` and `--image-layernum` 
-in `parlai.core.image_featurizers`. 
+The CNN model and layer are chosen with `--image-mode`. The images are run
+through the CNN in batches of `--image-batchsize`, while `--decode-workers`
+processes open and resize the next ones. Images which already have a feature
+are skipped.
+
+With `-im raw` or `-im ascii`, the decoded pixels of the images are packed
+into one memory-mapped file per image directory instead, which is read with
+`--image-pixel-store true`, e.g. for the small images of mnist_qa:
+`python examples/extract_image_feature.py -t mnist_qa -im ascii`.
 
 For more options, check `parlai.core.image_featurizers`
 """
 
 from parlai.core.params import ParlaiParser
-from parlai.agents.repeat_label.repeat_label import RepeatLabelAgent
-from parlai.core.worlds import create_task
+from parlai.core.agents import create_task_agent_from_taskname
+from parlai.core.dialog_teacher import DialogTeacher
 from parlai.core.image_featurizers import ImageLoader
 
-import random
+import time
+
+
+def teacher_image_paths(teacher):
+    """Yields the image paths of all the examples of ``teacher``."""
+    if hasattr(teacher, 'tasks'):
+        # multitask teacher
+        for task in teacher.tasks:
+            yield from teacher_image_paths(task)
+    elif isinstance(teacher, DialogTeacher):
+        for episode_idx in range(teacher.data.num_episodes()):
+            yield from teacher.data.image_paths(episode_idx)
+    elif hasattr(teacher, 'image_paths'):
+        for idx in range(len(teacher)):
+            yield from teacher.image_paths(idx)
+    else:
+        print('[ no image paths for: {} ]'.format(teacher.getID()))
 
-def main():
-    random.seed(42)
 
+def main():
     # Get command line arguments
     parser = ParlaiParser()
-    parser.add_argument('-n', '--num-examples', default=10)
+    parser.add_argument('--decode-workers', default=4, type=int,
+                        help='number of processes opening and resizing images')
     parser.set_defaults(datatype='train:ordered')
 
     ImageLoader.add_cmdline_args(parser)
@@ -34,18 +57,27 @@ def main():
 
     opt['no_cuda'] = False
     opt['gpu'] = 0
-    # create repeat label agent and assign it to the specified task
-    agent = RepeatLabelAgent(opt)
-    world = create_task(opt, agent)
-
-    # Show some example dialogs.
-    with world:
-        for k in range(int(opt['num_examples'])):
-            world.parley()
-            print(world.display() + '\n~~')
-            if world.epoch_done():
-                print('EPOCH DONE')
-                break
+
+    paths = []
+    seen = set()
+    for teacher in create_task_agent_from_taskname(opt):
+        for path in teacher_image_paths(teacher):
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    print('[ {} images ]'.format(len(paths)))
+
+    start = time.time()
+    loader = ImageLoader(opt)
+    if opt['image_mode'] in ('raw', 'ascii'):
+        num = loader.pack_files(paths, opt['decode_workers'])
+        print('[ packed {} images in {:.1f}s ]'.format(
+            num, time.time() - start))
+    else:
+        num = loader.extract_files(paths, opt['decode_workers'])
+        print('[ extracted {} image features in {:.1f}s ]'.format(
+            num, time.time() - start))
+
 
 if __name__ == '__main__':
     main()
@@ -48,7 +48,7 @@ def run_eval(agent, opt, datatype, still_training=False, max_exs=-1):
             first_run = False
             print(valid_world.display() + '\n~~')
             print(valid_world.report())
-        cnt += opt['batchsize']
+        cnt += valid_world.parley_size()
         if valid_world.epoch_done() or (max_exs > 0 and cnt > max_exs):
             # note this max_exs is approximate--some batches won't always be
             # full depending on the structure of the data
@@ -164,6 +164,11 @@ def main():
             log = '[ {} ] {}'.format(' '.join(logs), train_report)
 
             print(log)
+            timings = getattr(world, 'timings', None)
+            if timings is not None and not (hasattr(train_report, 'get') and
+                                            'timing' in train_report):
+                # the world's report wasn't logged, print the timings alone
+                print('[ timing: {} ]'.format(timings.report()))
             log_time.reset()
 
         if (opt['validation_every_n_secs'] > 0 and
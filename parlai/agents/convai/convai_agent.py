@@ -6,6 +6,7 @@
 
 from parlai.core.agents import Agent
 
+import asyncio
 import requests
 import os
 import json
@@ -27,35 +28,54 @@ class ConvAIAgent(Agent):
         self.chat_id = None
         self.episode_done = False
 
+    def _end_reply(self):
+        reply = {
+            'text': '',
+            'episode_done': True,
+            'id': self.id
+        }
+        self._cleanup()
+        return reply
+
+    def _get_reply(self):
+        """Polls the router bot once, returns the reply or None."""
+        res = requests.get(os.path.join(self.bot_url,'getUpdates'))
+        for m in res.json():
+            if self.chat_id is None and m['message']['text'].startswith('/start '):
+                self.chat_id = m['message']['chat']['id']
+                self.id += str(self.chat_id)
+
+            if m['message']['chat']['id'] == self.chat_id:
+                print("Accept message: %s" % m)
+                return {'text': m['message']['text'], 'id': self.id}
+            else:
+                if self.chat_id is None:
+                    print("Dialog not started yet. Ignore message: %s" % m)
+                else:
+                    print("Multiple dialogues are not allowed. Ignore message: %s" % m)
+        return None
+
     def act(self):
-        reply = {}
         if self.episode_done:
-            reply = {
-                'text': '',
-                'episode_done': True,
-                'id': self.id
-            }
-            self._cleanup()
-        else:
-            while True:
-                res = requests.get(os.path.join(self.bot_url,'getUpdates'))
-                for m in res.json():
-                    if self.chat_id is None and m['message']['text'].startswith('/start '):
-                        self.chat_id = m['message']['chat']['id']
-                        self.id += str(self.chat_id)
-
-                    if m['message']['chat']['id'] == self.chat_id:
-                        print("Accept message: %s" % m)
-                        reply['text'] = m['message']['text']
-                        reply['id'] = self.id
-                        return reply
-                    else:
-                        if self.chat_id is None:
-                            print("Dialog not started yet. Ignore message: %s" % m)
-                        else:
-                            print("Multiple dialogues are not allowed. Ignore message: %s" % m)
-                time.sleep(5)
-        return reply
+            return self._end_reply()
+        while True:
+            reply = self._get_reply()
+            if reply is not None:
+                return reply
+            time.sleep(5)
+
+    async def act_async(self):
+        """Same as ``act()``, but waits between polls without blocking the
+        event loop, so an ``AsyncWorld`` runs other conversations meanwhile.
+        """
+        if self.episode_done:
+            return self._end_reply()
+        loop = asyncio.get_event_loop()
+        while True:
+            reply = await loop.run_in_executor(None, self._get_reply)
+            if reply is not None:
+                return reply
+            await asyncio.sleep(5)
 
     def observe(self, observation):
         if self.chat_id is None:
@@ -25,6 +25,7 @@ import os
 import numpy as np
 import logging
 import copy
+from collections import OrderedDict
 try:
     import spacy
 except ModuleNotFoundError:
@@ -101,6 +102,9 @@ class SimpleDictionaryAgent(DictionaryAgent):
 
 class DrqaAgent(Agent):
 
+    # number of tokenized documents kept for examples with a context_id
+    doc_cache_size = 1000
+
     @staticmethod
     def add_cmdline_args(argparser):
         config.add_cmdline_args(argparser)
@@ -145,6 +149,7 @@ class DrqaAgent(Agent):
             torch.cuda.set_device(opt['gpu'])
             self.model.cuda()
         self.n_examples = 0
+        self.doc_cache = OrderedDict()
 
     def _init_from_scratch(self):
         self.feature_dict = build_feature_dict(self.opt)
@@ -175,6 +180,7 @@ class DrqaAgent(Agent):
             dialogue = self.observation['text'].split('\n')[:-1]
             dialogue.extend(observation['text'].split('\n'))
             observation['text'] = '\n'.join(dialogue)
+            observation.pop('context_id', None)
         self.observation = observation
         self.episode_done = observation['episode_done']
         return observation
@@ -265,7 +271,8 @@ class DrqaAgent(Agent):
             raise RuntimeError('Invalid input. Is task a QA task?')
 
         document, question = ' '.join(fields[:-1]), fields[-1]
-        inputs['document'] = self.word_dict.tokenize(document)
+        document_tokens, document_spans = self._tokenize_document(ex, document)
+        inputs['document'] = document_tokens
         inputs['question'] = self.word_dict.tokenize(question)
         inputs['target'] = None
 
@@ -281,7 +288,30 @@ class DrqaAgent(Agent):
         inputs = vectorize(self.opt, inputs, self.word_dict, self.feature_dict)
 
         # Return inputs with original text + spans (keep for prediction)
-        return inputs + (document, self.word_dict.span_tokenize(document))
+        return inputs + (document, document_spans)
+
+    def _tokenize_document(self, ex, document):
+        """Returns the tokens and token spans of the document. They are cached
+        for teachers which send the id of the document (see the shared
+        contexts of ``DialogData``), since it has several questions.
+        """
+        if 'context_id' not in ex:
+            return (self.word_dict.tokenize(document),
+                    self.word_dict.span_tokenize(document))
+        # context ids are only unique within one dataset, and e.g. the train
+        # and valid teachers of a task have the same id, so check the document
+        key = (ex.get('id'), ex['context_id'])
+        cached = self.doc_cache.get(key)
+        if cached is not None and cached[0] == document:
+            self.doc_cache.move_to_end(key)
+            return cached[1], cached[2]
+        tokenized = (self.word_dict.tokenize(document),
+                     self.word_dict.span_tokenize(document))
+        self.doc_cache[key] = (document,) + tokenized
+        self.doc_cache.move_to_end(key)
+        if len(self.doc_cache) > self.doc_cache_size:
+            self.doc_cache.popitem(last=False)
+        return tokenized
 
     def _find_target(self, document, labels):
         """Find the start/end token span for all labels in document.
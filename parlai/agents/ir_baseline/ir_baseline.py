@@ -19,10 +19,12 @@ import math
 import random
 from collections.abc import Sequence
 import heapq
+import numpy as np
 
 from parlai.core.agents import Agent
 from parlai.core.params import ParlaiParser
 from parlai.core.dict import DictionaryAgent
+from parlai.core.utils import CandidateSet
 
 class MaxPriorityQueue(Sequence):
     def __init__(self, max_size):
@@ -74,8 +76,45 @@ def score_match(query_rep, text, length_penalty, debug=False):
     score = score / math.pow(norm * query_rep['norm'], length_penalty)
     return score
 
+def pool_index(pool):
+    """ Returns an inverted index from words to the ids of the candidates of
+    the pool containing them, and the number of distinct words of every
+    candidate. They are computed once and cached in the pool. """
+    if 'ir_baseline' not in pool.cache:
+        postings = {}
+        num_words = np.zeros(len(pool))
+        for i, c in enumerate(pool):
+            words = set(c.lower().split(' '))
+            num_words[i] = len(words)
+            for w in words:
+                postings.setdefault(w, []).append(i)
+        postings = {w: np.array(ids) for w, ids in postings.items()}
+        pool.cache['ir_baseline'] = (postings, num_words)
+    return pool.cache['ir_baseline']
+
+def rank_pool_candidates(query_rep, cands, length_penalty, num=100):
+    """ Same as rank_candidates, for a CandidateSet: scores the candidates of
+    its pool all at once with the pool's inverted index. """
+    postings, num_words = pool_index(cands.pool)
+    score = np.zeros(len(num_words))
+    for w in query_rep['words']:
+        ids = postings.get(w)
+        if ids is not None:
+            score[ids] += 1
+    norm = np.sqrt(num_words) * query_rep['norm']
+    score /= np.power(norm, length_penalty)
+    top = np.arange(len(score))
+    if len(score) > num:
+        top = np.argpartition(-score, num)[:num]
+    ranked = [(score[i], cands.pool[i]) for i in top]
+    ranked.extend((score_match(query_rep, c, length_penalty), c)
+                  for c in cands.extra)
+    return [c for _, c in sorted(ranked, reverse=True)[:num]]
+
 def rank_candidates(query_rep, cands, length_penalty):
     """ Rank candidates given representation of query """
+    if isinstance(cands, CandidateSet):
+        return rank_pool_candidates(query_rep, cands, length_penalty)
     if True:
         mpq = MaxPriorityQueue(100)
         for c in cands:
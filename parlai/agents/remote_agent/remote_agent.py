@@ -6,6 +6,7 @@
 from parlai.core.agents import Agent, create_agent_from_shared
 from parlai.core.dict import DictionaryAgent
 import argparse
+import asyncio
 import copy
 import numpy as np
 import json
@@ -103,6 +104,18 @@ class RemoteAgentAgent(Agent):
         reply = self.socket.recv_unicode()
         return json.loads(reply)
 
+    async def act_async(self):
+        """Same as ``act()``, but waits for the reply without blocking the
+        event loop, so an ``AsyncWorld`` runs other conversations meanwhile.
+        """
+        if self.observation is not None:
+            text = json.dumps(sanitize(self.observation))
+            self.socket.send_unicode(text)
+        while not self.socket.poll(0, zmq.POLLIN):
+            await asyncio.sleep(0.01)
+        reply = self.socket.recv_unicode()
+        return json.loads(reply)
+
     def share(self):
         """Increments port to use when using remote agents in Hogwild mode."""
         if not hasattr(self, 'lastport'):
@@ -161,7 +174,15 @@ class ParsedRemoteAgent(RemoteAgentAgent):
     def act(self):
         parsed = {}
         for k, v in self.observation.items():
-            if type(v) == str:
+            if k.endswith('_vec'):
+                # converted by the teacher, used below instead of the text
+                continue
+            if k == 'labels' and 'labels_vec' in self.observation:
+                parsed[k] = [y.tolist() for y in self.observation['labels_vec']]
+            elif (k == 'text' and 'text_vec' in self.observation
+                    and '\n' not in v):
+                parsed[k] = [self.observation['text_vec'].tolist()]
+            elif type(v) == str:
                 # We split on newlines because we don't treat them as charactes
                 # in the default dictionary but our receiving agent might want
                 # to know where the newlines are in the text block.
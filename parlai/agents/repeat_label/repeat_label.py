@@ -55,6 +55,10 @@ class RepeatLabelAgent(Agent):
         if 'label_candidates' in obs and len(obs['label_candidates']) > 0:
             # Produce text_candidates by selecting random candidate labels.
             reply['text_candidates'] = [ reply['text'] ]
-            reply['text_candidates'].extend(random.sample(
-                obs['label_candidates'], min(len(obs['label_candidates']), 99)))
+            cands = obs['label_candidates']
+            if not hasattr(cands, '__getitem__'):
+                cands = list(cands)
+            # sample ids, large candidate sets (see CandidateSet) are not copied
+            ids = random.sample(range(len(cands)), min(len(cands), 99))
+            reply['text_candidates'].extend(cands[i] for i in ids)
         return reply
@@ -12,6 +12,7 @@ from torch import optim
 import torch.nn as nn
 import torch
 import copy
+import numpy as np
 import os
 import random
 
@@ -81,6 +82,9 @@ class Seq2seqAgent(Agent):
         self.episode_done = True
 
     def parse(self, text):
+        if type(text) != str:
+            # already converted by the teacher (see --cache-text-vecs)
+            return torch.LongTensor(text.tolist())
         return torch.LongTensor(self.dict.txt2vec(text))
 
     def v2t(self, vec):
@@ -134,6 +138,7 @@ class Seq2seqAgent(Agent):
             # recall what was said in that example
             prev_dialogue = self.observation['text']
             observation['text'] = prev_dialogue + '\n' + observation['text']
+            observation.pop('text_vec', None)
         self.observation = observation
         self.episode_done = observation['episode_done']
         return observation
@@ -223,27 +228,24 @@ class Seq2seqAgent(Agent):
         exs = [ex for ex in obs if 'text' in ex]
         valid_inds = [i for i, ex in enumerate(obs) if 'text' in ex]
 
-        batchsize = len(exs)
-        parsed = [self.parse(ex['text']) for ex in exs]
-        max_x_len = max([len(x) for x in parsed])
-        xs = torch.LongTensor(batchsize, max_x_len).fill_(0)
-        for i, x in enumerate(parsed):
-            offset = max_x_len - len(x)
-            for j, idx in enumerate(x):
-                xs[i][j + offset] = idx
+        xs, _ = self.dict.batch_txt2vec(
+            [ex.get('text_vec', ex['text']) for ex in exs], pad='left')
+        xs = torch.from_numpy(xs)
         if self.use_cuda:
             xs = xs.cuda(async=True)
         xs = Variable(xs)
 
         ys = None
         if 'labels' in exs[0]:
-            labels = [random.choice(ex['labels']) + ' ' + self.EOS for ex in exs]
-            parsed = [self.parse(y) for y in labels]
-            max_y_len = max(len(y) for y in parsed)
-            ys = torch.LongTensor(batchsize, max_y_len).fill_(0)
-            for i, y in enumerate(parsed):
-                for j, idx in enumerate(y):
-                    ys[i][j] = idx
+            if 'labels_vec' in exs[0]:
+                eos = self.EOS_TENSOR.numpy()
+                labels = [np.concatenate((random.choice(ex['labels_vec']), eos))
+                          for ex in exs]
+            else:
+                labels = [random.choice(ex['labels']) + ' ' + self.EOS
+                          for ex in exs]
+            ys, _ = self.dict.batch_txt2vec(labels, pad='right')
+            ys = torch.from_numpy(ys)
             if self.use_cuda:
                 ys = ys.cuda(async=True)
             ys = Variable(ys)
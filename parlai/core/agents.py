@@ -18,6 +18,10 @@
     creates a set of teachers based on a "task string" passed to the ``Teacher``,
     creating multiple teachers within it and alternating between them.
 
+    ``LazyTasks(object)``
+    holds the teachers (or worlds) of the tasks of a ``MultiTaskTeacher`` (or
+    ``MultiWorld``), optionally creating them only when they are first used.
+
 All agents are initialized with the following parameters:
 
     ``opt`` -- contains any options needed to set up the agent. This generally contains
@@ -38,8 +42,11 @@ This module also provides a utility method:
 """
 
 from .metrics import Metrics
+from collections import OrderedDict
 import copy
 import importlib
+import json
+import os
 import random
 
 
@@ -157,6 +164,199 @@ class Teacher(Agent):
         return shared
 
 
+class LazyTasks(object):
+    """Holds the teachers (or worlds) of the tasks of a multitask teacher (or
+    world), which are created by ``create(opt)`` with the opt of each task of
+    ``opt['task']``.
+
+    If ``opt['lazy_tasks']`` is set, a task is only created (and its data
+    loaded) the first time it is used. If ``opt['max_loaded_tasks']`` is set as
+    well, at most that many tasks stay loaded: the least recently used one is
+    dropped to make room for another one, and its last report is kept until it
+    is loaded again. With ordered data, only tasks which finished their epoch
+    are dropped, since the others couldn't resume it. Tasks are always created
+    up front for hogwild threads and eval processes, which share them.
+
+    The number of examples of lazy tasks is cached in
+    ``<datapath>/task_lengths.json``, so ``length()`` doesn't load them.
+
+    Copies of the container created from ``share()`` (e.g. by a
+    ``BatchWorld``) create their tasks with ``create_shared(shared)`` from the
+    tasks of the original container, so that every task is loaded once. A
+    task loaded again by a copy starts with cleared metrics.
+
+    ``on_load``, if set, is called with every task created afterwards (e.g.
+    ``World.enable_timing()`` uses it to time the agents of new tasks).
+    """
+
+    def __init__(self, opt, create, create_shared, shared=None):
+        self.create = create
+        self.create_shared = create_shared
+        self.opts = []
+        for k in opt['task'].split(','):
+            k = k.strip()
+            if k:
+                opt_singletask = copy.deepcopy(opt)
+                opt_singletask['task'] = k
+                self.opts.append(opt_singletask)
+        self.lazy = (opt.get('lazy_tasks', False) and
+                     opt.get('numthreads', 1) == 1)
+        self.max_loaded = opt.get('max_loaded_tasks', 0) if self.lazy else 0
+        self.ordered = opt.get('datatype') != 'train'
+        self.batchindex = opt.get('batchindex', 0)
+        self.items = [None] * len(self.opts)
+        self.used = OrderedDict()  # loaded tasks, least recently used first
+        self.done = set()  # dropped tasks which finished their epoch
+        self.reports = {}  # dropped task -> its id and last report
+        self.lengths_path = None
+        self.lengths = {}
+        if self.lazy and opt.get('datapath'):
+            self.lengths_path = os.path.join(opt['datapath'],
+                                             'task_lengths.json')
+            if os.path.isfile(self.lengths_path):
+                with open(self.lengths_path) as read:
+                    self.lengths = json.load(read)
+        self.on_load = None
+        self.origin = None
+        self.shares = None
+        self.copies = []
+        if shared is not None:
+            self.origin = shared['origin']
+            self.shares = shared['shares']
+            self.origin.copies.append(self)
+        if not self.lazy:
+            for i in range(len(self.items)):
+                self[i]
+
+    def __len__(self):
+        """Returns the number of tasks."""
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        """Returns the teacher (or world) of task ``idx``, loading it first if
+        needed.
+        """
+        if idx < 0:
+            idx += len(self.items)
+        if self.items[idx] is None:
+            self._set(idx, self._load(idx))
+        self.used.move_to_end(idx)
+        if self.max_loaded > 0 and len(self.used) > self.max_loaded:
+            self._drop(keep=idx)
+        return self.items[idx]
+
+    def _set(self, idx, item):
+        self.items[idx] = item
+        self.used[idx] = None
+        self.reports.pop(idx, None)
+        self.done.discard(idx)
+        if self.on_load is not None:
+            self.on_load(item)
+
+    def _load(self, idx):
+        if self.origin is None:
+            return self.create(self.opts[idx])
+        self.origin._load_copies(idx)
+        return self.items[idx]
+
+    def _load_copies(self, idx):
+        """Creates task ``idx`` for all the copies which don't have it at once,
+        since creating a teacher clears the metrics it shares with the others.
+        """
+        if self.shares[idx] is None:
+            self.shares[idx] = self[idx].share()
+        shared = self.shares[idx]
+        from parlai.core.worlds import find_opts_in_shared
+        opts = find_opts_in_shared(shared)
+        batchindex = [o.get('batchindex') for o in opts]
+        for c in self.copies:
+            if c.items[idx] is None:
+                # every copy reads its own part of ordered data
+                for o in opts:
+                    o['batchindex'] = c.batchindex
+                c._set(idx, c.create_shared(shared))
+        for o, i in zip(opts, batchindex):
+            o['batchindex'] = i
+
+    def _drop(self, keep):
+        """Drops the least recently used tasks which can be dropped, until at
+        most ``max_loaded`` are left.
+        """
+        for idx in list(self.used):
+            if len(self.used) <= self.max_loaded:
+                break
+            item = self.items[idx]
+            if idx == keep or (self.ordered and not item.epoch_done()):
+                continue
+            print('[dropping task: ' + self.opts[idx]['task'] + ']')
+            self.reports[idx] = (item.getID(), item.report())
+            if self.ordered:
+                self.done.add(idx)
+            self.items[idx] = None
+            del self.used[idx]
+            if self.origin is None and self.shares is not None:
+                self.shares[idx] = None
+
+    def loaded(self):
+        """Returns the list of the loaded teachers (or worlds)."""
+        return [item for item in self.items if item is not None]
+
+    def epoch_done(self, idx):
+        """Returns whether task ``idx`` finished its epoch, without loading
+        it.
+        """
+        if self.items[idx] is not None:
+            return self.items[idx].epoch_done()
+        return idx in self.done
+
+    def length(self, idx):
+        """Returns the number of examples of task ``idx``, from the cache of
+        lengths if it isn't loaded.
+        """
+        key = '{}:{}'.format(self.opts[idx]['task'],
+                             self.opts[idx].get('datatype', 'train').split(':')[0])
+        if self.items[idx] is None and key in self.lengths:
+            return self.lengths[key]
+        length = len(self[idx])
+        if self.lengths_path is not None and self.lengths.get(key) != length:
+            self.lengths[key] = length
+            with open(self.lengths_path + '.tmp', 'w') as write:
+                json.dump(self.lengths, write)
+            os.replace(self.lengths_path + '.tmp', self.lengths_path)
+        return length
+
+    def task_reports(self):
+        """Returns the ids and reports of the tasks which were used."""
+        reports = []
+        for idx, item in enumerate(self.items):
+            if item is not None:
+                reports.append((item.getID(), item.report()))
+            elif idx in self.reports:
+                reports.append(self.reports[idx])
+        return reports
+
+    def reset(self):
+        for item in self.loaded():
+            item.reset()
+        self.done.clear()
+        self.reports.clear()
+
+    def reset_metrics(self):
+        for item in self.loaded():
+            item.reset_metrics()
+        self.reports.clear()
+
+    def share(self):
+        if self.origin is not None:
+            return {'origin': self.origin, 'shares': self.shares}
+        if self.shares is None:
+            self.shares = [None] * len(self.items)
+        for idx, item in enumerate(self.items):
+            if item is not None and self.shares[idx] is None:
+                self.shares[idx] = item.share()
+        return {'origin': self, 'shares': self.shares}
+
+
 class MultiTaskTeacher(Teacher):
     """Creates a teacher that is actually a set of teachers each based on
     a task string--each of these teachers will get called in turn,
@@ -168,20 +368,12 @@ class MultiTaskTeacher(Teacher):
     """
 
     def __init__(self, opt, shared=None):
-        self.tasks = []
         self.opt = opt
         self.id = opt['task']
-        if shared and 'tasks' in shared:
-            self.tasks = [create_agent_from_shared(t) for t in shared['tasks']]
-        else:
-            tasks = opt['task'].split(',')
-            for k in tasks:
-                k = k.strip()
-                if k:
-                    opt_singletask = copy.deepcopy(opt)
-                    opt_singletask['task'] = k
-                    self.tasks.extend(create_task_agent_from_taskname(
-                        opt_singletask))
+        # each task string gives a single teacher (see the function below)
+        self.tasks = LazyTasks(
+            opt, lambda o: create_task_agent_from_taskname(o)[0],
+            create_agent_from_shared, shared and shared.get('tasks'))
         self.task_idx = -1
         self.new_task = True
         self.random = opt.get('datatype') == 'train'
@@ -190,8 +382,8 @@ class MultiTaskTeacher(Teacher):
         if not hasattr(self, 'len'):
             self.len = 0
             # length is sum of all task lengths
-            for _ind, t in enumerate(self.tasks):
-                self.len += len(t)
+            for i in range(len(self.tasks)):
+                self.len += self.tasks.length(i)
         return self.len
 
     def __iter__(self):
@@ -214,10 +406,10 @@ class MultiTaskTeacher(Teacher):
                 # do at most one full loop looking for unfinished task
                 for _ in range(len(self.tasks)):
                     self.task_idx = (self.task_idx + 1) % len(self.tasks)
-                    if not self.tasks[self.task_idx].epoch_done():
+                    if not self.tasks.epoch_done(self.task_idx):
                         # if this task has examples ready, break
                         break
-                if self.tasks[self.task_idx].epoch_done():
+                if self.tasks.epoch_done(self.task_idx):
                     # all tasks are done, so return empty action table
                     return {'episode_done': True}
         t = self.tasks[self.task_idx].act()
@@ -226,8 +418,8 @@ class MultiTaskTeacher(Teacher):
         return t
 
     def epoch_done(self):
-        for t in self.tasks:
-            if not t.epoch_done():
+        for i in range(len(self.tasks)):
+            if not self.tasks.epoch_done(i):
                 return False
         return True
 
@@ -238,9 +430,8 @@ class MultiTaskTeacher(Teacher):
         sum_accuracy = 0
         num_tasks = 0
         total = 0
-        for i in range(len(self.tasks)):
-            mt = self.tasks[i].report()
-            m['tasks'][self.tasks[i].getID()] = mt
+        for task_id, mt in self.tasks.task_reports():
+            m['tasks'][task_id] = mt
             total += mt['total']
             if 'accuracy' in mt:
                 sum_accuracy += mt['accuracy']
@@ -252,27 +443,25 @@ class MultiTaskTeacher(Teacher):
         return m
 
     def reset(self):
-        for t in self.tasks:
-            t.reset()
+        self.tasks.reset()
 
     def reset_metrics(self):
-        for t in self.tasks:
-            t.reset_metrics()
+        self.tasks.reset_metrics()
 
     def save(self):
-        for t in self.tasks:
+        for t in self.tasks.loaded():
             t.save()
 
     def share(self):
         shared = {}
         shared['class'] = type(self)
         shared['opt'] = self.opt
-        shared['tasks'] = [t.share() for t in self.tasks]
+        shared['tasks'] = self.tasks.share()
         return shared
 
     def shutdown(self):
         """Shutdown each agent."""
-        for t in self.tasks:
+        for t in self.tasks.loaded():
             t.shutdown()
 
 
@@ -6,8 +6,16 @@
 
 from .agents import Teacher
 
-from .image_featurizers import ImageLoader
+from .image_featurizers import ImageLoader, ImagePrefetcher
 from PIL import Image
+from .mmap_utils import StringPool, decode_string, is_stale
+from .mmap_utils import load_arrays, save_arrays
+from .thread_utils import shared_array
+from .utils import CandidatePool
+from array import array
+from collections import deque
+import hashlib
+import numpy as np
 import random
 import os
 import sys
@@ -24,11 +32,29 @@ class DialogTeacher(Teacher):
     - metrics tracking count of sent vs correctly answered queries
 
     If you have ``opt.numthreads > 1``, this also activates a shared memory
-    array for the data and lock-protected shared-memory metrics.
+    array for the data (see ``SharedDialogData``) and lock-protected
+    shared-memory metrics.
 
     In order to subclass this class, you must implement ``setup_data()`` in your
     class (or subclass another class which does, like ``FbDialogTeacher``), which
     reads your data file as an iterator.
+
+    If ``opt['compile_data']`` is set, the output of ``setup_data()`` is written
+    once to a binary file next to the data file, which is memory-mapped by
+    ``CompiledDialogData`` on every later run instead of parsing the data again.
+
+    If ``opt['cache_text_vecs']`` is set, the text and labels of every entry
+    are converted to token ids once with the dictionary in
+    ``opt['dict_file']``, stored next to the data file (see ``TextVecs``) and
+    sent in the ``text_vec`` and ``labels_vec`` fields of every action.
+
+    If ``opt['batch_sort']`` is set, the teachers of a ``BatchWorld`` pick
+    their training episodes from shared ``LengthBuckets``, so the examples of a
+    batch have similar lengths and need little padding.
+
+    If ``opt['image_prefetch']`` is set, the teacher draws its next episodes
+    ahead of time and loads their images in background threads (see
+    ``ImagePrefetcher``).
     """
 
     def __init__(self, opt, shared=None):
@@ -45,17 +71,50 @@ class DialogTeacher(Teacher):
 
         # first initialize any shared objects
         self.random = self.datatype == 'train'
-        if shared and shared.get('data'):
+        if shared and shared.get('data') is not None:
             self.data = shared['data']
+        elif opt.get('compile_data'):
+            # parse the data once into a binary file and memory-map it
+            path = self.compiled_datafile(opt)
+            if is_stale(path, opt.get('datafile')):
+                compile_dialog_data(self.setup_data(opt['datafile']), path)
+            self.data = CompiledDialogData(opt, path,
+                                           cands=self.label_candidates())
+        elif opt.get('numthreads', 1) > 1:
+            # keep one copy of the data in shared memory for all processes
+            self.data = SharedDialogData(opt, self.setup_data(opt['datafile']),
+                                         cands=self.label_candidates())
         else:
             self.data = DialogData(opt, self.setup_data(opt['datafile']),
                                    cands=self.label_candidates())
+        if opt.get('cache_text_vecs') and self.data.text_vecs is None:
+            self.data.text_vecs = self.load_text_vecs(opt)
+
+        self.buckets = None
+        if shared and shared.get('buckets'):
+            self.buckets = shared['buckets']
+        elif (self.random and opt.get('batch_sort') and
+                opt.get('batchsize', 1) > 1):
+            self.buckets = LengthBuckets(self.data, opt['batchsize'],
+                                         opt.get('batch_max_tokens', 0))
 
         # for ordered data in batch mode (especially, for validation and
         # testing), each teacher in the batch gets a start index and a step
         # size so they all process disparate sets of the data
         self.step_size = opt.get('batchsize', 1)
         self.data_offset = opt.get('batchindex', 0)
+        if opt.get('eval_shard') is not None:
+            # evaluating in several processes, each of which does its own
+            # batches (see ShardedWorld)
+            self.data_offset += opt['eval_shard'] * self.step_size
+            self.step_size *= opt['eval_processes']
+
+        self.prefetcher = None
+        if (opt.get('image_prefetch', 0) > 0 and self.buckets is None and
+                opt.get('image_mode', 'raw') not in (None, 'none')):
+            self.prefetcher = ImagePrefetcher(
+                self.data.image_loader, opt['image_prefetch'],
+                self.next_episode_idx, self.data.image_paths)
 
         self.reset()
 
@@ -65,6 +124,9 @@ class DialogTeacher(Teacher):
         self.metrics.clear()
         self.lastY = None
         self.episode_idx = self.data_offset - self.step_size
+        self.drawn_idx = self.episode_idx
+        if self.prefetcher is not None:
+            self.prefetcher.clear()
         self.episode_done = True
         self.epochDone = False
         if not self.random and self.data_offset >= self.data.num_episodes():
@@ -85,8 +147,43 @@ class DialogTeacher(Teacher):
     def share(self):
         shared = super().share()
         shared['data'] = self.data
+        shared['buckets'] = self.buckets
         return shared
 
+    def compiled_datafile(self, opt):
+        """Returns the path of the compiled version of this teacher's data,
+        which is stored next to ``opt['datafile']``. The class name is part of
+        the path, since different teachers may parse the same file differently.
+        """
+        return '{}.{}.compiled'.format(opt['datafile'],
+                                       type(self).__name__.lower())
+
+    def load_text_vecs(self, opt):
+        """Returns the ``TextVecs`` of this teacher's data for the dictionary
+        in ``opt['dict_file']``. They are loaded from a file next to the data
+        if it was made from the same data and dictionary, and (re)built
+        otherwise.
+        """
+        if not opt.get('dict_file') or not os.path.isfile(opt['dict_file']):
+            print('[ cache_text_vecs needs an existing dict_file. ]')
+            return None
+        fingerprint = dict_fingerprint(opt)
+        path = '{}.{}.vecs'.format(opt['datafile'], type(self).__name__.lower())
+        if not is_stale(path, opt.get('datafile')):
+            text_vecs = TextVecs(load_arrays(path))
+            if text_vecs.fingerprint == fingerprint:
+                return text_vecs
+        print('[ converting text to vectors: {} ]'.format(path))
+        # not imported at the top since nltk is slow to import
+        from .dict import DictionaryAgent
+        from .params import str2class
+        if opt.get('dict_class'):
+            dictionary = str2class(opt['dict_class'])(opt)
+        else:
+            dictionary = DictionaryAgent(opt)
+        save_arrays(path, encode_text_vecs(self.data, dictionary, fingerprint))
+        return TextVecs(load_arrays(path))
+
     def label_candidates(self):
         """Returns ``None`` by default, but override this in children (such as
         ``FbDialogTeacher``) to load up candidate labels for every example.
@@ -100,15 +197,30 @@ class DialogTeacher(Teacher):
             self.lastY = None
         return observation
 
+    def next_episode_idx(self):
+        """Draws the index of the next episode, for random or ordered data."""
+        num_eps = self.data.num_episodes()
+        if self.random:
+            # select random episode
+            return random.randrange(num_eps)
+        # select next episode
+        self.drawn_idx = (self.drawn_idx + self.step_size) % num_eps
+        return self.drawn_idx
+
     def next_example(self):
         num_eps = self.data.num_episodes()
         if self.episode_done:
-            if self.random:
-                # select random episode
-                self.episode_idx = random.randrange(num_eps)
+            if self.buckets is not None:
+                # take this teacher's episode of the current batch
+                self.episode_idx = self.buckets.next_episode(self.data_offset)
+                if self.episode_idx is None:
+                    # the batch is full already, sit this parley out
+                    return {'episode_done': True}, False
+            elif self.prefetcher is not None:
+                # drawn ahead of time, with its images loading
+                self.episode_idx = self.prefetcher.pop()
             else:
-                # select next episode
-                self.episode_idx = (self.episode_idx + self.step_size) % num_eps
+                self.episode_idx = self.next_episode_idx()
             self.entry_idx = 0
         else:
             self.entry_idx += 1
@@ -134,6 +246,7 @@ class DialogTeacher(Teacher):
         self.lastY = action.get('labels', None)
         if not self.datatype.startswith('train'):
             action.pop('labels', None)
+            action.pop('labels_vec', None)
         return action
 
     # Return transformed metrics showing total examples and accuracy if avail.
@@ -141,6 +254,186 @@ class DialogTeacher(Teacher):
         return self.metrics.report()
 
 
+class StreamDialogTeacher(DialogTeacher):
+    """A ``DialogTeacher`` which reads the ``setup_data()`` iterator as a
+    stream instead of loading all of it, for datasets too big to fit in memory
+    (see ``StreamDialogData``).
+
+    In training, the episodes are shuffled in a buffer of
+    ``opt['stream_buffer_size']`` episodes, and the stream starts over when it
+    ends. Otherwise they are read in order, and the epoch is done after the
+    last episode of the stream, so ``epoch_done()`` is exact.
+
+    The teachers of a ``BatchWorld``, the processes of a ``HogwildWorld`` and
+    the shards of a ``ShardedWorld`` each get their own part of the stream, in
+    the same order as for a ``DialogTeacher``.
+
+    ``len()`` is 0 until the stream has been read to the end once. Compiling
+    the data, caching text vectors and length buckets are not supported, and
+    shared contexts are joined to the text of every entry.
+    """
+
+    def __init__(self, opt, shared=None):
+        if not hasattr(self, 'setup_data'):
+            raise RuntimeError('Must implement setup_data or subclass a class' +
+                               ' which implements it (e.g. FbDialogTeacher)' +
+                               ' in order to use this class.')
+
+        # skip DialogTeacher.__init__, which loads all of the data
+        super(DialogTeacher, self).__init__(opt, shared)
+
+        self.datatype = opt['datatype']
+        self.random = self.datatype == 'train'
+        if shared and shared.get('data') is not None:
+            self.data = shared['data']
+        else:
+            datafile = opt['datafile']
+            self.data = StreamDialogData(
+                opt, lambda: self.setup_data(datafile),
+                cands=self.label_candidates(), shuffle=self.random)
+        self.buckets = None
+
+        self.step_size = opt.get('batchsize', 1)
+        self.data_offset = opt.get('batchindex', 0)
+        if opt.get('eval_shard') is not None:
+            self.data_offset += opt['eval_shard'] * self.step_size
+            self.step_size *= opt['eval_processes']
+        elif opt.get('threadindex') is not None:
+            # hogwild training, every process reads its own part
+            self.data_offset += opt['threadindex'] * self.step_size
+            self.step_size *= opt['numthreads']
+
+        self.epoch = 0
+        self.reset()
+
+    def reset(self):
+        self.metrics.clear()
+        self.lastY = None
+        self.episode = None
+        self.episode_done = True
+        self.epochDone = False
+        # the stream starts over when a teacher of a new epoch reads it
+        self.epoch += 1
+
+    def next_example(self):
+        if self.episode_done:
+            self.episode = self.data.next_episode(
+                self.data_offset, self.step_size, self.epoch)
+            if self.episode is None:
+                # no (more) episodes for this teacher
+                return {'episode_done': True}, True
+            self.entry_idx = 0
+        else:
+            self.entry_idx += 1
+
+        action = self.data.get(self.episode, self.entry_idx)
+        epoch_done = (not self.random and action['episode_done'] and
+                      not self.data.has_next(self.data_offset))
+        return action, epoch_done
+
+
+class LengthBuckets(object):
+    """Hands out the episodes of ``data`` in batches of similar length, for the
+    teachers of a ``BatchWorld``: the teacher with batch index ``i`` gets the
+    ``i``-th episode of the current batch from ``next_episode(i)``. A teacher
+    which asks again (e.g. after a shorter episode than the others) takes one
+    of the episodes of the batch which weren't handed out yet, and the next
+    batch starts once all of them were, so no episode is skipped.
+
+    Every epoch, the shuffled episodes are sorted by length in pools of
+    ``pool_batches`` batches, cut into batches of up to ``batchsize``
+    episodes, and the batches are shuffled. If ``max_tokens`` is set, batches
+    are also cut when the number of examples times the length of the longest
+    one would exceed it, so batches of short examples hold more of them than
+    batches of long ones; ``next_episode()`` returns ``None`` to the teachers
+    which are left without an episode.
+
+    The length of an episode is the number of words in its longest text, or
+    the number of tokens if the data has cached text vectors.
+    """
+
+    pool_batches = 100
+
+    def __init__(self, data, batchsize, max_tokens=0):
+        self.batchsize = batchsize
+        self.max_tokens = max_tokens
+        self.lengths = self.episode_lengths(data)
+        self.batches = []
+        self.batch = []
+        self.taken = set()
+
+    @staticmethod
+    def episode_lengths(data):
+        """Returns the list of the lengths of the episodes of ``data``, from
+        the stored entries (without building their tables, which would load
+        their images).
+        """
+        if data.text_vecs is not None:
+            # length of the text span of every entry, -1 for no text
+            vecs = data.text_vecs
+            lengths = vecs.spans[vecs.text_span, 1]
+            starts = data.episode_starts()[:-1]
+            return np.maximum.reduceat(lengths, starts).clip(0).tolist()
+        lengths = []
+        for ep in range(data.num_episodes()):
+            length = 0
+            entry_idx = 0
+            while True:
+                entry, episode_len = data._get_entry(ep, entry_idx)
+                if entry[0] is not None:
+                    length = max(length, len(data._text(entry).split()))
+                entry_idx += 1
+                if entry_idx == episode_len:
+                    break
+            lengths.append(length)
+        return lengths
+
+    def make_batches(self):
+        """Returns the shuffled batches of one epoch."""
+        episodes = list(range(len(self.lengths)))
+        random.shuffle(episodes)
+        batches = []
+        pool_size = self.batchsize * self.pool_batches
+        for start in range(0, len(episodes), pool_size):
+            pool = sorted(episodes[start:start + pool_size],
+                          key=self.lengths.__getitem__)
+            batch = []
+            for ep in pool:
+                # the pool is sorted, so this is the longest episode yet
+                tokens = (len(batch) + 1) * self.lengths[ep]
+                if batch and (len(batch) == self.batchsize or
+                              0 < self.max_tokens < tokens):
+                    batches.append(batch)
+                    batch = []
+                batch.append(ep)
+            batches.append(batch)
+        random.shuffle(batches)
+        return batches
+
+    def next_episode(self, batchindex):
+        """Returns the episode of the teacher with index ``batchindex`` in the
+        current batch (or another one of its episodes if the teacher asks
+        again), or ``None`` if the batch has fewer episodes.
+        """
+        slot = batchindex
+        if slot in self.taken:
+            # this teacher is done with its episode before the others
+            slot = next((i for i in range(len(self.batch))
+                         if i not in self.taken), None)
+            if slot is None:
+                self.batch = []
+                slot = batchindex
+        if not self.batch:
+            if not self.batches:
+                self.batches = self.make_batches()
+            self.batch = self.batches.pop()
+            self.taken.clear()
+        self.taken.add(slot)
+        if slot < len(self.batch):
+            return self.batch[slot]
+        return None
+
+
 class DialogData(object):
     """Provides a data structure for accessing textual dialog data.
     This can be used whenever the dialog data is a fixed log of chats
@@ -156,7 +449,12 @@ class DialogData(object):
 
         Where
 
-        - ``x`` is a query and possibly context
+        - ``x`` is a query and possibly context. It can also be a
+          ``(context, query)`` tuple, for data where many queries share a long
+          context (like the paragraphs of SQuAD): each distinct context is
+          then stored once, and ``get()`` returns ``context + '\n' + query``
+          as the text and the id of the context as ``context_id``, so agents
+          can cache their work per context.
 
         ``...`` can contain additional fields, specifically
 
@@ -170,11 +468,15 @@ class DialogData(object):
 
     ``cands`` can be set to provide a list of candidate labels for every example
     in this dataset, which the agent can choose from (the correct answer
-    should be in this set).
+    should be in this set). They are stored once in a ``CandidatePool``, and
+    examples get a ``CandidateSet`` view of it plus their labels.
 
 
     ``random`` tells the data class whether or not to visit episodes sequentially
     or randomly when returning examples to the caller.
+
+    Subclasses can change how the episodes are stored by overriding ``_load``,
+    ``__len__``, ``num_episodes`` and ``_get_entry`` (see ``CompiledDialogData``).
     """
 
     def __init__(self, opt, data_loader, cands=None):
@@ -183,10 +485,13 @@ class DialogData(object):
         # each entry is a tuple of values for the action/observation table
         self.opt = opt
         self.data = []
+        # distinct shared contexts, entries refer to them by index
+        self.contexts = []
         self._load(data_loader)
-        self.cands = None if cands == None else set(sys.intern(c) for c in cands)
-        self.addedCands = []
+        self.cands = None if cands == None else CandidatePool(cands)
         self.image_loader = ImageLoader(opt) 
+        # token ids of the text and labels, see TextVecs
+        self.text_vecs = None
 
     def __len__(self):
         """Returns total number of entries available. Each episode has at least
@@ -198,72 +503,80 @@ class DialogData(object):
         """Loads up data from an iterator over tuples described in the class
         docs.
         """
-        episode = []
-        last_cands = None
-        for entry, new in data_loader:
-            if new and len(episode) > 0:
-                self.data.append(tuple(episode))
-                episode = []
-                last_cands = None
-
-            # intern all strings so we don't store them more than once
-            new_entry = []
-            if len(entry) > 0:
-                # process text if available
-                if entry[0] is not None:
-                    new_entry.append(sys.intern(entry[0]))
-                else:
-                    new_entry.append(None)
-                if len(entry) > 1:
-                    # process labels if available
-                    if entry[1] is not None:
-                        new_entry.append(tuple(sys.intern(e) for e in entry[1]))
-                    else:
-                        new_entry.append(None)
-                    if len(entry) > 2:
-                        # process reward if available
-                        if entry[2] is not None:
-                            new_entry.append(sys.intern(entry[2]))
-                        else:
-                            new_entry.append(None)
-                        if len(entry) > 3:
-                            if entry[3] is not None:
-                                # process label candidates if available
-                                if last_cands and entry[3] is last_cands:
-                                    # if cands are shared, say "same" so we
-                                    # don't store them again
-                                    new_entry.append(
-                                        sys.intern('same as last time'))
-                                else:
-                                    last_cands = entry[3]
-                                    new_entry.append(tuple(
-                                        sys.intern(e) for e in entry[3]))
-                            else:
-                                new_entry.append(None)
-                            if len(entry) > 4 and entry[4] is not None:
-                                new_entry.append(sys.intern(entry[4]))
-
-            episode.append(tuple(new_entry))
-
-        if len(episode) > 0:
-            self.data.append(tuple(episode))
+        context_ids = {}
+        self.data.extend(load_episodes(data_loader, context_ids))
+        self.contexts = list(context_ids)
 
     def num_episodes(self):
         """Return number of episodes in the dataset."""
         return len(self.data)
 
+    def _get_entry(self, episode_idx, entry_idx):
+        """Returns the stored entry tuple and the length of its episode."""
+        episode = self.data[episode_idx]
+        return episode[entry_idx], len(episode)
+
+    def image_paths(self, episode_idx):
+        """Returns the image paths of the entries of an episode."""
+        paths = []
+        entry_idx = 0
+        while True:
+            entry, episode_len = self._get_entry(episode_idx, entry_idx)
+            if len(entry) > 4 and entry[4] is not None:
+                paths.append(entry[4])
+            entry_idx += 1
+            if entry_idx == episode_len:
+                return paths
+
+    def episode_starts(self):
+        """Returns an array with the index of the first entry of every episode
+        when all entries are numbered in order, and the number of entries.
+        """
+        if not hasattr(self, '_episode_starts'):
+            starts = np.zeros(len(self.data) + 1, dtype=np.int64)
+            np.cumsum([len(episode) for episode in self.data], out=starts[1:])
+            self._episode_starts = starts
+        return self._episode_starts
+
     def get(self, episode_idx, entry_idx=0):
         """Returns a specific entry from the dataset."""
         # first look up data
-        episode = self.data[episode_idx]
-        entry = episode[entry_idx]
-        episode_done = entry_idx == len(episode) - 1
-        end_of_data = episode_done and episode_idx == len(self.data) - 1
+        entry, episode_len = self._get_entry(episode_idx, entry_idx)
+        episode_done = entry_idx == episode_len - 1
+        end_of_data = episode_done and episode_idx == self.num_episodes() - 1
 
-        # now pack it in a action-observation dictionary
+        table = self._build_table(entry)
+        if self.text_vecs is not None:
+            idx = self.episode_starts()[episode_idx] + entry_idx
+            text_vec, labels_vec = self.text_vecs.get(idx)
+            if text_vec is not None:
+                table['text_vec'] = text_vec
+            if labels_vec is not None:
+                table['labels_vec'] = labels_vec
+
+        # last entry in this episode
+        table['episode_done'] = episode_done
+        return table, end_of_data
+
+    def _context(self, context_id):
+        """Returns the shared context with id ``context_id``."""
+        return self.contexts[context_id]
+
+    def _text(self, entry):
+        """Returns the text of a stored entry tuple."""
+        text = entry[0]
+        if type(text) is tuple:
+            # (context id, query), see load_episodes
+            return self._context(text[0]) + '\n' + text[1]
+        return text
+
+    def _build_table(self, entry):
+        """Packs a stored entry tuple in an action-observation dictionary."""
         table = {}
         if entry[0] is not None:
-            table['text'] = entry[0]
+            table['text'] = self._text(entry)
+            if type(entry[0]) is tuple:
+                table['context_id'] = entry[0][0]
         if len(entry) > 1:
             if entry[1] is not None:
                 table['labels'] = entry[1]
@@ -280,22 +593,473 @@ class DialogData(object):
 
         if (table.get('labels', None) is not None
                 and self.cands is not None):
-            if self.addedCands:
-                # remove elements in addedCands
-                self.cands.difference_update(self.addedCands)
-                self.addedCands.clear()
-            for label in table['labels']:
-                if label not in self.cands:
-                    # add labels, queue them for removal next time
-                    self.cands.add(label)
-                    self.addedCands.append(label)
-            table['label_candidates'] = self.cands
+            # the pool plus any labels which aren't in it
+            table['label_candidates'] = self.cands.view(table['labels'])
 
         if 'labels' in table and 'label_candidates' in table:
             if table['labels'][0] not in table['label_candidates']:
                 raise RuntimeError('true label missing from candidate labels')
+        return table
 
-        # last entry in this episode
-        table['episode_done'] = episode_done
-        return table, end_of_data
 
+def load_episodes(data_loader, context_ids=None):
+    """Groups the entries from the ``setup_data`` iterator ``data_loader`` into
+    episodes, and yields each of them as a tuple of entry tuples in the format
+    stored by ``DialogData``.
+
+    Texts given as ``(context, query)`` are stored as ``(context id, query)``,
+    with the ids of the contexts assigned in the dict ``context_ids``. If it is
+    ``None``, the context and the query are joined into one text instead.
+    """
+    episode = []
+    last_cands = None
+    for entry, new in data_loader:
+        if new and len(episode) > 0:
+            yield tuple(episode)
+            episode = []
+            last_cands = None
+
+        # intern all strings so we don't store them more than once
+        new_entry = []
+        if len(entry) > 0:
+            # process text if available
+            if type(entry[0]) is tuple:
+                context, query = entry[0]
+                if context_ids is None:
+                    new_entry.append(context + '\n' + query)
+                else:
+                    context_id = context_ids.setdefault(
+                        context, len(context_ids))
+                    new_entry.append((context_id, sys.intern(query)))
+            elif entry[0] is not None:
+                new_entry.append(sys.intern(entry[0]))
+            else:
+                new_entry.append(None)
+            if len(entry) > 1:
+                # process labels if available
+                if entry[1] is not None:
+                    new_entry.append(tuple(sys.intern(e) for e in entry[1]))
+                else:
+                    new_entry.append(None)
+                if len(entry) > 2:
+                    # process reward if available
+                    if entry[2] is not None:
+                        new_entry.append(sys.intern(entry[2]))
+                    else:
+                        new_entry.append(None)
+                    if len(entry) > 3:
+                        if entry[3] is not None:
+                            # process label candidates if available
+                            if last_cands and entry[3] is last_cands:
+                                # if cands are shared, say "same" so we
+                                # don't store them again
+                                new_entry.append(
+                                    sys.intern('same as last time'))
+                            else:
+                                last_cands = entry[3]
+                                new_entry.append(tuple(
+                                    sys.intern(e) for e in entry[3]))
+                        else:
+                            new_entry.append(None)
+                        if len(entry) > 4 and entry[4] is not None:
+                            new_entry.append(sys.intern(entry[4]))
+
+        episode.append(tuple(new_entry))
+
+    if len(episode) > 0:
+        yield tuple(episode)
+
+
+def dict_fingerprint(opt):
+    """Returns a hash of the dictionary file and the options which change how
+    the dictionary turns text into vectors.
+    """
+    fingerprint = hashlib.sha1()
+    with open(opt['dict_file'], 'rb') as read:
+        for block in iter(lambda: read.read(1 << 20), b''):
+            fingerprint.update(block)
+    for key in ('dict_class', 'dict_language', 'dict_max_ngram_size',
+                'dict_nulltoken', 'dict_eostoken', 'dict_unktoken',
+                'dict_tokenizer'):
+        fingerprint.update(repr(opt.get(key)).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def encode_text_vecs(data, dictionary, fingerprint):
+    """Converts the text and labels of every entry of ``data`` to token ids
+    with ``dictionary.txt2vec()``, and returns them as flat arrays (see
+    ``TextVecs``).
+    """
+    vecs = array('i')
+    spans = array('q')  # start and length of every vector, length -1 if None
+    text_span = array('q')  # index of the span of every entry's text
+    label_first = array('q')  # index of the span of every entry's 1st label
+    label_count = array('q')  # number of labels of every entry, -1 if None
+
+    def add_vec(text):
+        spans.append(len(vecs))
+        if text is None:
+            spans.append(-1)
+        else:
+            vec = dictionary.txt2vec(text)
+            vecs.extend(vec)
+            spans.append(len(vec))
+        return len(spans) // 2 - 1
+
+    for episode_idx in range(data.num_episodes()):
+        entry_idx = 0
+        while True:
+            entry, episode_len = data._get_entry(episode_idx, entry_idx)
+            text_span.append(add_vec(data._text(entry)))
+            labels = entry[1] if len(entry) > 1 else None
+            label_first.append(len(spans) // 2)
+            if labels is None:
+                label_count.append(-1)
+            else:
+                label_count.append(len(labels))
+                for label in labels:
+                    add_vec(label)
+            entry_idx += 1
+            if entry_idx == episode_len:
+                break
+    spans = np.array(spans, dtype=np.int64).reshape(-1, 2)
+    return {
+        'fingerprint': np.frombuffer(fingerprint.encode('ascii'),
+                                     dtype=np.uint8),
+        'vecs': np.array(vecs, dtype=np.int32),
+        'spans': spans,
+        'text_span': np.array(text_span, dtype=np.int64),
+        'label_first': np.array(label_first, dtype=np.int64),
+        'label_count': np.array(label_count, dtype=np.int64),
+    }
+
+
+class TextVecs(object):
+    """Token ids of the text and labels of the entries of a ``DialogData``, as
+    int32 arrays which are views into the flat arrays of
+    ``encode_text_vecs()``. Entries are numbered in order over all episodes.
+
+    ``fingerprint`` identifies the dictionary the ids come from (see
+    ``dict_fingerprint()``), so they are only valid for agents using the same
+    dictionary file, unchanged.
+    """
+
+    def __init__(self, arrays):
+        self.fingerprint = arrays['fingerprint'].tobytes().decode('ascii')
+        self.vecs = arrays['vecs']
+        self.spans = arrays['spans']
+        self.text_span = arrays['text_span']
+        self.label_first = arrays['label_first']
+        self.label_count = arrays['label_count']
+
+    def _vec(self, span):
+        start, length = self.spans[span]
+        if length < 0:
+            return None
+        return self.vecs[start:start + length]
+
+    def get(self, idx):
+        """Returns the text vector and the tuple of label vectors of entry
+        ``idx`` (``None`` if the entry has no text or labels).
+        """
+        text_vec = self._vec(self.text_span[idx])
+        count = self.label_count[idx]
+        if count < 0:
+            return text_vec, None
+        first = self.label_first[idx]
+        return text_vec, tuple(self._vec(i) for i in range(first, first + count))
+
+
+def encode_dialog_data(data_loader):
+    """Encodes the output of a ``setup_data`` iterator (see ``DialogData``)
+    into a dict of flat numpy arrays: a pool of unique strings plus offset
+    arrays describing the episodes and the fields of every entry.
+
+    Lists of labels and candidates are stored as ``(start, length)`` spans into
+    the ``label_ids``/``cand_ids`` arrays, with a length of -1 for ``None``.
+    Candidates which are shared with the previous entry reuse the same span.
+    Shared contexts are strings of the pool as well: ``context`` holds the
+    string id of the context of every entry, and ``text`` only the query.
+    """
+    pool = StringPool()
+    episodes = array('q', [0])
+    num_fields = array('b')
+    text, reward, image = array('q'), array('q'), array('q')
+    context = array('q')
+    label_start, label_len, label_ids = array('q'), array('q'), array('q')
+    cand_start, cand_len, cand_ids = array('q'), array('q'), array('q')
+
+    def add_list(values, starts, lens, ids):
+        if values is None:
+            starts.append(0)
+            lens.append(-1)
+        else:
+            starts.append(len(ids))
+            before = len(ids)
+            ids.extend(pool.add(v) for v in values)
+            lens.append(len(ids) - before)
+
+    num_entries = 0
+    last_cands = None
+    for entry, new in data_loader:
+        if new and num_entries > episodes[-1]:
+            episodes.append(num_entries)
+            last_cands = None
+        num_entries += 1
+
+        fields = min(len(entry), 4)
+        if len(entry) > 4 and entry[4] is not None:
+            fields += 1
+        num_fields.append(fields)
+        x = entry[0] if len(entry) > 0 else None
+        if type(x) is tuple:
+            context.append(pool.add(x[0]))
+            x = x[1]
+        else:
+            context.append(-1)
+        text.append(pool.add(x))
+        add_list(entry[1] if len(entry) > 1 else None,
+                 label_start, label_len, label_ids)
+        reward.append(pool.add(entry[2]) if len(entry) > 2 else -1)
+        cands = entry[3] if len(entry) > 3 else None
+        if cands is not None and last_cands is not None and \
+                cands is last_cands:
+            # shared candidates are only stored once
+            cand_start.append(cand_start[-1])
+            cand_len.append(cand_len[-1])
+        else:
+            if cands is not None:
+                last_cands = cands
+            add_list(cands, cand_start, cand_len, cand_ids)
+        image.append(pool.add(entry[4]) if fields > 4 else -1)
+
+    if num_entries > episodes[-1]:
+        episodes.append(num_entries)
+
+    strings, str_offsets = pool.to_arrays()
+    return {
+        'strings': strings,
+        'str_offsets': str_offsets,
+        'episodes': np.array(episodes, dtype=np.int64),
+        'num_fields': np.array(num_fields, dtype=np.int8),
+        'text': np.array(text, dtype=np.int64),
+        'context': np.array(context, dtype=np.int64),
+        'label_start': np.array(label_start, dtype=np.int64),
+        'label_len': np.array(label_len, dtype=np.int64),
+        'label_ids': np.array(label_ids, dtype=np.int64),
+        'reward': np.array(reward, dtype=np.int64),
+        'cand_start': np.array(cand_start, dtype=np.int64),
+        'cand_len': np.array(cand_len, dtype=np.int64),
+        'cand_ids': np.array(cand_ids, dtype=np.int64),
+        'image': np.array(image, dtype=np.int64),
+    }
+
+
+def compile_dialog_data(data_loader, path):
+    """Parses the ``setup_data`` iterator ``data_loader`` once and writes the
+    result to ``path`` in the binary format read by ``CompiledDialogData``.
+    """
+    print('[compiling dialog data to: ' + path + ']')
+    save_arrays(path, encode_dialog_data(data_loader))
+
+
+class CompiledDialogData(DialogData):
+    """Provides the same interface as ``DialogData``, but reads the episodes
+    from flat arrays (see ``encode_dialog_data``) instead of nested tuples.
+
+    The arrays are memory-mapped from a file written by
+    ``compile_dialog_data``, so opening the data is near-instant and entries
+    are only decoded when they are requested with ``get()``. Processes forked
+    for hogwild training share the mapping through the page cache instead of
+    duplicating the data on their heaps.
+    """
+
+    def _load(self, path):
+        """Memory-maps the compiled file at ``path``."""
+        self._set_arrays(load_arrays(path))
+
+    def _set_arrays(self, arrays):
+        self.arrays = arrays
+        self.strings = arrays['strings']
+        self.str_offsets = arrays['str_offsets']
+        self.episodes = arrays['episodes']
+
+    def __len__(self):
+        return int(self.episodes[-1])
+
+    def num_episodes(self):
+        return len(self.episodes) - 1
+
+    def episode_starts(self):
+        return self.episodes
+
+    def _str(self, idx):
+        return decode_string(self.strings, self.str_offsets, idx)
+
+    def _context(self, context_id):
+        return self._str(context_id)
+
+    def _strs(self, ids, start, length):
+        if length < 0:
+            return None
+        return tuple(self._str(i) for i in ids[start:start + length])
+
+    def _get_entry(self, episode_idx, entry_idx):
+        arrays = self.arrays
+        start = self.episodes[episode_idx]
+        episode_len = int(self.episodes[episode_idx + 1] - start)
+        i = start + entry_idx
+        fields = arrays['num_fields'][i]
+        entry = [self._str(arrays['text'][i])]
+        if 'context' in arrays and arrays['context'][i] >= 0:
+            # the context id is the id of the context string
+            entry[0] = (int(arrays['context'][i]), entry[0])
+        if fields > 1:
+            entry.append(self._strs(arrays['label_ids'],
+                                    arrays['label_start'][i],
+                                    arrays['label_len'][i]))
+        if fields > 2:
+            entry.append(self._str(arrays['reward'][i]))
+        if fields > 3:
+            entry.append(self._strs(arrays['cand_ids'],
+                                    arrays['cand_start'][i],
+                                    arrays['cand_len'][i]))
+        if fields > 4:
+            entry.append(self._str(arrays['image'][i]))
+        return entry, episode_len
+
+
+class SharedDialogData(CompiledDialogData):
+    """Provides the same interface as ``DialogData``, but places the episodes
+    in flat ``multiprocessing`` shared-memory arrays (see
+    ``encode_dialog_data``): offsets plus a utf-8 blob, with no Python objects
+    per entry.
+
+    With the nested tuples of ``DialogData``, CPython's reference counting
+    writes to every tuple and string a forked hogwild process reads, so the
+    copy-on-write pages end up duplicated in every process. The shared arrays
+    are never written after loading, so all processes read one physical copy.
+    """
+
+    def _load(self, data_loader):
+        """Encodes the data from ``data_loader`` into shared memory."""
+        arrays = encode_dialog_data(data_loader)
+        self._set_arrays({k: shared_array(v) for k, v in arrays.items()})
+
+
+class StreamDialogData(DialogData):
+    """Provides the entries of ``DialogData`` for the teachers of a
+    ``StreamDialogTeacher``, but reads the episodes from a new ``setup_data``
+    iterator returned by ``data_loader()`` on every pass, keeping only a few
+    in memory.
+
+    The teachers of a ``BatchWorld`` share one stream: reading it puts each
+    episode in the queue of the teacher it belongs to, which takes it with
+    ``next_episode()``. Episode ``k`` of the stream belongs to the teacher
+    whose data offset is ``k % step_size``, so each process only keeps the
+    episodes of its own teachers. If ``shuffle`` is set, the episodes of the
+    process are shuffled in a buffer of ``opt['stream_buffer_size']`` before
+    they are handed out in turns, and the stream is read over and over.
+
+    Each process opens its own iterator the first time it reads the stream.
+    """
+
+    def __init__(self, opt, data_loader, cands=None, shuffle=False):
+        super().__init__(opt, data_loader, cands)
+        self.shuffle = shuffle
+        self.buffer_size = max(1, opt.get('stream_buffer_size', 1000))
+        self.batchsize = opt.get('batchsize', 1)
+        self.num_entries = 0
+        self.num_eps = 0
+        self.epoch = 0
+        self.pid = None
+
+    def _load(self, data_loader):
+        self.data_loader = data_loader
+
+    def __len__(self):
+        """Returns the number of entries in the stream, or 0 if it hasn't been
+        read to the end yet.
+        """
+        return self.num_entries
+
+    def num_episodes(self):
+        return self.num_eps
+
+    def _read(self, first, step):
+        """Yields the episodes of the process whose teachers have the data
+        offsets ``first`` to ``first + batchsize - 1``.
+        """
+        while True:
+            num_entries = 0
+            k = -1
+            for k, episode in enumerate(load_episodes(self.data_loader())):
+                num_entries += len(episode)
+                if first <= k % step < first + self.batchsize:
+                    yield episode
+            self.num_entries = num_entries
+            self.num_eps = k + 1
+            if not self.shuffle or k < 0:
+                return
+
+    def _shuffled(self, episodes):
+        """Yields ``episodes`` in random order, using a bounded buffer."""
+        buffer = []
+        for episode in episodes:
+            if len(buffer) < self.buffer_size:
+                buffer.append(episode)
+                continue
+            i = random.randrange(self.buffer_size)
+            yield buffer[i]
+            buffer[i] = episode
+        random.shuffle(buffer)
+        yield from buffer
+
+    def _open(self, offset, step, epoch):
+        first = offset - offset % self.batchsize
+        self.stream = self._read(first, step)
+        if self.shuffle:
+            self.stream = self._shuffled(self.stream)
+        self.queues = [deque() for _ in range(self.batchsize)]
+        self.next_queue = 0
+        self.epoch = epoch
+        self.pid = os.getpid()
+
+    def _fill(self, offset):
+        """Reads the stream until the queue of the teacher with data offset
+        ``offset`` has an episode, and returns whether it has one.
+        """
+        queue = self.queues[offset % self.batchsize]
+        while not queue:
+            episode = next(self.stream, None)
+            if episode is None:
+                return False
+            self.queues[self.next_queue].append(episode)
+            self.next_queue = (self.next_queue + 1) % self.batchsize
+        return True
+
+    def next_episode(self, offset, step, epoch):
+        """Returns the next episode of the teacher with data offset ``offset``
+        and step size ``step``, or ``None`` at the end of the stream. The
+        stream starts over for the first teacher of a new ``epoch``.
+        """
+        if self.pid != os.getpid() or epoch > self.epoch:
+            self._open(offset, step, epoch)
+        if not self._fill(offset):
+            return None
+        return self.queues[offset % self.batchsize].popleft()
+
+    def has_next(self, offset):
+        """Returns whether the teacher with data offset ``offset`` has another
+        episode.
+        """
+        return self._fill(offset)
+
+    def get(self, episode, entry_idx=0):
+        """Returns the action table of an entry of an ``episode`` returned by
+        ``next_episode()``. Unlike ``DialogData.get()``, it does not say
+        whether the data ends there (see ``has_next()``).
+        """
+        table = self._build_table(episode[entry_idx])
+        table['episode_done'] = entry_idx == len(episode) - 1
+        return table
@@ -6,12 +6,24 @@
 """Contains code for parsing and building a dictionary from text."""
 
 from .agents import Agent
-from collections import defaultdict
+from .mmap_utils import StringPool, is_array_file, load_arrays, save_arrays
+from collections import defaultdict, OrderedDict
+from collections.abc import MutableMapping
+import bisect
 import copy
 import numpy as np
 import nltk
 import os
 import re
+import zlib
+
+
+# single regex used by ``--dict-tokenizer re``, which splits words and
+# punctuation like the Treebank tokenizer for most text: contractions
+# ("do n't", "it 's"), numbers, hyphenated words and ellipses stay together
+RETOK = re.compile(
+    r"(?i)\w+?(?=n't\b)|n't\b|'(?:s|re|ve|ll|d|m)\b|"
+    r"\d+(?:[.,]\d+)+|\w+(?:[-.]\w+)*|\.\.\.|--|[^\w\s]")
 
 
 def escape(s):
@@ -58,6 +70,221 @@ def find_ngrams(token_dict, text, n):
     return saved_tokens
 
 
+def add_ngram(trie, token):
+    """Adds a multi-word token to ``trie``, nested dicts from each word to
+    the words which can follow it, where the key ``None`` marks the end of a
+    token.
+    """
+    node = trie
+    for word in token.split(' '):
+        node = node.setdefault(word, {})
+    node[None] = True
+
+
+def find_ngrams_trie(trie, text, n):
+    """Breaks text into ngrams like ``find_ngrams()``, with the multi-word
+    tokens in ``trie`` (see ``add_ngram()``).
+    All ngrams in the text are found with one walk down the trie from each
+    word, and each level of the search only visits the ngrams of its length,
+    so this takes time linear in ``len(text) * n``.
+    """
+    if n <= 1 or not trie:
+        return text
+    # length -> start positions of the ngrams of that length, in order
+    starts = {}
+    for i, word in enumerate(text):
+        node = trie.get(word)
+        if node is None:
+            continue
+        length = 1
+        for word in text[i + 1:i + n]:
+            node = node.get(word)
+            if node is None:
+                break
+            length += 1
+            if None in node:
+                starts.setdefault(length, []).append(i)
+    if not starts:
+        return text
+    return _segment_ngrams(text, starts, 0, len(text), n)
+
+
+def _segment_ngrams(text, starts, begin, end, n):
+    """Takes the leftmost ngrams of length ``n`` in ``text[begin:end]``, then
+    shorter ones in the gaps between them.
+    """
+    while n > 1 and n not in starts:
+        n -= 1
+    if n <= 1 or end - begin < 2:
+        return text[begin:end]
+    tokens = []
+    gap = begin
+    positions = starts[n]
+    k = bisect.bisect_left(positions, begin)
+    while k < len(positions) and positions[k] + n <= end:
+        i = positions[k]
+        if i >= gap:
+            tokens.extend(_segment_ngrams(text, starts, gap, i, n - 1))
+            tokens.append(' '.join(text[i:i + n]))
+            gap = i + n
+        k += 1
+    tokens.extend(_segment_ngrams(text, starts, gap, end, n - 1))
+    return tokens
+
+
+class MappedVocab(object):
+    """Tokens and counts of a dictionary saved in the binary format (see
+    ``--dict-format``), read from memory-mapped arrays: the tokens by index in
+    ``strings`` and ``str_offsets`` (see ``StringPool``), their ``counts`` and
+    ``table``, an open addressing hash table from the crc32 of each token to
+    its index. Processes loading the same file share one copy of it.
+    """
+
+    def __init__(self, arrays):
+        self.counts = arrays['counts']
+        self.strings = arrays['strings']
+        self.str_offsets = arrays['str_offsets']
+        # memoryviews read single items much faster than numpy indexing
+        self.blob = memoryview(self.strings)
+        self.offsets = memoryview(self.str_offsets)
+        self.table = memoryview(arrays['table'])
+        self.mask = len(arrays['table']) - 1
+
+    def __len__(self):
+        return len(self.counts)
+
+    def index(self, token):
+        """Returns the index of ``token``, or -1 if it isn't in the vocab."""
+        data = token.encode('utf-8')
+        slot = zlib.crc32(data) & self.mask
+        while True:
+            idx = self.table[slot]
+            if idx < 0 or self.blob[self.offsets[idx]:
+                                    self.offsets[idx + 1]] == data:
+                return idx
+            slot = (slot + 1) & self.mask
+
+    def token(self, idx):
+        return str(self.blob[self.offsets[idx]:self.offsets[idx + 1]], 'utf-8')
+
+    def ngrams(self):
+        """Returns the multi-word tokens."""
+        spaces = np.flatnonzero(self.strings == ord(' '))
+        idxs = np.searchsorted(self.str_offsets, spaces, side='right') - 1
+        return [self.token(idx) for idx in np.unique(idxs)]
+
+    @staticmethod
+    def save(path, tokens, counts):
+        """Saves the ``tokens`` with their ``counts``, in index order."""
+        pool = StringPool()
+        # the table size is a power of two, so that slots are masked hashes
+        table = np.full(1 << (2 * len(tokens)).bit_length(), -1,
+                        dtype=np.int32)
+        mask = len(table) - 1
+        for token in tokens:
+            idx = pool.add(token)
+            slot = zlib.crc32(token.encode('utf-8')) & mask
+            while table[slot] >= 0:
+                slot = (slot + 1) & mask
+            table[slot] = idx
+        strings, str_offsets = pool.to_arrays()
+        save_arrays(path, {'strings': strings, 'str_offsets': str_offsets,
+                           'counts': np.array(counts, dtype=np.int64),
+                           'table': table})
+
+
+class _VocabView(MutableMapping):
+    """Mapping read from a ``MappedVocab``. Changes are kept in ``changes``
+    and the keys of the vocab which were removed in ``removed``, so the
+    mapped arrays are never written.
+    Subclasses define ``_base(key)``, the value of ``key`` in the vocab or
+    ``None``, and ``_base_key(idx)``, the key of the token at ``idx``.
+    """
+
+    # value of missing keys, like a defaultdict, unless None
+    default = None
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.changes = {}
+        self.removed = set()
+        self.len = len(vocab)
+
+    def _lookup(self, key):
+        value = self.changes.get(key)
+        if value is None and key not in self.removed:
+            value = self._base(key)
+        return value
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is None:
+            if self.default is None:
+                raise KeyError(key)
+            return self.default
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is None else value
+
+    def __setitem__(self, key, value):
+        if self._lookup(key) is None:
+            self.len += 1
+            self.removed.discard(key)
+        self.changes[key] = value
+
+    def __delitem__(self, key):
+        if self._lookup(key) is None:
+            raise KeyError(key)
+        self.len -= 1
+        self.changes.pop(key, None)
+        if self._base(key) is not None:
+            self.removed.add(key)
+
+    def __iter__(self):
+        for idx in range(len(self.vocab)):
+            key = self._base_key(idx)
+            if key not in self.removed and key not in self.changes:
+                yield key
+        yield from list(self.changes)
+
+    def __len__(self):
+        return self.len
+
+
+class _MappedFreq(_VocabView):
+    default = 0
+
+    def _base(self, key):
+        idx = self.vocab.index(key) if type(key) == str else -1
+        return int(self.vocab.counts[idx]) if idx >= 0 else None
+
+    def _base_key(self, idx):
+        return self.vocab.token(idx)
+
+
+class _MappedTok2Ind(_VocabView):
+    def _base(self, key):
+        idx = self.vocab.index(key) if type(key) == str else -1
+        return idx if idx >= 0 else None
+
+    def _base_key(self, idx):
+        return self.vocab.token(idx)
+
+
+class _MappedInd2Tok(_VocabView):
+    def _base(self, key):
+        if isinstance(key, (int, np.integer)) and 0 <= key < len(self.vocab):
+            return self.vocab.token(key)
+
+    def _base_key(self, idx):
+        return idx
+
+
 class DictionaryAgent(Agent):
     """Builds and/or loads a dictionary.
 
@@ -88,12 +315,21 @@ class DictionaryAgent(Agent):
         dictionary.add_argument(
             '--dict-language', default=DictionaryAgent.default_lang,
             help='sets language for the punkt sentence tokenizer')
+        dictionary.add_argument(
+            '--dict-tokenizer', default='nltk', choices=['nltk', 're'],
+            help='nltk splits sentences with punkt and words with the Treebank '
+                 'tokenizer, re splits words with a single regex, which is '
+                 'several times faster')
+        dictionary.add_argument(
+            '--dict-cache-size', default=10000, type=int,
+            help='number of recently converted texts whose token ids are '
+                 'cached by txt2vec, 0 to disable')
         dictionary.add_argument(
             '--dict-max-ngram-size', type=int,
             default=DictionaryAgent.default_maxngram,
             help='looks for ngrams of up to this size. this is ignored when ' +
                  'building the dictionary. note: this takes approximate ' +
-                 'runtime of len(sentence)^max_ngram_size')
+                 'runtime of len(sentence) * max_ngram_size')
         dictionary.add_argument(
             '--dict-minfreq', default=DictionaryAgent.default_minfreq, type=int,
             help='minimum frequency of words to include them in the dictionary')
@@ -109,6 +345,15 @@ class DictionaryAgent(Agent):
         dictionary.add_argument(
             '--dict-maxexs', default=100000, type=int,
             help='max number of examples to build dict on')
+        dictionary.add_argument(
+            '--dict-format', default='tsv', choices=['tsv', 'binary'],
+            help='format of saved dictionaries. binary dictionaries are '
+                 'memory-mapped when loaded, so they load instantly and '
+                 'processes share them. both formats can be loaded')
+        dictionary.add_argument(
+            '--dict-build-processes', default=1, type=int,
+            help='number of processes which count the tokens of the examples '
+                 'when building the dictionary, each one every n-th example')
         return dictionary
 
     def __init__(self, opt, shared=None):
@@ -118,15 +363,26 @@ class DictionaryAgent(Agent):
         self.eos_token = opt['dict_eostoken']
         self.unk_token = opt['dict_unktoken']
         self.max_ngram_size = opt['dict_max_ngram_size']
+        self.tokenizer = opt.get('dict_tokenizer', 'nltk')
+        # most recently converted texts -> their token ids, see ``_vec()``
+        self.cache_size = opt.get('dict_cache_size', 10000)
+        self.cache = OrderedDict()
+        self.cache_len = 0
+        # (shard, number of shards) when building in processes, see ``act()``
+        self.build_shard = None
+        self.num_acts = 0
 
         if shared:
             self.freq = shared.get('freq', {})
             self.tok2ind = shared.get('tok2ind', {})
             self.ind2tok = shared.get('ind2tok', {})
+            self.ngram_trie = shared.get('ngram_trie', {})
         else:
             self.freq = defaultdict(int)
             self.tok2ind = {}
             self.ind2tok = {}
+            # multi-word tokens, see ``find_ngrams_trie()``
+            self.ngram_trie = {}
 
             if self.null_token:
                 self.tok2ind[self.null_token] = 0
@@ -153,14 +409,16 @@ class DictionaryAgent(Agent):
 
 
         # initialize tokenizers
-        st_path = 'tokenizers/punkt/{0}.pickle'.format(opt['dict_language'])
-        try:
-            self.sent_tok = nltk.data.load(st_path)
-        except LookupError:
-            nltk.download('punkt')
-            self.sent_tok = nltk.data.load(st_path)
+        if self.tokenizer == 'nltk':
+            st_path = 'tokenizers/punkt/{0}.pickle'.format(
+                opt['dict_language'])
+            try:
+                self.sent_tok = nltk.data.load(st_path)
+            except LookupError:
+                nltk.download('punkt')
+                self.sent_tok = nltk.data.load(st_path)
 
-        self.word_tok = nltk.tokenize.treebank.TreebankWordTokenizer()
+            self.word_tok = nltk.tokenize.treebank.TreebankWordTokenizer()
 
         if not shared:
 
@@ -200,7 +458,10 @@ class DictionaryAgent(Agent):
             return self.ind2tok.get(key, self.unk_token)
         elif type(key) == str:
             # return index from token, or unk_token's index, or None
-            return self.tok2ind.get(key, self.tok2ind.get(self.unk_token, None))
+            index = self.tok2ind.get(key)
+            if index is None:
+                index = self.tok2ind.get(self.unk_token, None)
+            return index
 
     def __len__(self):
         return len(self.tok2ind)
@@ -215,6 +476,8 @@ class DictionaryAgent(Agent):
             index = len(self.tok2ind)
             self.tok2ind[key] = index
             self.ind2tok[index] = key
+            if ' ' in key:
+                add_ngram(self.ngram_trie, key)
 
     def freqs(self):
         return self.freq
@@ -222,23 +485,33 @@ class DictionaryAgent(Agent):
     def _sent_tokenize(self, text, building=False):
         """Uses nltk-trained PunktTokenizer for sentence tokenization"""
         text = text.replace('|', ' ' if building else ' __pipe__ ')
+        if '.' not in text and '?' not in text and '!' not in text:
+            # punkt only ends sentences at these characters
+            return [text]
         return self.sent_tok.tokenize(text)
 
     def _word_tokenize(self, text, building=False):
         """Uses nltk Treebank Word Tokenizer for tokenizing words within
-        sentences.
+        sentences, or ``RETOK`` with ``--dict-tokenizer re``.
         """
-        word_tokens = self.word_tok.tokenize(text)
+        if self.tokenizer == 're':
+            word_tokens = RETOK.findall(text)
+        else:
+            word_tokens = self.word_tok.tokenize(text)
 
         if not building and self.max_ngram_size > 1:
             # search for ngrams during parse-time
             # TODO(ahm): support build-time ngrams using word2vec heuristic?
-            word_tokens = find_ngrams(self.tok2ind, word_tokens,
-                                      self.max_ngram_size)
+            word_tokens = find_ngrams_trie(self.ngram_trie, word_tokens,
+                                           self.max_ngram_size)
         return word_tokens
 
     def tokenize(self, text, building=False):
         """Returns a sequence of tokens from the iterable."""
+        if self.tokenizer == 're':
+            # the regex doesn't need sentence boundaries
+            text = text.replace('|', ' ' if building else ' __pipe__ ')
+            return self._word_tokenize(text, building)
         return (token for sent in self._sent_tokenize(text, building)
                 for token in self._word_tokenize(sent, building))
 
@@ -250,6 +523,21 @@ class DictionaryAgent(Agent):
                 index = len(self.tok2ind)
                 self.tok2ind[token] = index
                 self.ind2tok[index] = token
+                if ' ' in token:
+                    add_ngram(self.ngram_trie, token)
+
+    def add_counts(self, counts):
+        """Adds the token counts of another dictionary (e.g. the ``freq`` of
+        a dictionary built over another shard of the data) to this one.
+        """
+        for token, cnt in counts.items():
+            self.freq[token] += cnt
+            if token not in self.tok2ind:
+                index = len(self.tok2ind)
+                self.tok2ind[token] = index
+                self.ind2tok[index] = token
+                if ' ' in token:
+                    add_ngram(self.ngram_trie, token)
 
     def remove_tail(self, min_freq):
         to_remove = []
@@ -264,23 +552,47 @@ class DictionaryAgent(Agent):
             del self.freq[token]
 
     def load(self, filename):
-        """Load pre-existing dictionary in 'token[<TAB>count]' format.
+        """Load pre-existing dictionary in 'token[<TAB>count]' format, or in
+        the binary format (see ``--dict-format``).
         Initialize counts from other dictionary, or 0 if they aren't included.
         """
         print('Dictionary: loading existing dictionary from {}.'.format(
               filename))
-        with open(filename) as read:
-            for line in read:
-                split = line.strip().split('\t')
-                token = unescape(split[0])
-                cnt = int(split[1]) if len(split) > 1 else 0
-                self.freq[token] = cnt
-                if token not in self.tok2ind:
-                    index = len(self.tok2ind)
-                    self.tok2ind[token] = index
-                    self.ind2tok[index] = token
+        if is_array_file(filename):
+            self._load_binary(filename)
+        else:
+            with open(filename) as read:
+                for line in read:
+                    split = line.strip().split('\t')
+                    self._load_token(unescape(split[0]),
+                                     int(split[1]) if len(split) > 1 else 0)
+        self.cache.clear()
         print('[ num words =  %d ]' % len(self))
 
+    def _load_token(self, token, cnt):
+        self.freq[token] = cnt
+        if token not in self.tok2ind:
+            index = len(self.tok2ind)
+            self.tok2ind[token] = index
+            self.ind2tok[index] = token
+            if ' ' in token:
+                add_ngram(self.ngram_trie, token)
+
+    def _load_binary(self, filename):
+        vocab = MappedVocab(load_arrays(filename))
+        if len(self.tok2ind) > len(vocab) or any(
+                vocab.token(i) != tok for i, tok in self.ind2tok.items()):
+            # the tokens already here have other indices, add the new ones
+            for i in range(len(vocab)):
+                self._load_token(vocab.token(i), int(vocab.counts[i]))
+            return
+        # like the tokens of a tsv file, these replace the ones already here
+        self.freq = _MappedFreq(vocab)
+        self.tok2ind = _MappedTok2Ind(vocab)
+        self.ind2tok = _MappedInd2Tok(vocab)
+        for token in vocab.ngrams():
+            add_ngram(self.ngram_trie, token)
+
     def save(self, filename=None, append=False, sort=True):
         """Save dictionary to file.
         Format is 'token<TAB>count' for every token in the dictionary, sorted
@@ -290,12 +602,23 @@ class DictionaryAgent(Agent):
         overwriting.
 
         If ``sort`` (default ``True``), then first sort the dictionary before saving.
+
+        With ``--dict-format binary``, saves the tokens and counts as arrays
+        which ``load()`` memory-maps instead.
         """
         filename = self.opt['model_file'] if filename is None else filename
         print('Dictionary: saving dictionary to {}.'.format(filename))
         if sort:
             self.sort()
 
+        if self.opt.get('dict_format') == 'binary':
+            if append:
+                raise RuntimeError('Binary dictionaries can\'t be appended to.')
+            tokens = [self.ind2tok[i] for i in range(len(self.ind2tok))]
+            MappedVocab.save(filename, tokens,
+                             [self.freq[tok] for tok in tokens])
+            return
+
         with open(filename, 'a' if append else 'w') as write:
             for i in range(len(self.ind2tok)):
                 tok = self.ind2tok[i]
@@ -316,6 +639,7 @@ class DictionaryAgent(Agent):
             new_ind2tok[i] = tok
         self.tok2ind = new_tok2ind
         self.ind2tok = new_ind2tok
+        self.cache.clear()
         return sorted_pairs
 
     def parse(self, txt_or_vec, vec_type=list):
@@ -338,17 +662,84 @@ class DictionaryAgent(Agent):
         ``vec_type`` is the type of the returned vector if the input is a string.
         """
         if vec_type == np.ndarray:
-            res = np.fromiter(
-                (self[token] for token in self.tokenize(str(text))),
-                np.int
-            )
+            res = np.array(self._vec(str(text)), dtype=np.int64)
         elif vec_type == list or vec_type == tuple or vec_type == set:
-            res = vec_type((self[token] for token in self.tokenize(str(text))))
+            res = vec_type(self._vec(str(text)))
         else:
             raise RuntimeError('Type {} not supported by dict'.format(vec_type))
         assert type(res) == vec_type
         return res
 
+    def _vec(self, text):
+        """Returns the tuple of token ids of ``text``, from the cache of the
+        ``dict_cache_size`` most recently converted texts if it is there.
+        """
+        if self.cache_size <= 0:
+            return self._parse_vec(text)
+        if self.cache_len != len(self.tok2ind):
+            # tokens were added (maybe by a copy sharing the dictionary)
+            self.cache.clear()
+            self.cache_len = len(self.tok2ind)
+        vec = self.cache.get(text)
+        if vec is None:
+            vec = self._parse_vec(text)
+            self.cache[text] = vec
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(text)
+        return vec
+
+    def _parse_vec(self, text):
+        return tuple(self[token] for token in self.tokenize(text))
+
+    def batch_txt2vec(self, texts, pad='left', max_len=None, pool=None):
+        """Converts a list of strings (or of vectors which were already
+        converted) to one int64 array of shape ``(len(texts), longest)``.
+        Shorter vectors are padded with the index of the null token, on the
+        ``pad`` side (``'left'`` or ``'right'``).
+
+        If ``max_len`` is set, vectors are truncated to their last (with left
+        padding) or first (with right padding) ``max_len`` tokens.
+
+        The texts are converted by ``pool.map()`` if ``pool`` is set, e.g. a
+        ``multiprocessing.Pool`` (which pickles the dictionary for each task,
+        so it only pays off for long texts).
+
+        Returns the array and the lengths of the vectors in it.
+        """
+        if pad not in ('left', 'right'):
+            raise RuntimeError('Unknown padding side {}.'.format(pad))
+        if pool is not None:
+            strings = [i for i, text in enumerate(texts) if type(text) == str]
+            vecs = list(texts)
+            # the cache isn't used, since it's not thread-safe
+            parsed = pool.map(self._parse_vec, [texts[i] for i in strings])
+            for i, vec in zip(strings, parsed):
+                vecs[i] = vec
+        else:
+            vecs = [self._vec(text) if type(text) == str else text
+                    for text in texts]
+        if max_len is not None:
+            if pad == 'left':
+                vecs = [vec[max(len(vec) - max_len, 0):] for vec in vecs]
+            else:
+                vecs = [vec[:max_len] for vec in vecs]
+
+        lengths = np.array([len(vec) for vec in vecs], dtype=np.int64)
+        width = int(lengths.max()) if len(vecs) else 0
+        null = self.tok2ind.get(self.null_token, 0)
+        res = np.full((len(vecs), width), null, dtype=np.int64)
+        # positions of the tokens, which are filled in row-major order
+        positions = np.arange(width)
+        if pad == 'left':
+            mask = positions >= width - lengths[:, None]
+        else:
+            mask = positions < lengths[:, None]
+        res[mask] = np.fromiter(
+            (idx for vec in vecs for idx in vec), np.int64, int(lengths.sum()))
+        return res, lengths
+
     def vec2txt(self, vector, delimiter=' '):
         """Converts a vector (iterable of ints) into a string, with each token
         separated by the delimiter (default ``' '``).
@@ -358,7 +749,15 @@ class DictionaryAgent(Agent):
     def act(self):
         """Add any words passed in the 'text' field of the observation to this
         dictionary.
+
+        If ``build_shard`` is set to ``(shard, num_shards)``, only every
+        ``num_shards``-th observation is added, starting with the ``shard``-th.
         """
+        if self.build_shard is not None:
+            shard, num_shards = self.build_shard
+            self.num_acts += 1
+            if (self.num_acts - 1) % num_shards != shard:
+                return {'id': 'Dictionary'}
         for source in ([self.observation.get('text')],
                         self.observation.get('labels')):
             if source:
@@ -372,6 +771,7 @@ class DictionaryAgent(Agent):
         shared['freq'] = self.freq
         shared['tok2ind'] = self.tok2ind
         shared['ind2tok'] = self.ind2tok
+        shared['ngram_trie'] = self.ngram_trie
         shared['opt'] = self.opt
         shared['class'] = type(self)
         return shared
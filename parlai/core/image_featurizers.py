@@ -4,51 +4,315 @@
 # of patent rights can be found in the PATENTS file in the same directory.
 
 import parlai.core.build_data as build_data
+from parlai.core.mmap_utils import StringPool, decode_string, load_arrays, \
+	save_arrays
 
 import os
 import copy
+import fcntl
+import json
+import multiprocessing
+import threading
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
 _greyscale = '  .,:;crsA23hHG#98&@'
+_greyscale_codes = np.frombuffer(_greyscale.encode('ascii'), dtype=np.uint8)
 
-class ImageLoader():
-	"""Extract image feature using pretrained CNN network.
+_executor = None
+_executor_pid = None
+
+def _get_executor(num_threads):
+	"""Returns the thread pool of this process for loading images."""
+	global _executor, _executor_pid
+	if _executor is None or _executor_pid != os.getpid():
+		# threads don't survive forking, so every process starts its own pool
+		_executor = ThreadPoolExecutor(num_threads)
+		_executor_pid = os.getpid()
+	return _executor
+
+_featurizers = {}
+_featurizers_pid = None
+
+def _get_featurizer(opt):
+	"""Returns the ``CnnFeaturizer`` of this process for the image options in
+	``opt``, so that all image loaders share one copy of each CNN.
+	"""
+	global _featurizers, _featurizers_pid
+	if _featurizers_pid != os.getpid():
+		# the locks may have been held by other threads when forking
+		_featurizers = {}
+		_featurizers_pid = os.getpid()
+	key = (opt.get('image_mode'), opt.get('image_size', 256),
+	       opt.get('image_cropsize', 224), opt.get('no_cuda', False),
+	       opt.get('gpu', 0))
+	if key not in _featurizers:
+		_featurizers[key] = CnnFeaturizer(opt)
+	return _featurizers[key]
+
+def _scale_crop(image, size, crop_size):
+	"""Resizes the shorter side of the PIL ``image`` to ``size`` and crops its
+	center, the same as torchvision's ``Scale`` and ``CenterCrop``.
+	"""
+	w, h = image.size
+	if not ((w <= h and w == size) or (h <= w and h == size)):
+		if w < h:
+			w, h = size, int(size * h / w)
+		else:
+			w, h = int(size * w / h), size
+		image = image.resize((w, h), Image.BILINEAR)
+	x1 = int(round((w - crop_size) / 2.))
+	y1 = int(round((h - crop_size) / 2.))
+	return image.crop((x1, y1, x1 + crop_size, y1 + crop_size))
+
+def _decode_image(args):
+	"""Opens and resizes an image, in a worker process of ``extract_files``."""
+	path, size, crop_size = args
+	return _scale_crop(Image.open(path).convert('RGB'), size, crop_size)
+
+def _decode_pixels(args):
+	"""Opens an image and returns its pixels in the ``raw`` or ``ascii`` image
+	mode, in a worker process of ``pack_files``.
+	"""
+	path, mode = args
+	image = Image.open(path)
+	if mode == 'ascii':
+		image.thumbnail((60, 40), Image.BICUBIC)
+		return np.asarray(image.convert('L'))
+	return np.asarray(image.convert('RGB'))
+
+def _pixels_to_ascii(pixels):
+	"""Renders the 2D uint8 array of luminances ``pixels`` with the
+	characters of ``_greyscale``, one line per row.
+	"""
+	lum = 255 - pixels.astype(np.int32)
+	lines = np.empty((lum.shape[0], lum.shape[1] + 1), dtype=np.uint8)
+	lines[:, :-1] = _greyscale_codes[lum * len(_greyscale) // 256]
+	lines[:, -1] = ord('\n')
+	return lines.tobytes().decode('ascii')
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def _get_store(dpath, dtype):
+	"""Returns the ``FeatureStore`` in ``dpath``, which is opened once per
+	process (and inherited by forked processes).
+	"""
+	with _stores_lock:
+		if dpath not in _stores:
+			_stores[dpath] = FeatureStore(dpath, dtype)
+		return _stores[dpath]
+
+def _get_pixel_store(path):
+	"""Returns the ``PixelStore`` in the file at ``path``, which is opened
+	once per process, or ``None`` if no images were packed there.
+	"""
+	with _stores_lock:
+		if path not in _stores:
+			if not os.path.isfile(path):
+				return None
+			_stores[path] = PixelStore(path)
+		return _stores[path]
+
+class PixelStore():
+	"""Decoded pixels of the images of one image directory, packed once by
+	``ImageLoader.pack_files()`` into one memory-mapped file, so that the
+	``raw`` and ``ascii`` image modes don't open (and resize) an image file
+	at every load.
+
+	The pixels of every image are stored as a flat uint8 array, with its
+	shape: the RGB pixels of the whole image in ``raw`` mode, and the
+	luminance of its 60x40 thumbnail in ``ascii`` mode.
 	"""
+
+	def __init__(self, path):
+		arrays = load_arrays(path)
+		self.pixels = arrays['pixels']
+		self.offsets = arrays['offsets']
+		self.shapes = arrays['shapes']
+		self.names = [decode_string(arrays['names'], arrays['name_offsets'], i)
+		              for i in range(len(self.shapes))]
+		self.rows = {name: row for row, name in enumerate(self.names)}
+
+	def __len__(self):
+		return len(self.names)
+
+	def get(self, path):
+		"""Returns the pixels of the image at ``path`` as a read-only view of
+		the mapping, or ``None`` if it wasn't packed.
+		"""
+		row = self.rows.get(os.path.basename(path))
+		if row is None:
+			return None
+		start, end = self.offsets[row], self.offsets[row + 1]
+		return self.pixels[start:end].reshape(self.shapes[row])
+
 	@staticmethod
-	def add_cmdline_args(argparser):
-		argparser.add_arg('--image-size', type=int, default=256,
-			help='')
-		argparser.add_arg('--image-cropsize', type=int, default=224,
-			help='')
+	def save(path, names, images):
+		"""Packs the uint8 arrays ``images`` of the image files ``names`` into
+		the file at ``path``.
+		"""
+		pool = StringPool()
+		for name in names:
+			pool.add(name)
+		strings, name_offsets = pool.to_arrays()
+		shapes = np.ones((len(images), 3), dtype=np.int64)
+		offsets = np.zeros(len(images) + 1, dtype=np.int64)
+		for i, image in enumerate(images):
+			shapes[i, :image.ndim] = image.shape
+			offsets[i + 1] = offsets[i] + image.size
+		pixels = np.empty(offsets[-1], dtype=np.uint8)
+		for i, image in enumerate(images):
+			pixels[offsets[i]:offsets[i + 1]] = image.ravel()
+		save_arrays(path, {'pixels': pixels, 'offsets': offsets,
+		                   'shapes': shapes, 'names': strings,
+		                   'name_offsets': name_offsets})
 
-	def __init__(self, opt):
-		self.opt = copy.deepcopy(opt)
-		self.netCNN = None
+class FeatureStore():
+	"""Stores the image features of one image directory and image mode as the
+	rows of one memory-mapped array, instead of one ``.npy`` file per image.
+
+	``features.bin`` holds the rows, ``features.index`` the file names of the
+	images in row order, and ``features.json`` the dtype and shape of the rows.
+	The dtype is ``dtype`` if the store is new, which can be ``float16`` to
+	halve its size.
+
+	Rows are appended as features are extracted, by any process: appends are
+	serialized with a lock on the index file, and the other processes read the
+	new part of the index when they look for an image they don't know yet.
+	``get()`` returns read-only views of the mapping, which is shared by all
+	processes through the page cache.
+	"""
+
+	def __init__(self, dpath, dtype='float32'):
+		self.dpath = dpath
+		self.bin_path = os.path.join(dpath, 'features.bin')
+		self.index_path = os.path.join(dpath, 'features.index')
+		self.meta_path = os.path.join(dpath, 'features.json')
+		self.dtype = np.dtype(dtype)
+		self.shape = None
+		self.rows = {}  # file name -> row
+		self.index_offset = 0  # number of bytes of the index read so far
+		self.data = None
+		self.lock = threading.Lock()
+		if os.path.isfile(self.meta_path):
+			self._read_meta()
+		with self.lock:
+			self._read_index()
+
+	def __len__(self):
+		return len(self.rows)
+
+	def _read_meta(self):
+		with open(self.meta_path) as read:
+			meta = json.load(read)
+		self.dtype = np.dtype(meta['dtype'])
+		self.shape = tuple(meta['shape'])
+		self.row_bytes = self.dtype.itemsize * int(np.prod(self.shape))
+
+	def _read_index(self):
+		"""Reads the rows added to the index since it was last read."""
+		if not os.path.isfile(self.index_path):
+			return
+		with open(self.index_path, 'rb') as read:
+			read.seek(self.index_offset)
+			added = read.read()
+		# ignore a line which is being written
+		end = added.rfind(b'\n') + 1
+		for name in added[:end].decode('utf-8').split('\n')[:-1]:
+			self.rows[name] = len(self.rows)
+		self.index_offset += end
+
+	def _row(self, row):
+		if self.data is None or row >= len(self.data):
+			# map the rows added since the last mapping
+			if self.shape is None:
+				self._read_meta()
+			self.data = np.memmap(self.bin_path, dtype=self.dtype, mode='r',
+			                      shape=(len(self.rows),) + self.shape)
+		return self.data[row]
+
+	def get(self, path):
+		"""Returns the feature of the image at ``path``, or ``None``."""
+		name = os.path.basename(path)
+		with self.lock:
+			if name not in self.rows:
+				# it may have been added by another process
+				self._read_index()
+				if name not in self.rows:
+					return None
+			return self._row(self.rows[name])
 
-	def init_cnn(self):
-		"""Lazy initialization of preprocessor model in case we don't need any image preprocessing."""
+	def add(self, path, feature):
+		"""Appends the feature of the image at ``path`` and returns its view
+		in the store.
+		"""
+		name = os.path.basename(path)
+		if not os.path.exists(self.dpath):
+			build_data.make_dir(self.dpath)
+		with self.lock, open(self.index_path, 'ab') as index:
+			fcntl.flock(index, fcntl.LOCK_EX)
+			try:
+				self._read_index()
+				if name not in self.rows:
+					self._append(name, np.asarray(feature), index)
+			finally:
+				fcntl.flock(index, fcntl.LOCK_UN)
+			return self._row(self.rows[name])
+
+	def _append(self, name, feature, index):
+		if self.shape is None:
+			if not os.path.isfile(self.meta_path):
+				meta = {'dtype': self.dtype.name, 'shape': feature.shape}
+				with open(self.meta_path + '.tmp', 'w') as write:
+					json.dump(meta, write)
+				os.replace(self.meta_path + '.tmp', self.meta_path)
+			self._read_meta()
+		if feature.shape != self.shape:
+			raise RuntimeError('feature of shape {} does not fit the store with '
+			                   'shape {}'.format(feature.shape, self.shape))
+		row = len(self.rows)
+		mode = 'r+b' if os.path.isfile(self.bin_path) else 'wb'
+		with open(self.bin_path, mode) as write:
+			# rows of an append which didn't reach the index are overwritten
+			write.seek(row * self.row_bytes)
+			write.write(feature.astype(self.dtype).tobytes())
+		line = (name + '\n').encode('utf-8')
+		index.write(line)
+		index.flush()
+		self.rows[name] = row
+		self.index_offset += len(line)
+
+class CnnFeaturizer():
+	"""Pretrained CNN network which extracts the features of images in
+	batches. Use ``_get_featurizer()`` to get the one shared by the process.
+
+	``extract()`` can be called from several threads (e.g. the image prefetch
+	threads of ``ImageLoader``): while one thread runs the CNN, the images of
+	the others are queued, and the next thread to run it takes all of them as
+	one batch of up to ``opt['image_batchsize']`` images.
+	"""
+
+	def __init__(self, opt):
 		try:
 		    import torch
 		except ModuleNotFoundError:
 		    raise ModuleNotFoundError('Need to install pytorch: go to pytorch.org')
-		from torch.autograd import Variable
 		import torchvision
 		import torchvision.transforms as transforms
 		import torch.nn as nn
 
-		opt = self.opt
-		self.image_size = opt['image_size']
-		self.crop_size = opt['image_cropsize']
-		self.datatype = opt['datatype']
+		self.image_size = opt.get('image_size', 256)
+		self.crop_size = opt.get('image_cropsize', 224)
 		self.image_mode = opt['image_mode']
+		self.batchsize = opt.get('image_batchsize', 32)
 
-		opt['cuda'] = not opt['no_cuda'] and torch.cuda.is_available()
-		self.use_cuda = opt['cuda']
-
+		self.use_cuda = not opt.get('no_cuda', False) and torch.cuda.is_available()
 		if self.use_cuda:
 			print('[ Using CUDA ]')
-			torch.cuda.set_device(opt['gpu'])
+			torch.cuda.set_device(opt.get('gpu', 0))
 
 		cnn_type, layer_num = self.image_mode_switcher()
 
@@ -57,32 +321,22 @@ class ImageLoader():
 
 		# cut off the additional layer.
 		self.netCNN = nn.Sequential(*list(CNN(pretrained=True).children())[:layer_num])
+		self.netCNN.eval()
+		if self.use_cuda:
+			self.netCNN.cuda()
 
-		# initialize the transform function using torch vision.
+		# initialize the transform function using torch vision, images are
+		# resized and cropped by _scale_crop first.
 		self.transform = transforms.Compose([
-							transforms.Scale(self.image_size),
-							transforms.CenterCrop(self.crop_size),
 							transforms.ToTensor(),
 							transforms.Normalize(mean=[0.485, 0.456, 0.406],
 									std=[0.229, 0.224, 0.225])
 							])
 
-		# container for single image
-		self.xs = torch.FloatTensor(1, 3, self.crop_size, self.crop_size).fill_(0)
-
-		if self.use_cuda:
-			self.cuda()
-			self.xs = self.xs.cuda()
-
-		# make self.xs variable.
-		self.xs = Variable(self.xs)
-
-	def cuda(self):
-		self.netCNN.cuda()
-
-	def save(self, feature, path):
-		feature = feature.cpu().data.numpy()
-		np.save(path, feature)
+		# pending [image tensor, feature] requests of extract()
+		self.queue = deque()
+		self.queue_lock = threading.Lock()
+		self.cnn_lock = threading.Lock()
 
 	def image_mode_switcher(self):
 		switcher = {
@@ -104,55 +358,327 @@ class ImageLoader():
 
 		return switcher.get(self.image_mode)
 
-	def extract(self, image, path):
-		# check whether initlize CNN network.
-		if not self.netCNN:
-			self.init_cnn()
-
-		self.xs.data.copy_(self.transform(image))
-		# extract the image feature
-		feature = self.netCNN(self.xs)
-		# save the feature
-		self.save(feature, path)
+	def prepare(self, image):
+		"""Returns the input tensor of the CNN for the RGB PIL ``image``."""
+		if image.size != (self.crop_size, self.crop_size):
+			image = _scale_crop(image, self.image_size, self.crop_size)
+		return self.transform(image)
+
+	def extract_batch(self, tensors):
+		"""Runs a list of input tensors through the CNN, and returns the
+		feature of each of them as a numpy array with a batch dimension of 1.
+		"""
+		import torch
+		from torch.autograd import Variable
+		xs = torch.stack(tensors)
+		if self.use_cuda:
+			xs = xs.cuda()
+		features = self.netCNN(Variable(xs, volatile=True))
+		features = features.cpu().data.numpy()
+		return [features[i:i + 1] for i in range(len(tensors))]
+
+	def extract(self, image):
+		"""Returns the feature of the RGB PIL ``image``, batched with the
+		images of concurrent calls.
+		"""
+		request = [self.prepare(image), None]
+		with self.queue_lock:
+			self.queue.append(request)
+		while request[1] is None:
+			with self.cnn_lock:
+				if request[1] is not None:
+					# extracted in the batch of another thread
+					break
+				with self.queue_lock:
+					batch = [self.queue.popleft() for _ in
+					         range(min(self.batchsize, len(self.queue)))]
+				features = self.extract_batch([r[0] for r in batch])
+				for r, feature in zip(batch, features):
+					r[1] = feature
+		return request[1]
+
+class ImageLoader():
+	"""Extract image feature using pretrained CNN network.
+	"""
+	@staticmethod
+	def add_cmdline_args(argparser):
+		argparser.add_arg('--image-size', type=int, default=256,
+			help='')
+		argparser.add_arg('--image-cropsize', type=int, default=224,
+			help='')
+		argparser.add_arg('--image-batchsize', type=int, default=32,
+			help='maximum number of images run through the CNN at once')
+
+	def __init__(self, opt):
+		self.opt = copy.deepcopy(opt)
+		self._prefetched = {}
+		self._prefetched_pid = None
+
+	def save(self, feature, path):
+		np.save(path, feature)
+
+	def feature_dir(self, path):
+		"""Returns the directory of the extracted features of the image at
+		``path``, named after the image mode and next to the image.
+		"""
+		dpath = os.path.join(os.path.dirname(path), self.opt['image_mode'])
+		if not os.path.exists(dpath):
+			build_data.make_dir(dpath)
+		return dpath
+
+	def feature_path(self, path):
+		"""Returns the path of the ``.npy`` file of the extracted feature of
+		the image at ``path``.
+		"""
+		return os.path.join(self.feature_dir(path),
+		                    os.path.basename(path) + '.npy')
+
+	def feature_store(self, path):
+		"""Returns the ``FeatureStore`` of the features of the image at
+		``path`` if ``opt['image_feature_store']`` is set, otherwise ``None``.
+		"""
+		if not self.opt.get('image_feature_store'):
+			return None
+		# the store makes the directory when adding to it
+		dpath = os.path.join(os.path.dirname(path), self.opt['image_mode'])
+		return _get_store(dpath, self.opt.get('image_feature_dtype', 'float32'))
+
+	def has_feature(self, path):
+		"""Returns whether the feature of the image at ``path`` was saved."""
+		store = self.feature_store(path)
+		if store is not None:
+			return store.get(path) is not None
+		return os.path.isfile(self.feature_path(path))
+
+	def save_feature(self, path, feature):
+		"""Saves the feature of the image at ``path``, and returns it (as a
+		view of the feature store if it is used).
+		"""
+		store = self.feature_store(path)
+		if store is not None:
+			return store.add(path, feature)
+		self.save(feature, self.feature_path(path))
 		return feature
 
+	def extract(self, image, path):
+		"""Extracts the feature of the RGB PIL ``image`` of the image file at
+		``path`` with the CNN shared by the process, and saves it.
+		"""
+		feature = _get_featurizer(self.opt).extract(image)
+		return self.save_feature(path, feature)
+
+	def extract_files(self, paths, num_workers=0):
+		"""Extracts and saves the features of all the image files in ``paths``
+		which don't have one yet, running the CNN on batches of
+		``opt['image_batchsize']`` images. ``num_workers`` processes open and
+		resize the images meanwhile. Returns the number of extracted images.
+		"""
+		todo = [p for p in paths if not self.has_feature(p)]
+		if len(todo) == 0:
+			return 0
+		featurizer = _get_featurizer(self.opt)
+		args = ((p, featurizer.image_size, featurizer.crop_size) for p in todo)
+		pool = None
+		if num_workers > 0:
+			pool = multiprocessing.Pool(num_workers)
+			images = pool.imap(_decode_image, args, chunksize=8)
+		else:
+			images = map(_decode_image, args)
+		batch = []
+		for i, image in enumerate(images):
+			batch.append(featurizer.prepare(image))
+			if len(batch) == featurizer.batchsize or i == len(todo) - 1:
+				start = i + 1 - len(batch)
+				features = featurizer.extract_batch(batch)
+				for path, feature in zip(todo[start:], features):
+					self.save_feature(path, feature)
+				batch = []
+		if pool is not None:
+			pool.close()
+			pool.join()
+		return len(todo)
+
+	def pixel_store_path(self, path):
+		"""Returns the path of the file of packed pixels of the directory of
+		the image at ``path``.
+		"""
+		return os.path.join(os.path.dirname(path), self.opt['image_mode'],
+		                    'pixels.mmap')
+
+	def pixel_store(self, path):
+		"""Returns the ``PixelStore`` of the directory of the image at
+		``path`` if ``opt['image_pixel_store']`` is set and it was packed,
+		otherwise ``None``.
+		"""
+		if not self.opt.get('image_pixel_store'):
+			return None
+		return _get_pixel_store(self.pixel_store_path(path))
+
+	def pack_files(self, paths, num_workers=0):
+		"""Packs the pixels of the image files in ``paths`` for the ``raw`` or
+		``ascii`` image mode into the ``PixelStore`` of their directory, along
+		with the images packed there before. ``num_workers`` processes open
+		the images. Returns the number of packed images.
+		"""
+		mode = self.opt['image_mode']
+		if mode not in ('raw', 'ascii'):
+			raise RuntimeError('only the raw and ascii image modes can be '
+			                   'packed, not {}'.format(mode))
+		dirs = {}
+		for path in paths:
+			dirs.setdefault(os.path.dirname(path), {})[
+				os.path.basename(path)] = path
+		pool = None
+		if num_workers > 0:
+			pool = multiprocessing.Pool(num_workers)
+		num = 0
+		for files in dirs.values():
+			store_path = self.pixel_store_path(next(iter(files.values())))
+			names, images = [], []
+			if os.path.isfile(store_path):
+				store = PixelStore(store_path)
+				names = list(store.names)
+				images = [store.get(name) for name in names]
+				todo = [p for n, p in files.items() if n not in store.rows]
+			else:
+				todo = list(files.values())
+			if len(todo) == 0:
+				continue
+			args = ((p, mode) for p in todo)
+			if pool is not None:
+				images.extend(pool.imap(_decode_pixels, args, chunksize=64))
+			else:
+				images.extend(map(_decode_pixels, args))
+			names.extend(os.path.basename(p) for p in todo)
+			build_data.make_dir(os.path.dirname(store_path))
+			PixelStore.save(store_path, names, images)
+			with _stores_lock:
+				_stores.pop(store_path, None)
+			num += len(todo)
+		if pool is not None:
+			pool.close()
+			pool.join()
+		return num
+
 	def img_to_ascii(self, path):
 		im = Image.open(path)
 		im.thumbnail((60, 40), Image.BICUBIC)
-		im = im.convert('L')
-		asc = []
-		for y in range(0, im.size[1]):
-			for x in range(0, im.size[0]):
-				lum = 255 - im.getpixel((x, y))
-				asc.append(_greyscale[lum * len(_greyscale) // 256])
-			asc.append('\n')
-		return ''.join(asc)
+		return _pixels_to_ascii(np.asarray(im.convert('L')))
+
+	def _pending(self):
+		"""Returns the dict of prefetched paths of this process, mapping them
+		to their future and the number of loads they are for.
+		"""
+		if self._prefetched_pid != os.getpid():
+			# futures of another process never finish here
+			self._prefetched = {}
+			self._prefetched_pid = os.getpid()
+		return self._prefetched
+
+	def prefetch(self, path):
+		"""Starts loading the image at ``path`` in a background thread, for a
+		later call of ``load(path)``. The images are loaded by a pool of
+		``opt['image_load_threads']`` threads shared by the process.
+		"""
+		mode = self.opt.get('image_mode', 'raw')
+		if mode is None or mode == 'none':
+			return
+		pending = self._pending()
+		if path in pending:
+			pending[path][1] += 1
+		else:
+			executor = _get_executor(self.opt.get('image_load_threads', 4))
+			pending[path] = [executor.submit(self._load, path), 1]
+
+	def discard(self, path):
+		"""Cancels a ``prefetch(path)`` which won't be followed by a load."""
+		pending = self._pending()
+		if path in pending:
+			pending[path][1] -= 1
+			if pending[path][1] == 0:
+				pending.pop(path)[0].cancel()
 
 	def load(self, path):
+		"""Returns the image at ``path`` in the format of the image mode,
+		waiting for it if it is being prefetched.
+		"""
+		pending = self._pending()
+		if path in pending:
+			future = pending[path][0]
+			pending[path][1] -= 1
+			if pending[path][1] == 0:
+				del pending[path]
+			return future.result()
+		return self._load(path)
+
+	def _load(self, path):
 		opt = self.opt
 		mode = opt.get('image_mode', 'raw')
 		if mode is None or mode == 'none':
 			# don't need to load images
 			return None
-		elif mode == 'raw':
-			# raw just returns RGB values
-			return Image.open(path).convert('RGB')
-		elif mode == 'ascii':
+		elif mode == 'raw' or mode == 'ascii':
+			store = self.pixel_store(path)
+			pixels = store.get(path) if store is not None else None
+			if mode == 'raw':
+				# raw just returns RGB values
+				if pixels is not None:
+					return Image.fromarray(pixels)
+				return Image.open(path).convert('RGB')
 			# convert images to ascii ¯\_(ツ)_/¯
+			if pixels is not None:
+				return _pixels_to_ascii(pixels[:, :, 0])
 			return self.img_to_ascii(path)
 		else:
 			# otherwise, looks for preprocessed version under 'mode' directory
-			prepath, imagefn = os.path.split(path)
+			store = self.feature_store(path)
+			if store is not None:
+				feature = store.get(path)
+				if feature is not None:
+					return feature
+				new_path = self.feature_path(path)
+				if os.path.isfile(new_path):
+					# extracted before the store was used
+					return store.add(path, np.load(new_path))
+				return self.extract(Image.open(path).convert('RGB'), path)
 
-			dpath = os.path.join(prepath, mode)
-
-			if not os.path.exists(dpath):
-				build_data.make_dir(dpath)
-
-			imagefn = imagefn + '.npy'
-			new_path = os.path.join(prepath, mode, imagefn)
+			new_path = self.feature_path(path)
 
 			if not os.path.isfile(new_path):
-				return self.extract(Image.open(path).convert('RGB'), new_path)
+				return self.extract(Image.open(path).convert('RGB'), path)
 			else:
 				return np.load(new_path)
+
+
+class ImagePrefetcher():
+	"""Draws the indices of the examples a teacher sends ahead of time, and
+	prefetches their images with the ``ImageLoader`` ``loader``, so that up to
+	``size`` of them are loaded in the background while the model runs.
+
+	``next_index()`` draws the index of the next example, the same way the
+	teacher would without prefetching, and ``image_paths(index)`` returns the
+	paths of the images of that example.
+	"""
+
+	def __init__(self, loader, size, next_index, image_paths):
+		self.loader = loader
+		self.size = size
+		self.next_index = next_index
+		self.image_paths = image_paths
+		self.upcoming = deque()
+
+	def pop(self):
+		"""Returns the index of the next example."""
+		while len(self.upcoming) <= self.size:
+			index = self.next_index()
+			for path in self.image_paths(index):
+				self.loader.prefetch(path)
+			self.upcoming.append(index)
+		return self.upcoming.popleft()
+
+	def clear(self):
+		"""Forgets the drawn indices, e.g. when the teacher is reset."""
+		for index in self.upcoming:
+			for path in self.image_paths(index):
+				self.loader.discard(path)
+		self.upcoming.clear()
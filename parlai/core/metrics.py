@@ -8,12 +8,18 @@ Uses locking and shared memory when ``numthreads`` is set to >1 to share metrics
 between processes.
 """
 
-from parlai.core.thread_utils import SharedTable
+from parlai.core.thread_utils import SharedTable, shared_array
 from parlai.core.utils import round_sigfigs
 from collections import Counter
+from itertools import islice
+from multiprocessing import Lock
 
+import math
+import numpy as np
 import re
 import string
+import threading
+import time
 
 
 def _normalize_answer(s):
@@ -77,6 +83,9 @@ class Metrics(object):
             self.metrics['hits@' + str(k)] = 0
         if opt.get('numthreads', 1) > 1:
             self.metrics = SharedTable(self.metrics)
+        else:
+            # agents may update the metrics from several threads
+            self.lock = threading.Lock()
         self.datatype = opt.get('datatype', 'train')
 
     def __enter__(self):
@@ -96,8 +105,8 @@ class Metrics(object):
             # use the shared_table's lock
             return self.metrics.get_lock()
         else:
-            # otherwise do nothing
-            return self
+            # otherwise use a thread lock
+            return self.lock
 
     def update_ranking_metrics(self, observation, labels):
         text_cands = observation.get('text_candidates', None)
@@ -113,7 +122,9 @@ class Metrics(object):
         label_set = set(labels) if type(labels) != set else labels
         cnts = {k: 0 for k in self.eval_pr}
         cnt = 0
-        for c in text_cands:
+        # candidates ranked after the largest k can't change any hits@k, so
+        # don't go through all of a large candidate set
+        for c in islice(text_cands, max(self.eval_pr)):
             cnt += 1
             if c in label_set:
                 for k in self.eval_pr:
@@ -177,3 +188,121 @@ class Metrics(object):
             self.metrics['f1'] = 0.0
             for k in self.eval_pr:
                 self.metrics['hits@' + str(k)] = 0
+
+
+class Timings(object):
+    """Keeps running histograms of the wall time spent in a set of named
+    operations (e.g. ``'teacher.act'``), plus counts of parleys and examples
+    to compute throughput.
+
+    Times are counted in log-spaced buckets, ``per_decade`` buckets for every
+    factor of ten from 100ns to 100s, so percentiles are accurate to about 6%
+    and memory does not grow with the number of calls.
+
+    If ``shared`` is set, the histograms are kept in shared memory so that
+    processes forked afterwards (e.g. by ``HogwildWorld``) add to the same
+    counts. In that case every key has to be passed to the constructor.
+    """
+
+    min_exp = -7
+    max_exp = 2
+    per_decade = 20
+    percentiles = (50, 95, 99)
+
+    def __init__(self, keys=(), shared=False):
+        self.keys = []
+        self.idx = {}
+        self.shared = False
+        self.num_buckets = (self.max_exp - self.min_exp) * self.per_decade + 2
+        self.counts = np.zeros((0, self.num_buckets), dtype=np.int64)
+        self.totals = np.zeros(0)
+        for k in keys:
+            self.add_key(k)
+        # number of parleys and number of examples
+        self.throughput = np.zeros(2, dtype=np.int64)
+        if shared:
+            self.shared = True
+            self.counts = shared_array(self.counts)
+            self.totals = shared_array(self.totals)
+            self.throughput = shared_array(self.throughput)
+            self.lock = Lock()
+        else:
+            self.lock = threading.Lock()
+        self._set_views()
+        self.start_time = time.time()
+
+    def _set_views(self):
+        # indexing memoryviews is much faster than indexing numpy arrays
+        self._counts = self.counts.reshape(-1).data
+        self._totals = self.totals.data
+        self._throughput = self.throughput.data
+
+    def add_key(self, key):
+        """Adds a histogram for ``key`` if it doesn't exist yet."""
+        if key in self.idx:
+            return
+        if self.shared:
+            raise RuntimeError('Cannot add keys to shared Timings.')
+        self.idx[key] = len(self.keys)
+        self.keys.append(key)
+        self.counts = np.vstack(
+            [self.counts, np.zeros(self.num_buckets, dtype=np.int64)])
+        self.totals = np.append(self.totals, 0.0)
+        if hasattr(self, 'throughput'):
+            self._set_views()
+
+    def _bucket(self, secs):
+        if secs <= 0:
+            return 0
+        b = math.floor((math.log10(secs) - self.min_exp) * self.per_decade)
+        return min(max(b + 1, 0), self.num_buckets - 1)
+
+    def add(self, key, secs):
+        """Records that operation ``key`` took ``secs`` seconds."""
+        i = self.idx.get(key)
+        if i is None:
+            return
+        b = i * self.num_buckets + self._bucket(secs)
+        with self.lock:
+            self._counts[b] += 1
+            self._totals[i] += secs
+
+    def parley(self, num_exs=1):
+        """Records that a parley over ``num_exs`` examples was done."""
+        with self.lock:
+            self._throughput[0] += 1
+            self._throughput[1] += num_exs
+
+    def _percentile(self, counts, p):
+        target = p / 100 * counts.sum()
+        b = int(np.searchsorted(np.cumsum(counts), target))
+        # report the geometric middle of the bucket
+        return 10 ** (self.min_exp + (b - 0.5) / self.per_decade)
+
+    def report(self):
+        """Returns the throughput plus count, mean and percentiles of the time
+        in seconds of every operation.
+        """
+        elapsed = time.time() - self.start_time
+        m = {}
+        parleys, exs = self.throughput.tolist()
+        m['parleys_per_sec'] = round_sigfigs(parleys / elapsed, 4)
+        m['exs_per_sec'] = round_sigfigs(exs / elapsed, 4)
+        for key, i in self.idx.items():
+            counts = self.counts[i]
+            cnt = int(counts.sum())
+            if cnt == 0:
+                continue
+            mt = {'count': cnt,
+                  'mean': round_sigfigs(float(self.totals[i]) / cnt, 4)}
+            for p in self.percentiles:
+                mt['p' + str(p)] = round_sigfigs(self._percentile(counts, p), 4)
+            m[key] = mt
+        return m
+
+    def clear(self):
+        with self.lock:
+            self.counts[:] = 0
+            self.totals[:] = 0
+            self.throughput[:] = 0
+        self.start_time = time.time()
@@ -0,0 +1,219 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree. An additional grant
+# of patent rights can be found in the PATENTS file in the same directory.
+"""Provides utilities for storing data as flat numpy arrays in a single binary
+file which can be memory-mapped, so that loading it is near-instant and every
+process reading it shares one physical copy through the page cache.
+"""
+
+from array import array
+import json
+import mmap
+import numpy as np
+import os
+
+_MAGIC = b'PARLAIMM'
+_VERSION = 1
+
+
+def is_stale(path, source=None):
+    """Returns whether the file at ``path`` needs to be (re)built, i.e. it does
+    not exist yet or it is older than the ``source`` file it was built from.
+    """
+    if not os.path.isfile(path):
+        return True
+    if source is not None and os.path.isfile(source):
+        return os.path.getmtime(path) < os.path.getmtime(source)
+    return False
+
+
+def is_array_file(path):
+    """Returns whether ``path`` is a file written by ``save_arrays``."""
+    with open(path, 'rb') as read:
+        return read.read(len(_MAGIC)) == _MAGIC
+
+
+class StringPool(object):
+    """Assigns integer ids to strings, storing every distinct string once as
+    utf-8 bytes in a single blob. Use ``to_arrays()`` to get the blob and the
+    offset array, and ``decode_string()`` to read a string back by id.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.blob = bytearray()
+        self.offsets = array('q', [0])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, s):
+        """Returns the id of ``s``, or -1 if it is ``None``."""
+        if s is None:
+            return -1
+        idx = self.ids.get(s)
+        if idx is None:
+            idx = len(self.ids)
+            self.ids[s] = idx
+            self.blob.extend(s.encode('utf-8'))
+            self.offsets.append(len(self.blob))
+        return idx
+
+    def to_arrays(self):
+        """Returns the ``(strings, offsets)`` numpy arrays for this pool."""
+        return (np.frombuffer(bytes(self.blob), dtype=np.uint8),
+                np.array(self.offsets, dtype=np.int64))
+
+
+def decode_string(strings, offsets, idx):
+    """Returns string ``idx`` from the arrays of a ``StringPool``, or ``None``
+    if ``idx`` is negative.
+    """
+    if idx < 0:
+        return None
+    return strings[offsets[idx]:offsets[idx + 1]].tobytes().decode('utf-8')
+
+
+def save_arrays(path, arrays):
+    """Writes a dict of numpy arrays to a single binary file which can be
+    memory-mapped with ``load_arrays``. The file is written to a temporary
+    path first, so concurrent readers never see a partial file.
+    """
+    header = {}
+    offset = 0
+    for name, arr in arrays.items():
+        header[name] = [arr.dtype.str, list(arr.shape), offset]
+        # keep every array 8-byte aligned
+        offset += (arr.nbytes + 7) // 8 * 8
+    header_bytes = json.dumps({'version': _VERSION,
+                               'arrays': header}).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as write:
+        write.write(_MAGIC)
+        write.write(np.int64(len(header_bytes)).tobytes())
+        write.write(header_bytes)
+        for arr in arrays.values():
+            write.write(np.ascontiguousarray(arr).tobytes())
+            write.write(b'\0' * (-arr.nbytes % 8))
+    os.replace(tmp_path, path)
+
+
+def load_arrays(path):
+    """Memory-maps a file written by ``save_arrays`` and returns a dict of
+    read-only numpy arrays which are views into the mapping (nothing is read
+    into memory until it is accessed).
+    """
+    with open(path, 'rb') as read:
+        if read.read(len(_MAGIC)) != _MAGIC:
+            raise RuntimeError('{} is not a ParlAI array file.'.format(path))
+        header_len = int(np.frombuffer(read.read(8), dtype=np.int64)[0])
+        header = json.loads(read.read(header_len).decode('utf-8'))
+        if header['version'] != _VERSION:
+            raise RuntimeError('{} was written with an unsupported version, '
+                               'please delete it.'.format(path))
+        mm = mmap.mmap(read.fileno(), 0, access=mmap.ACCESS_READ)
+    start = len(_MAGIC) + 8 + header_len
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(
+            mm, dtype=np.dtype(dtype), count=count, offset=start + offset
+        ).reshape(shape)
+    return arrays
+
+
+def encode_columns(records, columns):
+    """Encodes the dicts ``records`` into a dict of flat numpy arrays, with one
+    column per field of ``columns``, which maps the fields to their type:
+    ``int``, ``str``, or ``list`` for a list of strings. Strings are stored
+    once in a ``StringPool``, and lists as offsets into an array of string ids.
+    """
+    pool = StringPool()
+    values = {name: array('q') for name in columns}
+    offsets = {name: array('q', [0]) for name, kind in columns.items()
+               if kind == 'list'}
+    for record in records:
+        for name, kind in columns.items():
+            value = record.get(name)
+            if kind == 'int':
+                values[name].append(value)
+            elif kind == 'str':
+                values[name].append(pool.add(value))
+            else:
+                values[name].extend(pool.add(v) for v in value or ())
+                offsets[name].append(len(values[name]))
+    strings, str_offsets = pool.to_arrays()
+    arrays = {'strings': strings, 'str_offsets': str_offsets}
+    for name, kind in columns.items():
+        arrays[kind + '.' + name] = np.array(values[name], dtype=np.int64)
+        if kind == 'list':
+            arrays['offsets.' + name] = np.array(offsets[name], dtype=np.int64)
+    return arrays
+
+
+class ColumnTable(object):
+    """Provides the records encoded by ``encode_columns`` as a read-only list
+    of dicts. A record is only decoded when it is requested, so the arrays
+    can be memory-mapped (see ``load_json_columns``).
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.strings = arrays['strings']
+        self.str_offsets = arrays['str_offsets']
+        self.columns = []
+        for key in arrays:
+            kind, _, name = key.partition('.')
+            if kind in ('int', 'str', 'list'):
+                self.columns.append((name, kind, arrays[key]))
+        self.len = len(self.columns[0][2]) if self.columns else 0
+        for name, kind, values in self.columns:
+            if kind == 'list':
+                self.len = len(arrays['offsets.' + name]) - 1
+                break
+
+    def __len__(self):
+        return self.len
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.len
+        if not 0 <= idx < self.len:
+            raise IndexError('record index out of range')
+        record = {}
+        for name, kind, values in self.columns:
+            if kind == 'int':
+                record[name] = int(values[idx])
+            elif kind == 'str':
+                record[name] = decode_string(self.strings, self.str_offsets,
+                                             values[idx])
+            else:
+                offsets = self.arrays['offsets.' + name]
+                record[name] = [
+                    decode_string(self.strings, self.str_offsets, i)
+                    for i in values[offsets[idx]:offsets[idx + 1]]]
+        return record
+
+
+def load_json_columns(path, columns, select, compile_path=None):
+    """Returns a ``ColumnTable`` of the records ``select(data)`` of the json
+    file at ``path``, keeping the fields ``columns`` (see ``encode_columns``).
+
+    If ``compile_path`` is set, the columns are written once to that file and
+    memory-mapped on later runs, so the json file isn't parsed again and
+    processes share one copy of the records through the page cache.
+    """
+    if compile_path is not None and not is_stale(compile_path, path):
+        return ColumnTable(load_arrays(compile_path))
+    print('loading: ' + path)
+    with open(path) as data_file:
+        arrays = encode_columns(select(json.load(data_file)), columns)
+    if compile_path is None:
+        return ColumnTable(arrays)
+    print('[compiling columns to: ' + compile_path + ']')
+    save_arrays(compile_path, arrays)
+    return ColumnTable(load_arrays(compile_path))
@@ -8,12 +8,33 @@ using the ParlAI package.
 """
 
 import argparse
+import copy
 import importlib
 import os
 import sys
 from parlai.core.agents import get_agent_module, get_task_module
 from parlai.tasks.tasks import ids_to_tasks
 
+
+class Opt(dict):
+    """The dictionary of options returned by ``ParlaiParser.parse_args()``.
+
+    Worlds and agents keep their own ``copy.deepcopy(opt)``, often once per
+    copy of the world in a batch, so deep copies of an ``Opt`` only copy the
+    values which are mutable instead of going through the generic deepcopy
+    machinery for each of them.
+    """
+
+    _atomic = (type(None), bool, int, float, str)
+
+    def __deepcopy__(self, memo):
+        opt = Opt()
+        memo[id(self)] = opt
+        for k, v in self.items():
+            opt[k] = v if type(v) in self._atomic else copy.deepcopy(v, memo)
+        return opt
+
+
 def str2bool(value):
     v = value.lower()
     if v in ('yes', 'true', 't', '1', 'y'):
@@ -132,12 +153,90 @@ class ParlaiParser(argparse.ArgumentParser):
             '-im', '--image-mode', default='raw', type=str,
             help='image preprocessor to use. default is "raw". set to "none" '
                  'to skip image loading.')
+        parlai.add_argument(
+            '--image-feature-store', default=False, type='bool',
+            help='keep the extracted image features of each image directory '
+                 'in one memory-mapped file instead of one file per image')
+        parlai.add_argument(
+            '--image-feature-dtype', default='float32',
+            choices=['float32', 'float16'],
+            help='dtype of new image feature stores')
+        parlai.add_argument(
+            '--image-pixel-store', default=False, type='bool',
+            help='read the images of the raw and ascii image modes from the '
+                 'pixels packed by examples/extract_image_feature.py')
+        parlai.add_argument(
+            '--image-prefetch', default=0, type=int,
+            help='number of upcoming examples whose images teachers load '
+                 'ahead of time in background threads')
+        parlai.add_argument(
+            '--image-load-threads', default=4, type=int,
+            help='number of threads per process used by --image-prefetch')
         parlai.add_argument(
             '-nt', '--numthreads', default=1, type=int,
             help='number of threads, e.g. for hogwild')
         parlai.add_argument(
             '-bs', '--batchsize', default=1, type=int,
             help='batch size for minibatch training schemes')
+        parlai.add_argument(
+            '--hogwild-chunk', default=1, type=int,
+            help='number of examples hogwild threads claim at once, larger '
+                 'chunks reduce synchronization overhead for fast models')
+        parlai.add_argument(
+            '--prefetch-batches', default=0, type=int,
+            help='number of batches of teacher actions to prepare ahead of '
+                 'time in background processes (batchsize > 1 only)')
+        parlai.add_argument(
+            '--prefetch-workers', default=1, type=int,
+            help='number of background processes used with --prefetch-batches'
+                 ', ordered data and --batch-sort always use one')
+        parlai.add_argument(
+            '--async-conversations', default=0, type=int,
+            help='run this many conversations at once on an asyncio event '
+                 'loop, for agents waiting on remote partners (0 to disable)')
+        parlai.add_argument(
+            '--async-threads', default=0, type=int,
+            help='number of threads running the agents without coroutines '
+                 'with --async-conversations (0 for the default number)')
+        parlai.add_argument(
+            '--cache-text-vecs', default=False, type='bool',
+            help='convert the text and labels of dialog data to token ids with '
+                 'the dictionary in --dict-file once, store them next to the '
+                 'data and send them to agents as text_vec and labels_vec')
+        parlai.add_argument(
+            '--stream-buffer-size', default=1000, type=int,
+            help='number of episodes a StreamDialogTeacher shuffles at a time '
+                 'in training')
+        parlai.add_argument(
+            '--batch-sort', default=False, type='bool',
+            help='make training batches of dialog teachers out of examples of '
+                 'similar length, which need less padding')
+        parlai.add_argument(
+            '--batch-max-tokens', default=0, type=int,
+            help='with --batch-sort, also limit batches to this many words '
+                 '(examples times the longest text), 0 for no limit')
+        parlai.add_argument(
+            '--compile-data', default=False, type='bool',
+            help='parse dialog data (and the json files of tasks like vqa) '
+                 'once into a binary file next to the data, which is '
+                 'memory-mapped instead of parsed on later runs')
+        parlai.add_argument(
+            '--lazy-tasks', default=False, type='bool',
+            help='with several tasks, only load the data of a task when it '
+                 'is first used instead of loading all of them up front')
+        parlai.add_argument(
+            '--max-loaded-tasks', default=0, type=int,
+            help='with --lazy-tasks, drop the least recently used task when '
+                 'more than this many are loaded, 0 for no limit')
+        parlai.add_argument(
+            '--eval-processes', default=1, type=int,
+            help='number of processes evaluating disjoint parts of the '
+                 'valid/test data of dialog teachers, agents are copied '
+                 'with share() as for hogwild')
+        parlai.add_argument(
+            '--time-agents', default=False, type='bool',
+            help='record how long agents take to act and observe, and the '
+                 'parleys and examples per second, in the world\'s report')
         self.add_parlai_data_path(parlai)
         self.add_task_args()
 
@@ -185,7 +284,7 @@ class ParlaiParser(argparse.ArgumentParser):
         We specifically remove items with ``None`` as values in order to support
         the style ``opt.get(key, default)``, which would otherwise return ``None``.
         """
-        self.opt = vars(super().parse_args(args=args))
+        self.opt = Opt(vars(super().parse_args(args=args)))
 
         # custom post-parsing
         self.opt['parlai_home'] = self.parlai_home
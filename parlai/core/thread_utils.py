@@ -13,8 +13,23 @@ except ImportError:
     # python2
     from collections import MutableMapping
 import ctypes
+import numpy as np
 import sys
 
+
+def shared_array(arr):
+    """Copies the numpy array ``arr`` into a new block of shared memory and
+    returns a numpy array backed by it. Processes forked afterwards read the
+    same physical memory instead of getting a copy-on-write copy of the data.
+    """
+    arr = np.ascontiguousarray(arr)
+    buf = RawArray(ctypes.c_char, arr.nbytes)
+    shared = np.frombuffer(buf, dtype=arr.dtype, count=arr.size)
+    shared = shared.reshape(arr.shape)
+    shared[...] = arr
+    return shared
+
+
 class SharedTable(MutableMapping):
     """Provides a simple shared-memory table of integers, floats, or strings.
     Use this class as follows:
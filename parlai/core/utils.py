@@ -4,6 +4,8 @@
 # LICENSE file in the root directory of this source tree. An additional grant
 # of patent rights can be found in the PATENTS file in the same directory.
 
+from collections.abc import Set
+from itertools import chain
 import math
 import sys
 import time
@@ -87,3 +89,86 @@ def round_sigfigs(x, sigfigs=4):
     if x == 0:
         return 0
     return round(x, -math.floor(math.log10(abs(x)) - sigfigs + 1))
+
+
+class CandidatePool(object):
+    """A fixed list of candidate strings (e.g. every entity of a knowledge
+    base), stored once with integer ids. Use ``view()`` to hand the pool to an
+    agent as the ``label_candidates`` of an example.
+
+    ``cache`` can be used by agents to keep data they computed from the
+    candidates (e.g. an index for ranking them), which is shared by every
+    example using the pool.
+    """
+
+    def __init__(self, cands):
+        strings = []
+        self.ids = {}
+        for c in cands:
+            c = sys.intern(c)
+            if c not in self.ids:
+                self.ids[c] = len(strings)
+                strings.append(c)
+        self.strings = tuple(strings)
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __iter__(self):
+        return iter(self.strings)
+
+    def __contains__(self, cand):
+        return cand in self.ids
+
+    def __getitem__(self, idx):
+        return self.strings[idx]
+
+    def view(self, extra=()):
+        """Returns the candidates of the pool plus the ``extra`` ones (e.g.
+        the labels of an example) as a ``CandidateSet``.
+        """
+        return CandidateSet(self, extra)
+
+
+class CandidateSet(Set):
+    """Read-only set of the candidates of a ``CandidatePool`` plus a few extra
+    candidates which aren't in the pool, without copying the pool.
+
+    Candidate ``i`` (see ``__getitem__``) is the ``i``-th string of the pool,
+    followed by the extra candidates, so ranking agents can work with integer
+    ids and the data they cached in ``pool.cache``.
+    """
+
+    def __init__(self, pool, extra=()):
+        self.pool = pool
+        self.extra = []
+        for c in extra:
+            if c not in pool.ids and c not in self.extra:
+                self.extra.append(c)
+
+    @classmethod
+    def _from_iterable(cls, it):
+        # results of set operations are normal sets
+        return set(it)
+
+    def __len__(self):
+        return len(self.pool) + len(self.extra)
+
+    def __iter__(self):
+        return chain(self.pool.strings, self.extra)
+
+    def __contains__(self, cand):
+        return cand in self.pool.ids or cand in self.extra
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('candidate index out of range')
+        if idx < len(self.pool):
+            return self.pool.strings[idx]
+        return self.extra[idx - len(self.pool)]
+
+    def __repr__(self):
+        return 'CandidateSet({} candidates)'.format(len(self))
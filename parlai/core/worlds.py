@@ -25,6 +25,16 @@ with one another.
     ``BatchWorld(World)`` is a container for doing minibatch training over a world by
     collecting batches of N copies of the environment (each with different state).
 
+    ``ShardedWorld(World)`` is a container for evaluating valid or test data in
+    several processes, each going through its own part of the data.
+
+    ``AsyncWorld(World)`` is a container which runs many independent
+    conversations (worlds) concurrently on one asyncio event loop, for agents
+    which spend most of their time waiting on I/O. ``AsyncDialogPartnerWorld``
+    is the version of ``DialogPartnerWorld`` it uses, which supports agents
+    with ``async def act()`` and ``async def observe()`` coroutines (or
+    ``act_async()`` and ``observe_async()`` next to the regular methods).
+
 
 All worlds are initialized with the following parameters:
 
@@ -41,13 +51,21 @@ All worlds are initialized with the following parameters:
         data (possibly in different Processes).
 """
 
+import asyncio
 import copy
 import math
 import importlib
+import queue
 import random
+import time
 
-from multiprocessing import Process, Value, Condition, Semaphore
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process, Value, Array, Condition, Semaphore, Queue
+from parlai.core.agents import Teacher
+from parlai.core.dialog_teacher import DialogTeacher
 from parlai.core.agents import _create_task_agents, create_agents_from_shared
+from parlai.core.agents import LazyTasks
+from parlai.core.metrics import Timings
 from parlai.tasks.tasks import ids_to_tasks
 
 
@@ -108,6 +126,104 @@ def display_messages(msgs):
     return '\n'.join(lines)
 
 
+_TIMED_METHODS = ('act', 'observe', 'batch_act')
+
+
+def _all_agents(world, agents=None):
+    """Returns the distinct agents of ``world`` and of the worlds it contains
+    (e.g. the copies of a ``BatchWorld`` or the tasks of a ``MultiWorld``).
+    """
+    if agents is None:
+        agents = []
+    subworlds = [getattr(world, k, None) for k in ('world', 'inner_world')]
+    worlds = getattr(world, 'worlds', [])
+    if isinstance(worlds, LazyTasks):
+        # tasks which aren't loaded have no agents yet
+        worlds = worlds.loaded()
+    subworlds = [w for w in subworlds + worlds if w is not None]
+    if subworlds:
+        for w in subworlds:
+            _all_agents(w, agents)
+    else:
+        for a in getattr(world, 'agents', None) or []:
+            if not any(a is b for b in agents):
+                agents.append(a)
+    return agents
+
+
+def _all_lazy_tasks(world, found=None):
+    """Returns the ``LazyTasks`` of ``world`` and of the worlds it contains."""
+    if found is None:
+        found = []
+    subworlds = [getattr(world, k, None) for k in ('world', 'inner_world')]
+    worlds = getattr(world, 'worlds', [])
+    if isinstance(worlds, LazyTasks):
+        found.append(worlds)
+        worlds = worlds.loaded()
+    for w in subworlds + list(worlds):
+        if w is not None:
+            _all_lazy_tasks(w, found)
+    return found
+
+
+def _time_world(world, timings):
+    """Times the agents of ``world`` in ``timings`` (see ``time_agent()``),
+    including the agents of lazy tasks when they are loaded later on.
+    """
+    for a in _all_agents(world):
+        time_agent(a, timings)
+    for tasks in _all_lazy_tasks(world):
+        tasks.on_load = lambda item: _time_world(item, timings)
+
+
+def _timing_keys(agents):
+    """Returns the names of the timed methods of ``agents``."""
+    keys = []
+    for a in agents:
+        for method in _TIMED_METHODS:
+            key = a.getID() + '.' + method
+            if hasattr(a, method) and key not in keys:
+                keys.append(key)
+    return keys
+
+
+def _timed(func, timings, key):
+    """Wraps ``func`` (possibly a coroutine function) to record its wall time
+    under ``key``.
+    """
+    if asyncio.iscoroutinefunction(func):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = await func(*args, **kwargs)
+            timings.add(key, time.perf_counter() - start)
+            return result
+    else:
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            timings.add(key, time.perf_counter() - start)
+            return result
+    timed.timings = timings
+    return timed
+
+
+def time_agent(agent, timings):
+    """Records the wall time of every call to the ``act()``, ``observe()`` and
+    ``batch_act()`` methods of ``agent`` in ``timings``, under the keys
+    ``'{agent id}.{method}'``.
+    """
+    for method in _TIMED_METHODS:
+        key = agent.getID() + '.' + method
+        # the coroutine versions used by async worlds count as the method
+        for name in (method, method + '_async'):
+            func = getattr(agent, name, None)
+            if func is None or getattr(func, 'timings', None) is timings:
+                continue
+            if not timings.shared:
+                timings.add_key(key)
+            setattr(agent, name, _timed(func, timings, key))
+
+
 class World(object):
     """Empty parent providing null definitions of API functions for Worlds.
     All children can override these to provide more detailed functionality."""
@@ -213,6 +329,49 @@ class World(object):
         for a in self.agents:
             a.save()
 
+    def enable_timing(self, timings=None):
+        """Starts recording the wall time the agents in this world (and the
+        worlds inside it, including lazy tasks loaded later) spend in
+        ``act()``, ``observe()`` and
+        ``batch_act()``, and the number of parleys and examples per second, in
+        ``self.timings``. ``report()`` then includes ``timings.report()``
+        under the key ``'timing'``.
+
+        ``timings`` can be an existing ``Timings`` to record into, e.g. one in
+        shared memory.
+        """
+        if getattr(self, 'timings', None) is not None:
+            return
+        agents = _all_agents(self)
+        if timings is None:
+            timings = Timings(_timing_keys(agents))
+        _time_world(self, timings)
+        self.timings = timings
+
+        parley = self.parley
+        num_exs = self.parley_size()
+
+        def timed_parley():
+            parley()
+            timings.parley(num_exs)
+        self.parley = timed_parley
+        self._report_timing()
+
+    def _report_timing(self):
+        """Adds ``self.timings`` to the reports of this world."""
+        report = self.report
+
+        def timed_report():
+            r = report()
+            if r is not None:
+                r['timing'] = self.timings.report()
+            return r
+        self.report = timed_report
+
+    def parley_size(self):
+        """Number of examples processed by every call to ``parley()``."""
+        return 1
+
     def synchronize(self):
         """Can be used to synchronize processes."""
         pass
@@ -277,6 +436,54 @@ class DialogPartnerWorld(World):
             a.shutdown()
 
 
+def agent_call(agent, method, executor, *args):
+    """Returns an awaitable for calling ``agent.method(*args)``. Agents can
+    define a coroutine ``{method}_async()`` next to the regular method, which
+    is then used instead. Coroutine methods (``async def``) are called
+    directly on the event loop, while regular methods are run in ``executor``
+    so they don't block the loop.
+    """
+    func = getattr(agent, method + '_async', None)
+    if func is None:
+        func = getattr(agent, method)
+    if asyncio.iscoroutinefunction(func):
+        return func(*args)
+    return asyncio.get_event_loop().run_in_executor(executor, func, *args)
+
+
+class AsyncDialogPartnerWorld(DialogPartnerWorld):
+    """Version of ``DialogPartnerWorld`` whose ``parley_async()`` coroutine
+    awaits the agents, so it can run concurrently with other conversations
+    (see ``AsyncWorld``). Agents can implement ``act()`` and ``observe()`` as
+    coroutines, or add ``act_async()`` and ``observe_async()`` coroutines,
+    e.g. to wait on a remote partner without blocking; regular agents are run
+    in a thread pool.
+    """
+
+    loop = None  # event loop of ``parley()``, created when first needed
+
+    async def parley_async(self, executor=None):
+        """Agent 0 goes first. Alternate between the two agents."""
+        acts = self.acts
+        agents = self.agents
+        acts[0] = await agent_call(agents[0], 'act', executor)
+        await agent_call(agents[1], 'observe', executor, validate(acts[0]))
+        acts[1] = await agent_call(agents[1], 'act', executor)
+        await agent_call(agents[0], 'observe', executor, validate(acts[1]))
+
+    def parley(self):
+        """Runs one ``parley_async()`` to completion."""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.parley_async())
+
+    def shutdown(self):
+        super().shutdown()
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+
+
 class MultiAgentDialogWorld(World):
     """Basic world where each agent gets a turn in a round-robin fashion,
     receiving as input the actions of all other agents since that agent last
@@ -383,20 +590,21 @@ class MultiWorld(World):
 
     def __init__(self, opt, agents=None, shared=None):
         super().__init__(opt)
-        self.worlds = []
-        for index, k in enumerate(opt['task'].split(',')):
-            k = k.strip()
-            if k:
-                print("[creating world: " + k + "]")
-                opt_singletask = copy.deepcopy(opt)
-                opt_singletask['task'] = k
-                if shared:
-                    # Create worlds based on shared data.
-                    s = shared['worlds'][index]
-                    self.worlds.append(s['world_class'](s['opt'], None, s))
-                else:
-                    # Agents are already specified.
-                    self.worlds.append(create_task_world(opt_singletask, agents))
+
+        def create_world(opt_singletask):
+            print("[creating world: " + opt_singletask['task'] + "]")
+            # Agents are already specified.
+            return create_task_world(opt_singletask, agents)
+
+        def create_shared_world(s):
+            # Create worlds based on shared data.
+            print("[creating world: " + s['opt']['task'] + "]")
+            return s['world_class'](s['opt'], None, s)
+
+        # copies take the tasks and their batchindex from the shared opt
+        self.worlds = LazyTasks(shared['opt'] if shared else opt, create_world,
+                                create_shared_world,
+                                shared and shared['worlds'])
         self.world_idx = -1
         self.new_world = True
         self.parleys = -1
@@ -413,8 +621,8 @@ class MultiWorld(World):
         if not hasattr(self, 'len'):
             self.len = 0
             # length is sum of all world lengths
-            for _ind, t in enumerate(self.worlds):
-                self.len += len(t)
+            for i in range(len(self.worlds)):
+                self.len += self.worlds.length(i)
         return self.len
 
     def get_agents(self):
@@ -427,12 +635,12 @@ class MultiWorld(World):
         shared_data = {}
         shared_data['world_class'] = type(self)
         shared_data['opt'] = self.opt
-        shared_data['worlds'] = [w.share() for w in self.worlds]
+        shared_data['worlds'] = self.worlds.share()
         return shared_data
 
     def epoch_done(self):
-        for t in self.worlds:
-            if not t.epoch_done():
+        for i in range(len(self.worlds)):
+            if not self.worlds.epoch_done(i):
                 return False
         return True
 
@@ -450,7 +658,7 @@ class MultiWorld(World):
                 # do at most one full loop looking for unfinished world
                 for _ in range(len(self.worlds)):
                     self.world_idx = (self.world_idx + 1) % len(self.worlds)
-                    if not self.worlds[self.world_idx].epoch_done():
+                    if not self.worlds.epoch_done(self.world_idx):
                         # if this world has examples ready, break
                         break
 
@@ -476,55 +684,117 @@ class MultiWorld(World):
         sum_accuracy = 0
         num_tasks = 0
         total = 0
-        for i in range(len(self.worlds)):
-            mt = self.worlds[i].report()
-            m['tasks'][self.worlds[i].getID()] = mt
+        for world_id, mt in self.worlds.task_reports():
+            m['tasks'][world_id] = mt
             total += mt['total']
             if 'accuracy' in mt:
                 sum_accuracy += mt['accuracy']
                 num_tasks += 1
+        m['total'] = total
         if num_tasks > 0:
             m['accuracy'] = sum_accuracy / num_tasks
-            m['total'] = total
         return m
 
     def reset(self):
-        for w in self.worlds:
-            w.reset()
+        self.worlds.reset()
 
     def reset_metrics(self):
-        for w in self.worlds:
-            w.reset_metrics()
+        self.worlds.reset_metrics()
 
     def save_agents(self):
         # Assumes all worlds have same agents, picks first to save.
-        self.worlds[0].save_agents()
+        worlds = self.worlds.loaded() or [self.worlds[0]]
+        worlds[0].save_agents()
 
 
-def override_opts_in_shared(table, overrides):
-    """Looks recursively for ``opt`` dictionaries within shared dict and overrides
-    any key-value pairs with pairs from the overrides dict.
+def find_opts_in_shared(table, opts=None):
+    """Looks recursively for ``opt`` dictionaries within shared dict and
+    returns a list of them (each one once).
     """
-    if 'opt' in table:
-        # change values if an 'opt' dict is available
-        for k, v in overrides.items():
-            table['opt'][k] = v
+    if opts is None:
+        opts = []
+    if 'opt' in table and not any(o is table['opt'] for o in opts):
+        opts.append(table['opt'])
     for k, v in table.items():
         # look for sub-dictionaries which also might contain an 'opt' dict
         if type(v) == dict and k != 'opt':
-            override_opts_in_shared(v, overrides)
+            find_opts_in_shared(v, opts)
         elif type(v) == list:
             for item in v:
                 if type(item) == dict:
-                    override_opts_in_shared(item, overrides)
+                    find_opts_in_shared(item, opts)
+    return opts
+
+
+def override_opts_in_shared(table, overrides):
+    """Looks recursively for ``opt`` dictionaries within shared dict and overrides
+    any key-value pairs with pairs from the overrides dict.
+    """
+    for opt in find_opts_in_shared(table):
+        # change values if an 'opt' dict is available
+        for k, v in overrides.items():
+            opt[k] = v
     return table
 
 
+# teacher attributes which are copied from the prefetching process back to the
+# main process, so that ``observe()`` and ``epoch_done()`` work as if the
+# teacher had acted in the main process
+_PREFETCH_STATE = ('lastY', 'epochDone', 'episode_done')
+
+
+class PrefetchProcess(Process):
+    """Process child used for prefetching in ``BatchWorld``.
+    Runs ``act()`` for the teacher of every world in the batch ahead of time
+    and puts the batches of actions in a bounded queue.
+    """
+
+    def __init__(self, teachers, batches, term, seed):
+        self.teachers = teachers
+        self.batches = batches
+        self.terminate = term
+        self.seed = seed
+        super().__init__(daemon=True)
+
+    def run(self):
+        """Fills the queue of batches until asked to terminate."""
+        # the teachers are forked copies, so they need their own random state
+        random.seed(self.seed)
+        while not self.terminate.value:
+            batch = []
+            for t in self.teachers:
+                act = t.act()
+                state = {k: getattr(t, k) for k in _PREFETCH_STATE
+                         if hasattr(t, k)}
+                if hasattr(t, 'lastY'):
+                    # the labels are observed in the main process, clear them
+                    # here as observe() would
+                    t.lastY = None
+                batch.append((act, state))
+            while not self.terminate.value:
+                try:
+                    self.batches.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+        # don't wait for unread batches to be flushed when exiting
+        self.batches.cancel_join_thread()
+
+
 class BatchWorld(World):
     """Creates a separate world for each item in the batch, sharing
     the parameters for each.
     The underlying world(s) it is batching can be either ``DialogPartnerWorld``,
     ``MultiAgentWorld``, ``ExecutableWorld`` or ``MultiWorld``.
+
+    If ``opt['prefetch_batches']`` is set, ``opt['prefetch_workers']``
+    processes run the teachers (the first agent of each world) ahead of the
+    training loop, keeping up to that many batches of teacher actions ready in
+    a queue. Each process runs the teachers of its own slots of the batch
+    (ordered data and ``--batch-sort`` use a single process).
+    The teachers in the main process still observe the replies of the other
+    agents, so metrics are kept as usual. Prefetching is not supported for
+    ``MultiWorld``.
     """
 
     def __init__(self, opt, world):
@@ -532,14 +802,82 @@ class BatchWorld(World):
         self.random = opt.get('datatype', None) == 'train'
         self.world = world
         shared = world.share()
+        # the copies share everything but the batchindex in their opt dicts,
+        # so find those once instead of walking through shared for every copy
+        shared_opts = find_opts_in_shared(shared)
         self.worlds = []
         for i in range(opt['batchsize']):
             # make sure that any opt dicts in shared have batchindex set to i
             # this lets all shared agents know which batchindex they have,
             # which is needed for ordered data (esp valid/test sets)
-            override_opts_in_shared(shared, {'batchindex': i})
+            for shared_opt in shared_opts:
+                shared_opt['batchindex'] = i
             self.worlds.append(shared['world_class'](opt, None, shared))
         self.batch_observations = [ None ] * len(self.world.get_agents())
+        self.prefetchers = []
+        self.batches = None
+        if opt.get('prefetch_batches', 0) > 0:
+            if hasattr(world, 'parley_init'):
+                print('[ prefetching is not supported for this world. ]')
+            elif not isinstance(world.get_agents()[0], Teacher):
+                print('[ prefetching needs a teacher as the first agent. ]')
+            else:
+                self.start_prefetching()
+
+    def start_prefetching(self):
+        """Starts the processes which prefetch batches of teacher actions."""
+        num_workers = self.opt.get('prefetch_workers', 1)
+        teachers = [w.get_agents()[0] for w in self.worlds]
+        sorted_batches = any(getattr(t, 'buckets', None) is not None
+                             for t in teachers)
+        if (not self.random or sorted_batches) and num_workers > 1:
+            # ordered data, and batches of similar lengths (which all slots
+            # take from one LengthBuckets), have to be produced by a single
+            # process
+            num_workers = 1
+        num_workers = min(num_workers, len(self.worlds))
+        # every worker acts for its own slots of the batch, so the turns of an
+        # episode all come from the same copy of the teacher
+        self.batches = [Queue(self.opt['prefetch_batches'])
+                        for _ in range(num_workers)]
+        self.prefetch_terminate = Value('b', False)
+        for i in range(num_workers):
+            self.prefetchers.append(PrefetchProcess(
+                teachers[i::num_workers], self.batches[i],
+                self.prefetch_terminate, random.randrange(2 ** 32)))
+        for p in self.prefetchers:
+            p.start()
+
+    def stop_prefetching(self):
+        """Stops the prefetching processes and drops their queued batches."""
+        if not self.prefetchers:
+            return
+        with self.prefetch_terminate.get_lock():
+            self.prefetch_terminate.value = True
+        for p in self.prefetchers:
+            p.join()
+        for batches in self.batches:
+            batches.close()
+        self.prefetchers = []
+        self.batches = None
+
+    def prefetched_act(self):
+        """Takes the next batch of teacher actions from the queue, restoring
+        the state each teacher had after acting in the prefetching process.
+        """
+        # put the slots of the workers' batches back in order
+        parts = [batches.get() for batches in self.batches]
+        num_workers = len(parts)
+        batch = [parts[i % num_workers][i // num_workers]
+                 for i in range(len(self.worlds))]
+        batch_actions = []
+        for w, (act, state) in zip(self.worlds, batch):
+            teacher = w.get_agents()[0]
+            for k, v in state.items():
+                setattr(teacher, k, v)
+            w.get_acts()[0] = act
+            batch_actions.append(act)
+        return batch_actions
 
     def __iter__(self):
         return self
@@ -569,6 +907,9 @@ class BatchWorld(World):
 
     def batch_act(self, index, batch_observation):
         # Given batch observation, do update for agents[index].
+        if index == 0 and self.batches is not None:
+            # Teacher actions were already produced in the background.
+            return self.prefetched_act()
         # Call update on agent
         a = self.world.get_agents()[index]
         if (batch_observation is not None and len(batch_observation) > 0 and
@@ -622,6 +963,9 @@ class BatchWorld(World):
     def __len__(self):
         return math.ceil(sum(len(w) for w in self.worlds) / len(self.worlds))
 
+    def parley_size(self):
+        return len(self.worlds)
+
     def getID(self):
         return self.world.getID()
 
@@ -638,8 +982,12 @@ class BatchWorld(World):
         return self.world.report()
 
     def reset(self):
+        prefetching = self.batches is not None
+        self.stop_prefetching()
         for w in self.worlds:
             w.reset()
+        if prefetching:
+            self.start_prefetching()
 
     def reset_metrics(self):
         self.world.reset_metrics()
@@ -651,46 +999,203 @@ class BatchWorld(World):
 
     def shutdown(self):
         """Shutdown each world."""
+        self.stop_prefetching()
         for w in self.worlds:
             w.shutdown()
         self.world.shutdown()
 
 
+class AsyncWorld(World):
+    """Runs many independent conversations concurrently on one asyncio event
+    loop, so that agents waiting on I/O (e.g. a remote partner over ZMQ or
+    HTTP) don't hold up the other conversations.
+
+    ``worlds`` is either a list of worlds, one per conversation, or a single
+    world which is copied ``opt['async_conversations']`` times through its
+    ``share()`` (as ``BatchWorld`` does, so the copies split ordered data like
+    the rows of a batch). Copies of a ``DialogPartnerWorld``
+    are created as ``AsyncDialogPartnerWorld``.
+
+    Every conversation parleys as soon as its previous parley is finished:
+    ``parley()`` keeps all conversations in flight and returns once at least
+    one of them has finished a parley. Worlds with a ``parley_async()``
+    coroutine are awaited on the loop, other worlds run ``parley()`` in a
+    thread pool of ``opt['async_threads']`` threads.
+    """
+
+    def __init__(self, opt, worlds):
+        self.opt = opt
+        if type(worlds) == list:
+            self.world = worlds[0]
+            self.worlds = worlds
+        else:
+            self.world = worlds
+            shared = worlds.share()
+            world_class = shared['world_class']
+            if world_class == DialogPartnerWorld:
+                world_class = AsyncDialogPartnerWorld
+            self.worlds = []
+            num = opt.get('async_conversations', 1)
+            for i in range(num):
+                # like the rows of a batch, each conversation reads its own
+                # part of ordered data
+                override_opts_in_shared(
+                    shared, {'batchsize': num, 'batchindex': i})
+                self.worlds.append(world_class(opt, None, shared))
+        self.executor = ThreadPoolExecutor(opt.get('async_threads') or None)
+        self.loop = asyncio.new_event_loop()
+        self.running = {}  # parley task of each world which is in flight
+        self.last_world = None  # world which finished a parley most recently
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.epoch_done():
+            raise StopIteration()
+
+    async def _parley(self, world):
+        if hasattr(world, 'parley_async'):
+            await world.parley_async(self.executor)
+        else:
+            await self.loop.run_in_executor(self.executor, world.parley)
+        return world
+
+    def parley(self):
+        """Start a parley in every conversation which is not busy, and wait
+        until at least one of them is finished.
+        """
+        for w in self.worlds:
+            if w not in self.running and not w.epoch_done():
+                self.running[w] = self.loop.create_task(self._parley(w))
+        if not self.running:
+            return
+        done, _ = self.loop.run_until_complete(asyncio.wait(
+            list(self.running.values()),
+            return_when=asyncio.FIRST_COMPLETED))
+        for task in done:
+            # raises any exception from the conversation
+            self.last_world = task.result()
+            del self.running[self.last_world]
+
+    def finish_parleys(self):
+        """Wait for the parleys still in flight."""
+        if self.running:
+            self.loop.run_until_complete(
+                asyncio.gather(*self.running.values()))
+            self.running.clear()
+
+    def display(self):
+        if self.last_world is None:
+            return ''
+        return self.last_world.display()
+
+    def __len__(self):
+        return len(self.world)
+
+    def getID(self):
+        return self.world.getID()
+
+    def episode_done(self):
+        return False
+
+    def epoch_done(self):
+        for world in self.worlds:
+            if not world.epoch_done():
+                return False
+        return True
+
+    def report(self):
+        return self.world.report()
+
+    def reset(self):
+        self.finish_parleys()
+        for w in self.worlds:
+            w.reset()
+
+    def reset_metrics(self):
+        self.world.reset_metrics()
+
+    def save_agents(self):
+        self.world.save_agents()
+
+    def synchronize(self):
+        """Sync barrier: will wait until all parleys are finished."""
+        self.finish_parleys()
+
+    def shutdown(self):
+        """Finish all parleys, then shutdown each world."""
+        self.finish_parleys()
+        for w in self.worlds:
+            if w is not self.world:
+                w.shutdown()
+        self.world.shutdown()
+        self.executor.shutdown()
+        self.loop.close()
+
+
 class HogwildProcess(Process):
     """Process child used for ``HogwildWorld``.
-    Each ``HogwildProcess`` contain its own unique ``World``.
+    Each ``HogwildProcess`` contain its own unique ``World``, created from the
+    ``share()`` of the world in the main process, so the agents in every
+    process share their data and metrics.
     """
 
-    def __init__(self, tid, world, opt, agents, sem, fin, term, cnt):
+    def __init__(self, tid, world, opt, sem, fin, term, cnt, unclaimed,
+                 timings=None):
         self.threadId = tid
-        self.world_type = world
+        self.timings = timings
+        self.world_shared = world.share()
         self.opt = opt
-        self.agent_shares = [a.share() for a in agents]
+        self.chunk_size = opt.get('hogwild_chunk', 1)
         self.queued_items = sem
         self.epochDone = fin
         self.terminate = term
         self.cnt = cnt
+        self.unclaimed = unclaimed
         super().__init__()
 
     def run(self):
         """Runs normal parley loop for as many examples as this thread can get
         ahold of via the semaphore ``queued_items``.
         """
-        shared_agents = create_agents_from_shared(self.agent_shares)
-        world = self.world_type(self.opt, shared_agents)
+        shared = self.world_shared
+        # lets streaming teachers read their own part of the data
+        override_opts_in_shared(shared, {'threadindex': self.threadId})
+        world = shared['world_class'](self.opt, None, shared)
+        if self.timings is not None:
+            world.enable_timing(self.timings)
+        # let main thread know that this world is set up (creating agents may
+        # reset metrics shared with the other processes)
+        self.finish_items(1)
 
         with world:
             while True:
                 self.queued_items.acquire()
                 if self.terminate.value:
                     break  # time to close
-                world.parley()
-                with self.cnt.get_lock():
-                    self.cnt.value -= 1
-                    if self.cnt.value == 0:
-                        # let main thread know that all the examples are finished
-                        with self.epochDone:
-                            self.epochDone.notify_all()
+                # claim up to a chunk of the queued examples
+                with self.unclaimed.get_lock():
+                    num_items = min(self.chunk_size, self.unclaimed.value)
+                    self.unclaimed.value -= num_items
+                if num_items == 0:
+                    # the examples of this chunk were claimed with another one
+                    continue
+                for _ in range(num_items):
+                    world.parley()
+                self.finish_items(num_items)
+
+    def finish_items(self, num_items):
+        """Decrements the counter of unprocessed items."""
+        with self.cnt.get_lock():
+            self.cnt.value -= num_items
+            finished = self.cnt.value == 0
+        if finished:
+            # let main thread know that all the examples are finished (not
+            # holding the counter lock, which the waiting thread takes to
+            # check the counter while holding the condition)
+            with self.epochDone:
+                self.epochDone.notify_all()
 
 
 class HogwildWorld(World):
@@ -710,6 +1215,17 @@ class HogwildWorld(World):
     - An integer Value which contains the number of unprocessed examples queued
       (acquiring the semaphore only claims them--this counter is decremented
       once the processing is complete).
+
+    If ``opt['hogwild_chunk']`` is greater than one, ``parley()`` queues the
+    examples in chunks of that size: the semaphore then counts chunks, and an
+    additional integer Value counts the queued examples not yet claimed by a
+    thread. Each thread claims a whole chunk at once, which cuts the
+    interprocess synchronization per example when the model is fast. Chunks
+    which are not full yet are queued by ``synchronize()``.
+
+    The inner world can be a ``MultiWorld``, in which case every process
+    multitasks over its own copies of the task worlds. Their teachers share
+    metrics across processes, so ``report()`` returns the totals per task.
     """
 
     def __init__(self, world_class, opt, agents):
@@ -718,20 +1234,42 @@ class HogwildWorld(World):
         self.queued_items = Semaphore(0)  # counts num exs to be processed
         self.epochDone = Condition()  # notifies when exs are finished
         self.terminate = Value('b', False)  # tells threads when to shut down
-        self.cnt = Value('i', 0)  # number of exs that remain to be processed
+        # number of exs that remain to be processed, starting with one item
+        # for setting up the world in each thread
+        self.cnt = Value('i', opt['numthreads'])
+        self.unclaimed = Value('i', 0)  # number of queued exs not claimed yet
+        self.chunk_size = opt.get('hogwild_chunk', 1)
+        self.pending = 0  # number of exs waiting for their chunk to be queued
+        self.timings = None
+        if opt.get('time_agents'):
+            # the threads record into the same shared histograms
+            self.timings = Timings(
+                _timing_keys(_all_agents(self.inner_world)), shared=True)
+            self._report_timing()
 
         self.threads = []
         for i in range(opt['numthreads']):
-            self.threads.append(HogwildProcess(i, world_class, opt,
-                                               agents, self.queued_items,
+            self.threads.append(HogwildProcess(i, self.inner_world, opt,
+                                               self.queued_items,
                                                self.epochDone, self.terminate,
-                                               self.cnt))
+                                               self.cnt, self.unclaimed,
+                                               self.timings))
         for t in self.threads:
             t.start()
+        # wait until every thread has set up its world
+        self.synchronize()
 
     def __iter__(self):
         raise NotImplementedError('Iteration not available in hogwild.')
 
+    def __len__(self):
+        return len(self.inner_world)
+
+    def enable_timing(self, timings=None):
+        if self.timings is None:
+            raise RuntimeError('Timing has to be enabled when creating a '
+                               'HogwildWorld, set opt["time_agents"].')
+
     def display(self):
         self.shutdown()
         raise NotImplementedError('Hogwild does not support displaying in-run' +
@@ -742,8 +1280,19 @@ class HogwildWorld(World):
 
     def parley(self):
         """Queue one item to be processed."""
+        self.pending += 1
+        if self.pending >= self.chunk_size:
+            self.queue_pending()
+
+    def queue_pending(self):
+        """Queue the pending items as one chunk."""
+        if self.pending == 0:
+            return
         with self.cnt.get_lock():
-            self.cnt.value += 1
+            self.cnt.value += self.pending
+        with self.unclaimed.get_lock():
+            self.unclaimed.value += self.pending
+        self.pending = 0
         self.queued_items.release()
 
     def getID(self):
@@ -752,11 +1301,15 @@ class HogwildWorld(World):
     def report(self):
         return self.inner_world.report()
 
+    def reset_metrics(self):
+        self.inner_world.reset_metrics()
+
     def save_agents(self):
         self.inner_world.save_agents()
 
     def synchronize(self):
         """Sync barrier: will wait until all queued examples are processed."""
+        self.queue_pending()
         with self.epochDone:
             self.epochDone.wait_for(lambda: self.cnt.value == 0)
 
@@ -774,6 +1327,153 @@ class HogwildWorld(World):
 
 
 
+class ShardProcess(Process):
+    """Process child used for ``ShardedWorld``.
+    Creates its world from the ``share()`` of the world in the main process,
+    with ``opt['eval_shard']`` set so that its teachers go through their own
+    part of the data, and does one parley every time ``parley_sem`` is
+    released.
+    """
+
+    def __init__(self, shard, world, opt, parley_sem, fin, term, cnt, done):
+        self.shard = shard
+        self.world_shared = world.share()
+        self.opt = copy.deepcopy(opt)
+        self.opt['eval_shard'] = shard
+        self.parley_sem = parley_sem
+        self.parleyDone = fin
+        self.terminate = term
+        self.cnt = cnt
+        self.done = done
+        super().__init__()
+
+    def run(self):
+        shared = self.world_shared
+        # the opt dicts in shared belong to the agents of the main process, so
+        # they are only changed after forking
+        override_opts_in_shared(shared, {'eval_shard': self.shard})
+        world = shared['world_class'](self.opt, None, shared)
+        if self.opt.get('batchsize', 1) > 1:
+            world = BatchWorld(self.opt, world)
+        self.done[self.shard] = world.epoch_done()
+        self.finish_parley()
+
+        with world:
+            while True:
+                self.parley_sem.acquire()
+                if self.terminate.value:
+                    break
+                world.parley()
+                self.done[self.shard] = world.epoch_done()
+                self.finish_parley()
+
+    def finish_parley(self):
+        with self.cnt.get_lock():
+            self.cnt.value -= 1
+            finished = self.cnt.value == 0
+        if finished:
+            # the main process takes the counter lock inside the condition
+            with self.parleyDone:
+                self.parleyDone.notify_all()
+
+
+class ShardedWorld(World):
+    """Evaluates ordered (valid or test) data in ``opt['eval_processes']``
+    processes at once.
+
+    Each process runs a copy of ``world`` (batched if ``opt['batchsize']`` is
+    greater than one) whose dialog teachers stride over the data with a step
+    of ``eval_processes * batchsize``, so the processes see disjoint parts of
+    it which together cover every episode exactly once. ``parley()`` does one
+    parley in every process which is not done yet.
+
+    ``world`` has to be created with ``opt['numthreads']`` greater than one,
+    so that its teachers keep their metrics in shared memory: the processes
+    count into the same metrics, and ``report()`` returns the same totals as
+    evaluating in one process.
+    """
+
+    def __init__(self, opt, world):
+        self.opt = opt
+        self.inner_world = world
+        num_shards = opt['eval_processes']
+        self.parley_sems = [Semaphore(0) for _ in range(num_shards)]
+        self.parleyDone = Condition()  # notifies when a parley is finished
+        self.terminate = Value('b', False)  # tells processes to shut down
+        # number of processes still busy, starting with setting up the worlds
+        self.cnt = Value('i', num_shards)
+        self.done = Array('b', num_shards)  # which processes are at epoch end
+
+        self.shards = []
+        for i in range(num_shards):
+            self.shards.append(ShardProcess(i, world, opt, self.parley_sems[i],
+                                            self.parleyDone, self.terminate,
+                                            self.cnt, self.done))
+        for p in self.shards:
+            p.start()
+        self.synchronize()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.epoch_done():
+            raise StopIteration()
+
+    def __len__(self):
+        return len(self.inner_world)
+
+    def display(self):
+        return '[ examples are not displayed when evaluating in processes ]'
+
+    def parley(self):
+        """Does one parley in every process which has data left."""
+        active = [i for i in range(len(self.shards)) if not self.done[i]]
+        with self.cnt.get_lock():
+            self.cnt.value += len(active)
+        for i in active:
+            self.parley_sems[i].release()
+        self.synchronize()
+
+    def parley_size(self):
+        return self.opt.get('batchsize', 1) * len(self.shards)
+
+    def getID(self):
+        return self.inner_world.getID()
+
+    def episode_done(self):
+        return False
+
+    def epoch_done(self):
+        return all(self.done)
+
+    def report(self):
+        return self.inner_world.report()
+
+    def reset_metrics(self):
+        self.inner_world.reset_metrics()
+
+    def synchronize(self):
+        """Waits until all processes have finished their parley."""
+        with self.parleyDone:
+            self.parleyDone.wait_for(lambda: self.cnt.value == 0)
+
+    def shutdown(self):
+        with self.terminate.get_lock():
+            self.terminate.value = True
+        for sem in self.parley_sems:
+            sem.release()
+        for p in self.shards:
+            p.join()
+        self.inner_world.shutdown()
+
+
+def _can_shard(world):
+    """Whether all teachers in ``world`` can evaluate a shard of their data."""
+    return all(isinstance(a, DialogTeacher) for a in _all_agents(world)
+               if isinstance(a, Teacher))
+
+
 ### Functions for creating tasks/worlds given options.
 
 def _get_task_world(opt):
@@ -827,6 +1527,11 @@ def create_task(opt, user_agents):
     # Check datatype for train, because we need to do single-threaded for
     # valid and test in order to guarantee exactly one epoch of training.
     if opt.get('numthreads', 1) == 1 or opt['datatype'] != 'train':
+        sharded = (opt.get('eval_processes', 1) > 1 and
+                   not opt['datatype'].startswith('train'))
+        if sharded:
+            # the processes share the metrics (and data) of the teachers
+            opt['numthreads'] = opt['eval_processes']
         if ',' not in opt['task']:
             # Single task
             world = create_task_world(opt, user_agents)
@@ -834,17 +1539,24 @@ def create_task(opt, user_agents):
             # Multitask teacher/agent
             world = MultiWorld(opt, user_agents)
 
-        if opt.get('batchsize', 1) > 1:
-            return BatchWorld(opt, world)
-        else:
-            return world
+        if sharded and not _can_shard(world):
+            print('[ only dialog teachers can be evaluated in processes. ]')
+            sharded = False
+        if sharded:
+            world = ShardedWorld(opt, world)
+        elif opt.get('async_conversations', 0) > 0:
+            world = AsyncWorld(opt, world)
+        elif opt.get('batchsize', 1) > 1:
+            world = BatchWorld(opt, world)
+        if opt.get('time_agents'):
+            world.enable_timing()
+        return world
     else:
         # more than one thread requested: do hogwild training
         if ',' not in opt['task']:
             # Single task
-            # TODO(ahm): fix metrics for multiteacher hogwild training
             world_class, task_agents = _get_task_world(opt)
             return HogwildWorld(world_class, opt, task_agents + user_agents)
         else:
-            # TODO(ahm): fix this
-            raise NotImplementedError('hogwild multiworld not supported yet')
+            # Multitask teacher/agent
+            return HogwildWorld(MultiWorld, opt, user_agents)
@@ -7,6 +7,7 @@
 from parlai.core.agents import Agent
 from parlai.core.worlds import display_messages
 
+import asyncio
 import os
 import time
 from datetime import datetime
@@ -254,25 +255,42 @@ class MTurkAgent(Agent):
                     episode_done=msg.get('episode_done', False),
                 )
 
-    def act(self):
-        while True:
-            conversation_dict, new_last_message_id = self.manager.get_new_messages(
-                task_group_id=self.manager.task_group_id,
-                conversation_id=self.conversation_id,
-                after_message_id=self.last_message_id,
-                included_agent_id=self.id
-            )
-            
-            if self.conversation_id in conversation_dict:
-                if new_last_message_id:
-                    self.last_message_id = new_last_message_id
+    def _get_new_message(self):
+        """Polls the server once, returns the new message or None."""
+        conversation_dict, new_last_message_id = self.manager.get_new_messages(
+            task_group_id=self.manager.task_group_id,
+            conversation_id=self.conversation_id,
+            after_message_id=self.last_message_id,
+            included_agent_id=self.id
+        )
+
+        if self.conversation_id in conversation_dict:
+            if new_last_message_id:
+                self.last_message_id = new_last_message_id
 
-                new_messages = conversation_dict[self.conversation_id]
+            new_messages = conversation_dict[self.conversation_id]
 
-                return new_messages[0]
+            return new_messages[0]
+        return None
 
+    def act(self):
+        while True:
+            message = self._get_new_message()
+            if message is not None:
+                return message
             time.sleep(polling_interval)
 
+    async def act_async(self):
+        """Same as ``act()``, but waits between polls without blocking the
+        event loop, so an ``AsyncWorld`` runs other conversations meanwhile.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._get_new_message)
+            if message is not None:
+                return message
+            await asyncio.sleep(polling_interval)
+
     def episode_done(self):
         return False
 
@@ -4,13 +4,11 @@
 # LICENSE file in the root directory of this source tree. An additional grant
 # of patent rights can be found in the PATENTS file in the same directory.
 
-from parlai.core.agents import Teacher
+from parlai.core.dialog_teacher import StreamDialogTeacher
 from parlai.core.fbdialog_teacher import FbDialogTeacher
 from .build import build
 
 import copy
-import json
-import random
 import os
 
 class EvalTeacher(FbDialogTeacher):
@@ -25,53 +23,20 @@ class EvalTeacher(FbDialogTeacher):
         super().__init__(opt, shared)
 
 
-class StreamTeacher(Teacher):
-    """ Hand-written streaming teacher,
-    as the data is too big to fit in memory.
-    """
+class StreamTeacher(StreamDialogTeacher):
+    """Streams the training set, as the data is too big to fit in memory."""
 
     def __init__(self, opt, shared=None):
         build(opt)
+        opt = copy.deepcopy(opt)
         # Only used for the train set.
-        self.datafile = os.path.join(
+        opt['datafile'] = os.path.join(
             opt['datapath'], 'BookTest', 'booktest-gut', 'train.14M+.txt')
-        self.fin = open(self.datafile)
+        self.cloze = False
         super().__init__(opt, shared)
 
-    def __len__(self):
-        # unknown
-        return 0
-
-    def get_next(self):
-        context = ''
-        while True:
-            l = self.fin.readline()
-            if l == '':
-                # reopen file
-                context = ''
-                self.fin.close()
-                self.fin = open(self.datafile)
-                continue
-
-            l = l.rstrip('\n')
-            l = l[l.find(' ')+1:]  # strip index
-            s = l.split('\t')
-            if len(s) == 1:
-                context += s[0] + '\n'
-            else:
-                return {
-                    'text': context + s[0],
-                    'labels': [s[1]],
-                    'candidates': s[3].split('|') if len(s) > 3 else None,
-                    'episode_done': True
-                }
-        return obs
-
-
-    # return state/action dict based upon passed state
-    def act(self):
-        obs = self.get_next()
-        return obs
+    # the data is in the fbdialog format
+    setup_data = FbDialogTeacher.setup_data
 
 
 def create_agents(opt):
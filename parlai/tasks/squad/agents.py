@@ -6,6 +6,7 @@
 
 from parlai.core.agents import Teacher
 from parlai.core.dialog_teacher import DialogTeacher
+from parlai.core.mmap_utils import load_json_columns
 from .build import build
 
 import json
@@ -18,6 +19,9 @@ class HandwrittenTeacher(Teacher):
     implements its own `act()` method for interacting with student agent, rather
     than inheriting from the core Dialog Teacher. This code is here as an
     example of rolling your own without inheritance.
+    The questions are kept as columns of flat arrays (see ``ColumnTable``),
+    which are memory-mapped from a file next to the json file with
+    ``--compile-data``.
     """
 
     def __init__(self, opt, shared=None):
@@ -28,7 +32,10 @@ class HandwrittenTeacher(Teacher):
         else:
             suffix = 'dev'
         datapath = os.path.join(opt['datapath'], 'SQuAD', suffix + '-v1.1.json')
-        self.data = self._setup_data(datapath)
+        compile_path = None
+        if opt.get('compile_data'):
+            compile_path = datapath + '.columns'
+        self._setup_data(datapath, compile_path)
         self.episode_idx = -1
         super().__init__(opt, shared)
 
@@ -41,13 +48,10 @@ class HandwrittenTeacher(Teacher):
             self.episode_idx = random.randrange(len(self.examples))
         else:
             self.episode_idx = (self.episode_idx + 1) % len(self.examples)
-        article_idx, paragraph_idx, qa_idx = self.examples[self.episode_idx]
-        article = self.squad[article_idx]
-        paragraph = article['paragraphs'][paragraph_idx]
-        qa = paragraph['qas'][qa_idx]
+        qa = self.examples[self.episode_idx]
         question = qa['question']
-        answers = [a['text'] for a in qa['answers']]
-        context = paragraph['context']
+        answers = qa['answers']
+        context = qa['context']
 
         if (self.episode_idx == (len(self.examples) - 1) and
             self.datatype != 'train'):
@@ -59,20 +63,20 @@ class HandwrittenTeacher(Teacher):
             'episode_done': True
         }
 
-    def _setup_data(self, path):
-        print('loading: ' + path)
-        with open(path) as data_file:
-            self.squad = json.load(data_file)['data']
-        self.len = 0
-        self.examples = []
-        for article_idx in range(len(self.squad)):
-            article = self.squad[article_idx]
-            for paragraph_idx in range(len(article['paragraphs'])):
-                paragraph = article['paragraphs'][paragraph_idx]
-                num_questions = len(paragraph['qas'])
-                self.len += num_questions
-                for qa_idx in range(num_questions):
-                    self.examples.append((article_idx, paragraph_idx, qa_idx))
+    def _setup_data(self, path, compile_path=None):
+        def questions(squad):
+            for article in squad['data']:
+                for paragraph in article['paragraphs']:
+                    # each paragraph is stored once for all of its questions
+                    for qa in paragraph['qas']:
+                        yield {'context': paragraph['context'],
+                               'question': qa['question'],
+                               'answers': [a['text'] for a in qa['answers']]}
+
+        self.examples = load_json_columns(
+            path, {'context': 'str', 'question': 'str', 'answers': 'list'},
+            questions, compile_path)
+        self.len = len(self.examples)
 
 
 class DefaultTeacher(DialogTeacher):
@@ -80,7 +84,9 @@ class DefaultTeacher(DialogTeacher):
     requires it to define an iterator over its data `setup_data` in order to
     inherit basic metrics, a default `act` function, and enables
     Hogwild training with shared memory with no extra work.
-    For SQuAD, this does not efficiently store the paragraphs in memory.
+    Each paragraph is stored once for all of its questions (see the shared
+    contexts of ``DialogData``), and examples have its ``context_id``.
+    With ``--compile-data``, the json file is only parsed on the first run.
     """
 
     def __init__(self, opt, shared=None):
@@ -98,8 +104,8 @@ class DefaultTeacher(DialogTeacher):
     def setup_data(self, path):
         print('loading: ' + path)
         with open(path) as data_file:
-            self.squad = json.load(data_file)['data']
-        for article in self.squad:
+            squad = json.load(data_file)['data']
+        for article in squad:
             # each paragraph is a context for the attached questions
             for paragraph in article['paragraphs']:
                 # each question is an example
@@ -107,4 +113,4 @@ class DefaultTeacher(DialogTeacher):
                     question = qa['question']
                     answers = (a['text'] for a in qa['answers'])
                     context = paragraph['context']
-                    yield (context + '\n' + question, answers), True
+                    yield ((context, question), answers), True
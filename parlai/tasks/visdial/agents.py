@@ -50,6 +50,8 @@ class DefaultTeacher(DialogTeacher):
     requires it to define an iterator over its data `setup_data` in order to
     inherit basic metrics, a `act` function, and enables
     Hogwild training with shared memory with no extra work.
+    With ``--compile-data``, the json file is only parsed on the first run,
+    and the dialogs are memory-mapped on later runs.
     """
     def __init__(self, opt, shared=None):
 
@@ -63,12 +65,12 @@ class DefaultTeacher(DialogTeacher):
     def setup_data(self, path):
         print('loading: ' + path)
         with open(path) as data_file:
-            self.visdial = json.load(data_file)
+            visdial = json.load(data_file)['data']
 
-        self.questions = self.visdial['data']['questions']
-        self.answers = self.visdial['data']['answers']
+        questions = visdial['questions']
+        answers = visdial['answers']
 
-        for dialog in self.visdial['data']['dialogs']:
+        for dialog in visdial['dialogs']:
             # for each dialog
             image_id = dialog['image_id']
             caption = dialog['caption']
@@ -79,11 +81,11 @@ class DefaultTeacher(DialogTeacher):
                 if i == len(dialog['dialog']):
                     episode_done = True
                 # for each question answer pair.
-                question = self.questions[qa['question']]
-                answer = [self.answers[qa['answer']]]
+                question = questions[qa['question']]
+                answer = [answers[qa['answer']]]
                 answer_options = []
                 for ans_id in qa['answer_options']:
-                    answer_options.append(self.answers[ans_id])
+                    answer_options.append(answers[ans_id])
                 if i == 0:
                     # prepend with caption on first question
                     # only load image on first item
@@ -5,10 +5,10 @@
 # of patent rights can be found in the PATENTS file in the same directory.
 
 from parlai.core.agents import Teacher
-from parlai.core.image_featurizers import ImageLoader
+from parlai.core.image_featurizers import ImageLoader, ImagePrefetcher
+from parlai.core.mmap_utils import load_json_columns
 from .build import build, buildImage
 
-import json
 import random
 import os
 
@@ -48,6 +48,10 @@ class OeTeacher(Teacher):
     """VQA v2.0 Open-Ended teacher, which loads the json VQA data and
     implements its own `act` method for interacting with student agent.
     agent.
+
+    The questions and annotations are kept as columns of flat arrays (see
+    ``ColumnTable``) rather than json objects. With ``--compile-data``, they
+    are written once next to the json files and memory-mapped on later runs.
     """
     def __init__(self, opt, shared=None):
         super().__init__(opt)
@@ -60,7 +64,7 @@ class OeTeacher(Teacher):
                 self.annotation = shared['annotation']
         else:
             self._setup_data(data_path, annotation_path)
-        self.len = len(self.ques['questions'])
+        self.len = len(self.ques)
 
         # for ordered data in batch mode (especially, for validation and
         # testing), each teacher in the batch gets a start index and a step
@@ -68,6 +72,12 @@ class OeTeacher(Teacher):
         self.step_size = opt.get('batchsize', 1)
         self.data_offset = opt.get('batchindex', 0)
         self.image_loader = ImageLoader(opt)
+        self.prefetcher = None
+        if opt.get('image_prefetch', 0) > 0:
+            # load the images of the next examples in background threads
+            self.prefetcher = ImagePrefetcher(
+                self.image_loader, opt['image_prefetch'],
+                self.next_episode_idx, self.image_paths)
 
         self.reset()
 
@@ -80,6 +90,9 @@ class OeTeacher(Teacher):
         super().reset()
         self.lastY = None
         self.episode_idx = self.data_offset - self.step_size
+        self.drawn_idx = self.episode_idx
+        if self.prefetcher is not None:
+            self.prefetcher.clear()
 
     def observe(self, observation):
         """Process observation for metrics."""
@@ -88,19 +101,28 @@ class OeTeacher(Teacher):
             self.lastY = None
         return observation
 
-    def act(self):
+    def next_episode_idx(self):
         if self.datatype == 'train':
-            self.episode_idx = random.randrange(self.len)
+            return random.randrange(self.len)
+        self.drawn_idx = (self.drawn_idx + self.step_size) % len(self)
+        return self.drawn_idx
+
+    def image_paths(self, episode_idx):
+        image_id = self.ques[episode_idx]['image_id']
+        return [self.image_path + '%012d.jpg' % (image_id)]
+
+    def act(self):
+        if self.prefetcher is not None:
+            self.episode_idx = self.prefetcher.pop()
         else:
-            self.episode_idx = (self.episode_idx + self.step_size) % len(self)
-            if self.episode_idx == len(self) - self.step_size:
-                self.epochDone = True
+            self.episode_idx = self.next_episode_idx()
+        if (self.datatype != 'train' and
+                self.episode_idx == len(self) - self.step_size):
+            self.epochDone = True
 
-        qa = self.ques['questions'][self.episode_idx]
+        qa = self.ques[self.episode_idx]
         question = qa['question']
-        image_id = qa['image_id']
-
-        img_path = self.image_path + '%012d.jpg' % (image_id)
+        img_path = self.image_paths(self.episode_idx)[0]
 
         action = {
             'image': self.image_loader.load(img_path),
@@ -109,8 +131,8 @@ class OeTeacher(Teacher):
         }
 
         if not self.datatype.startswith('test'):
-            anno = self.annotation['annotations'][self.episode_idx]
-            self.lastY = [ans['answer'] for ans in anno['answers']]
+            anno = self.annotation[self.episode_idx]
+            self.lastY = anno['answers']
 
         if self.datatype.startswith('train'):
             action['labels'] = self.lastY
@@ -125,14 +147,19 @@ class OeTeacher(Teacher):
         return shared
 
     def _setup_data(self, data_path, annotation_path):
-        print('loading: ' + data_path)
-        with open(data_path) as data_file:
-            self.ques = json.load(data_file)
+        compile_data = self.opt.get('compile_data')
+        self.ques = load_json_columns(
+            data_path, {'question': 'str', 'image_id': 'int'},
+            lambda data: data['questions'],
+            data_path + '.columns' if compile_data else None)
 
         if self.datatype != 'test':
-            print('loading: ' + annotation_path)
-            with open(annotation_path) as data_file:
-                self.annotation = json.load(data_file)
+            self.annotation = load_json_columns(
+                annotation_path, {'answers': 'list'},
+                lambda data: ({'answers': [
+                    ans['answer'] for ans in anno['answers']]}
+                    for anno in data['annotations']),
+                annotation_path + '.columns' if compile_data else None)
 
 
 class DefaultTeacher(OeTeacher):
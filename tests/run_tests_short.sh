@@ -10,6 +10,10 @@ set -e # stop if any tests fail
 python3 test_init.py
 python3 test_import.py
 python3 test_dict.py
+python3 test_dialog_data.py
+python3 test_image_featurizers.py
+python3 test_metrics.py
 python3 test_tasklist.py
 python3 test_threadutils.py
 python3 test_utils.py
+python3 test_worlds.py
@@ -0,0 +1,281 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree. An additional grant
+# of patent rights can be found in the PATENTS file in the same directory.
+from parlai.core.dialog_teacher import DialogData, CompiledDialogData
+from parlai.core.dialog_teacher import SharedDialogData, compile_dialog_data
+from parlai.core.dialog_teacher import LengthBuckets, DialogTeacher
+from parlai.core.dialog_teacher import TextVecs, encode_text_vecs
+from multiprocessing import Process, Value
+import os
+import shutil
+import unittest
+
+
+def data_loader(share_cands=False):
+    cands = ['hallway', 'kitchen', 'bathroom']
+    yield ('Where is the milk?', ['kitchen'], '1', cands), True
+    if not share_cands:
+        cands = list(cands)
+    yield ('Where is Sam?', ['hallway'], '1', cands), False
+    yield ('Hi how\'s it going?', ['It\'s going great. ¿Qué tal?']), True
+    yield ('Oh cool!', None, None, None), False
+    yield ('No labels',), True
+    yield ('Image', ['a', 'b'], None, ['a', 'b', 'c'], 'img.jpg'), True
+    yield (('Sam went to the kitchen.', 'Where is Sam?'), ['kitchen']), True
+    yield (('Pat is here.', 'Who is here?'), ['Pat']), True
+    yield (('Sam went to the kitchen.', 'Who went?'), ['Sam']), True
+
+
+class TestDialogData(unittest.TestCase):
+    """Make sure the different storage formats of DialogData agree."""
+
+    TMP_PATH = '/tmp/parlai_test_dialog_data/'
+    opt = {'image_mode': 'none'}
+
+    def setUp(self):
+        os.makedirs(self.TMP_PATH, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.TMP_PATH)
+
+    def check_same(self, data, other):
+        assert len(data) == len(other)
+        assert data.num_episodes() == other.num_episodes()
+        for i in range(data.num_episodes()):
+            j = 0
+            while True:
+                table, end = data.get(i, j)
+                other_table, other_end = other.get(i, j)
+                table.pop('label_candidates', None)
+                other_table.pop('label_candidates', None)
+                # ids of shared contexts depend on the storage
+                table.pop('context_id', None)
+                other_table.pop('context_id', None)
+                assert table == other_table, (table, other_table)
+                assert end == other_end
+                if table['episode_done']:
+                    break
+                j += 1
+
+    def test_compiled(self):
+        path = os.path.join(self.TMP_PATH, 'data.compiled')
+        compile_dialog_data(data_loader(), path)
+        data = DialogData(self.opt, data_loader())
+        compiled = CompiledDialogData(self.opt, path)
+        self.check_same(data, compiled)
+
+        # candidates shared between entries are restored for both of them
+        compile_dialog_data(data_loader(share_cands=True), path)
+        compiled = CompiledDialogData(self.opt, path)
+        table, _ = compiled.get(0, 1)
+        assert table['label_candidates'] == ('hallway', 'kitchen', 'bathroom')
+
+        # global candidates are added to every example with labels
+        compiled = CompiledDialogData(self.opt, path, cands=['x', 'y'])
+        table, _ = compiled.get(1, 0)
+        assert 'x' in table['label_candidates']
+        assert 'It\'s going great. ¿Qué tal?' in table['label_candidates']
+
+    def test_contexts(self):
+        path = os.path.join(self.TMP_PATH, 'data.compiled')
+        compile_dialog_data(data_loader(), path)
+        for data in (DialogData(self.opt, data_loader()),
+                     CompiledDialogData(self.opt, path),
+                     SharedDialogData(self.opt, data_loader())):
+            tables = [data.get(i)[0] for i in (4, 5, 6)]
+            assert tables[0]['text'] == 'Sam went to the kitchen.\nWhere is Sam?'
+            assert tables[1]['text'] == 'Pat is here.\nWho is here?'
+            assert tables[0]['context_id'] == tables[2]['context_id']
+            assert tables[0]['context_id'] != tables[1]['context_id']
+            assert 'context_id' not in data.get(0)[0]
+        assert data.get(6)[1]
+        assert len(DialogData(self.opt, data_loader()).contexts) == 2
+
+    def test_shared(self):
+        data = DialogData(self.opt, data_loader())
+        shared = SharedDialogData(self.opt, data_loader())
+        self.check_same(data, shared)
+
+        # forked processes read the data from the same shared memory
+        num_read = Value('i', 0)
+
+        def read():
+            for i in range(shared.num_episodes()):
+                shared.get(i)
+                with num_read.get_lock():
+                    num_read.value += 1
+
+        procs = [Process(target=read) for _ in range(3)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        assert num_read.value == 3 * data.num_episodes()
+
+
+class WordDictionary(object):
+    """Maps each word to its position in the dict file."""
+
+    def __init__(self, opt):
+        with open(opt['dict_file']) as read:
+            self.words = read.read().split()
+
+    def txt2vec(self, text):
+        return [self.words.index(w) + 1 if w in self.words else 0
+                for w in text.split()]
+
+
+class VecTeacher(DialogTeacher):
+
+    def setup_data(self, path):
+        return data_loader()
+
+
+class TestTextVecs(unittest.TestCase):
+    """Make sure the token ids cached next to the data match the text."""
+
+    TMP_PATH = '/tmp/parlai_test_text_vecs/'
+
+    def setUp(self):
+        os.makedirs(self.TMP_PATH, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.TMP_PATH)
+
+    def check_vecs(self, teacher, dictionary):
+        data = teacher.data
+        for i in range(data.num_episodes()):
+            j = 0
+            while True:
+                table, _ = data.get(i, j)
+                assert list(table['text_vec']) == \
+                    dictionary.txt2vec(table['text'])
+                if table.get('labels') is None:
+                    assert 'labels_vec' not in table
+                else:
+                    assert [list(y) for y in table['labels_vec']] == \
+                        [dictionary.txt2vec(y) for y in table['labels']]
+                if table['episode_done']:
+                    break
+                j += 1
+
+    def test_text_vecs(self):
+        dict_file = os.path.join(self.TMP_PATH, 'dict')
+        with open(dict_file, 'w') as write:
+            write.write('Where is the\nkitchen')
+        opt = {'datatype': 'train:ordered', 'image_mode': 'none',
+               'datafile': os.path.join(self.TMP_PATH, 'data'),
+               'dict_file': dict_file, 'cache_text_vecs': True,
+               'dict_class': 'test_dialog_data:WordDictionary'}
+        for compile_data in (False, True):
+            opt['compile_data'] = compile_data
+            teacher = VecTeacher(opt)
+            self.check_vecs(teacher, WordDictionary(opt))
+            path = opt['datafile'] + '.vecteacher.vecs'
+            assert os.path.isfile(path)
+
+            # the file is reused as long as the dictionary is the same
+            mtime = os.path.getmtime(path)
+            teacher = VecTeacher(opt)
+            assert os.path.getmtime(path) == mtime
+            assert teacher.data.text_vecs is not None
+
+            # and rebuilt when it changes
+            with open(dict_file, 'a') as write:
+                write.write('\nmilk?')
+            teacher = VecTeacher(opt)
+            self.check_vecs(teacher, WordDictionary(opt))
+            assert teacher.data.get(0)[0]['text_vec'][-1] == 5
+
+            # copies share the vectors through the data
+            copy = VecTeacher(opt, teacher.share())
+            assert copy.data.text_vecs is teacher.data.text_vecs
+            os.remove(path)
+            with open(dict_file, 'w') as write:
+                write.write('Where is the\nkitchen')
+
+
+class TestLengthBuckets(unittest.TestCase):
+    """Make sure batches hold episodes of similar lengths."""
+
+    def loader(self):
+        for i in range(1000):
+            yield (' '.join(['w'] * ((i * 37) % 101)), ['a']), True
+
+    def batches(self, buckets):
+        """Returns the batches of one epoch, as the teachers would take them."""
+        batches = []
+        buckets.batches = buckets.make_batches()
+        for _ in range(len(buckets.batches)):
+            batch = [buckets.next_episode(i) for i in range(buckets.batchsize)]
+            batches.append([ep for ep in batch if ep is not None])
+        return batches
+
+    def test_batches(self):
+        data = DialogData({'image_mode': 'none'}, self.loader())
+        buckets = LengthBuckets(data, 10)
+        batches = self.batches(buckets)
+        episodes = sorted(ep for b in batches for ep in b)
+        assert episodes == list(range(1000))
+        # one pool of 100 batches sorted by length
+        lengths = [[buckets.lengths[ep] for ep in b] for b in batches]
+        assert all(max(l) - min(l) <= 1 for l in lengths)
+
+        buckets = LengthBuckets(data, 10, max_tokens=200)
+        batches = self.batches(buckets)
+        assert sorted(ep for b in batches for ep in b) == list(range(1000))
+        for b in batches:
+            longest = max(buckets.lengths[ep] for ep in b)
+            assert len(b) == 1 or len(b) * longest <= 200
+        assert max(len(b) for b in batches) == 10
+
+    def test_episodes(self):
+        def loader():
+            for i in range(300):
+                for t in range(i % 4 + 1):
+                    text = ' '.join(['w'] * ((i * 37) % 101))
+                    yield (text, [str(i)]), t == 0
+        data = DialogData({'image_mode': 'none'}, loader())
+        buckets = LengthBuckets(data, 8)
+        # teachers ask for a new episode when they finish their last one, so
+        # with episodes of different lengths they don't ask at once
+        turns_left = [0] * 8
+        episodes = []
+        while len(episodes) < 300:
+            for i in range(8):
+                if turns_left[i] == 0:
+                    ep = buckets.next_episode(i)
+                    if ep is not None:
+                        episodes.append(ep)
+                        turns_left[i] = ep % 4 + 1
+                    continue
+                turns_left[i] -= 1
+        # every episode is handed out once in an epoch
+        assert sorted(episodes[:300]) == list(range(300))
+
+    def test_lengths(self):
+        def loader():
+            yield ('a bb ccc', ['a']), True
+            yield ('dd', ['a']), False
+            yield ('eeeee f', ['a']), True
+
+        def get(*args):
+            raise AssertionError('tables are built')
+        data = DialogData({'image_mode': 'none'}, loader())
+        # lengths come from the stored entries, without loading images
+        data.get = get
+        assert LengthBuckets(data, 2).lengths == [3, 2]
+
+        class CharDictionary(object):
+            def txt2vec(self, text):
+                return [ord(c) for c in text]
+        # and from the cached text vectors if there are any
+        data.text_vecs = TextVecs(
+            encode_text_vecs(data, CharDictionary(), 'chars'))
+        assert LengthBuckets(data, 2).lengths == [8, 7]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,10 +3,28 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree. An additional grant
 # of patent rights can be found in the PATENTS file in the same directory.
-from parlai.core.dict import find_ngrams
+from collections import defaultdict
+from parlai.core.dialog_teacher import DialogTeacher
+from parlai.core.dict import add_ngram, find_ngrams, find_ngrams_trie
+import numpy as np
+import os
+import tempfile
 import unittest
 
 
+class WordTeacher(DialogTeacher):
+    """Questions and answers with words of different frequencies."""
+
+    def __init__(self, opt, shared=None):
+        opt['datafile'] = 'words'
+        super().__init__(opt, shared)
+
+    def setup_data(self, path):
+        for i in range(50):
+            text = ' '.join('w{}'.format(j) for j in range(i % 7, 9))
+            yield (text + '?', ['a{}'.format(i % 5)]), i % 3 == 0
+
+
 class TestDictionary(unittest.TestCase):
     """Basic tests on the built-in parlai Dictionary."""
 
@@ -27,6 +45,33 @@ class TestDictionary(unittest.TestCase):
         assert ' '.join(res) == 'hello world buddy ol boy'
         assert '-'.join(res) == 'hello world buddy-ol boy'
 
+    def test_find_ngrams_trie(self):
+        """Does the ngram trie break text like ``find_ngrams``?"""
+        tokens = ['a', 'b', 'c', 'd', 'a', 'b', 'a', 'b', 'c']
+        ngrams = {'a b', 'b c d', 'a b a b', 'd a', 'c d a'}
+        trie = {}
+        for ngram in ngrams:
+            add_ngram(trie, ngram)
+        for n in range(1, 6):
+            res = find_ngrams_trie(trie, tokens, n)
+            assert res == find_ngrams(ngrams, tokens, n), n
+        assert find_ngrams_trie(trie, tokens, 3) == \
+            ['a', 'b c d', 'a b', 'a b', 'c']
+
+        from parlai.core.dict import DictionaryAgent
+        from parlai.core.params import ParlaiParser
+
+        argparser = ParlaiParser()
+        DictionaryAgent.add_cmdline_args(argparser)
+        opt = argparser.parse_args(['--dict-tokenizer', 're',
+                                    '--dict-max-ngram-size', '3'])
+        dictionary = DictionaryAgent(opt)
+        dictionary['new york'] = 5
+        dictionary.add_to_dict(['new york city'])
+        copy = DictionaryAgent(opt, dictionary.share())
+        assert copy.tokenize('I love new york city, new york!') == \
+            ['I', 'love', 'new york city', ',', 'new york', '!']
+
     def test_basic_parse(self):
         """Check that the dictionary is correctly adding and parsing short
         sentence.
@@ -59,6 +104,161 @@ class TestDictionary(unittest.TestCase):
         assert vec[0] == num_builtin
         assert vec[1] == num_builtin + 1
 
+    def test_regex_tokenizer(self):
+        """Check the regex tokenizer and the cache of converted texts."""
+        from parlai.core.dict import DictionaryAgent
+        from parlai.core.params import ParlaiParser
+
+        argparser = ParlaiParser()
+        DictionaryAgent.add_cmdline_args(argparser)
+        opt = argparser.parse_args(['--dict-tokenizer', 're',
+                                    '--dict-cache-size', '2'])
+        dictionary = DictionaryAgent(opt)
+        tokens = dictionary.tokenize("I don't know, it's 3.5 well-known... a|b")
+        assert list(tokens) == ['I', 'do', "n't", 'know', ',', 'it', "'s",
+                                '3.5', 'well-known', '...', 'a', '__pipe__',
+                                'b']
+
+        num_builtin = len(dictionary)
+        unk = dictionary[dictionary.unk_token]
+        assert dictionary.txt2vec('hello world') == [unk, unk]
+        # cached ids are dropped when words are added
+        dictionary.observe({'text': 'hello world'})
+        dictionary.act()
+        vec = dictionary.txt2vec('hello world', vec_type=np.ndarray)
+        assert vec.dtype == np.int64
+        assert list(vec) == [num_builtin, num_builtin + 1]
+        dictionary.txt2vec('hello')
+        dictionary.txt2vec('world')
+        assert list(dictionary.cache) == ['hello', 'world']
+        dictionary.sort()
+        assert not dictionary.cache
+
+    def test_binary(self):
+        """Check that binary dictionaries load like tsv ones and can be
+        changed and exported.
+        """
+        from parlai.core.dict import DictionaryAgent
+        from parlai.core.params import ParlaiParser
+
+        argparser = ParlaiParser()
+        DictionaryAgent.add_cmdline_args(argparser)
+        opt = argparser.parse_args(['--dict-tokenizer', 're',
+                                    '--dict-max-ngram-size', '2'])
+        dictionary = DictionaryAgent(opt)
+        for text in ('hello world', 'hello there', 'the café, the end'):
+            dictionary.add_to_dict(dictionary.tokenize(text))
+        dictionary['the end'] = 1
+        with tempfile.TemporaryDirectory() as tmp:
+            tsv = os.path.join(tmp, 'dict.tsv')
+            dictionary.save(tsv)
+            opt['dict_format'] = 'binary'
+            dictionary.opt['dict_format'] = 'binary'
+            dictionary.save(os.path.join(tmp, 'dict.bin'))
+
+            opt['dict_file'] = os.path.join(tmp, 'dict.bin')
+            binary = DictionaryAgent(opt)
+            assert len(binary) == len(dictionary)
+            assert dict(binary.freq) == dict(dictionary.freq)
+            assert dict(binary.tok2ind) == dictionary.tok2ind
+            assert binary.txt2vec('the end café') == \
+                dictionary.txt2vec('the end café')
+            assert binary['nope'] == binary[binary.unk_token]
+            assert binary[3] == dictionary[3]
+
+            # new tokens are added on top of the mapped ones
+            copy = DictionaryAgent(opt, binary.share())
+            copy.add_to_dict(['hello', 'new'])
+            assert binary.freq['hello'] == dictionary.freq['hello'] + 1
+            assert binary['new'] == len(dictionary)
+            assert binary[len(dictionary)] == 'new'
+            del binary.freq['new']
+            assert 'new' not in binary.freq
+            assert len(binary.freq) == len(binary) - 1
+
+            # and exported to tsv
+            binary.opt['dict_format'] = 'tsv'
+            binary.save(os.path.join(tmp, 'exported.tsv'))
+            with open(tsv) as read:
+                expected = read.read()
+            with open(os.path.join(tmp, 'exported.tsv')) as read:
+                assert read.read() == expected.replace('hello\t2', 'hello\t3')
+
+            # tokens of a binary dictionary are merged into other indices
+            opt['dict_file'] = None
+            opt['dict_nulltoken'] = 'null'
+            other = DictionaryAgent(opt)
+            other.load(os.path.join(tmp, 'dict.bin'))
+            assert type(other.tok2ind) == dict
+            assert other['hello'] == dictionary['hello'] + 1
+
+    def test_batch_txt2vec(self):
+        """Check that batches of texts are converted and padded."""
+        from concurrent.futures import ThreadPoolExecutor
+        from parlai.core.dict import DictionaryAgent
+        from parlai.core.params import ParlaiParser
+
+        argparser = ParlaiParser()
+        DictionaryAgent.add_cmdline_args(argparser)
+        opt = argparser.parse_args(['--dict-tokenizer', 're'])
+        dictionary = DictionaryAgent(opt)
+        texts = ['a b c', '', 'c b a d e', 'a']
+        for text in texts:
+            dictionary.add_to_dict(dictionary.tokenize(text))
+        vecs = [dictionary.txt2vec(text) for text in texts]
+        # vectors which were already converted are padded as they are
+        texts[3] = np.array(vecs[3])
+        null = dictionary[dictionary.null_token]
+
+        res, lengths = dictionary.batch_txt2vec(texts, pad='left')
+        assert res.dtype == np.int64 and res.shape == (4, 5)
+        assert list(lengths) == [3, 0, 5, 1]
+        for row, vec in zip(res, vecs):
+            assert list(row) == [null] * (5 - len(vec)) + vec
+        with ThreadPoolExecutor(2) as pool:
+            pooled, _ = dictionary.batch_txt2vec(texts, pad='left', pool=pool)
+        assert (pooled == res).all()
+
+        res, lengths = dictionary.batch_txt2vec(texts, pad='right', max_len=2)
+        assert res.shape == (4, 2) and list(lengths) == [2, 0, 2, 1]
+        for row, vec in zip(res, vecs):
+            assert list(row) == vec[:2] + [null] * (2 - len(vec[:2]))
+        res, _ = dictionary.batch_txt2vec(texts, pad='left', max_len=2)
+        assert list(res[2]) == vecs[2][-2:]
+        assert dictionary.batch_txt2vec([])[0].shape == (0, 0)
+
+    def test_build_shards(self):
+        """Check that dictionaries built over shards of the examples add up
+        to the dictionary built over all of them.
+        """
+        from parlai.core.dict import DictionaryAgent
+        from parlai.core.params import ParlaiParser
+        from parlai.core.worlds import DialogPartnerWorld
+
+        argparser = ParlaiParser()
+        DictionaryAgent.add_cmdline_args(argparser)
+        opt = argparser.parse_args(['--dict-tokenizer', 're',
+                                    '--datatype', 'train:ordered',
+                                    '--image-mode', 'none'])
+
+        def build(shard=None):
+            dictionary = DictionaryAgent(opt)
+            if shard is not None:
+                # only count the tokens of the shard, like build_dict.py
+                dictionary.build_shard = shard
+                dictionary.freq = defaultdict(int)
+            world = DialogPartnerWorld(opt, [WordTeacher(opt), dictionary])
+            for _ in range(40):
+                world.parley()
+            return dictionary
+
+        dictionary = build()
+        merged = DictionaryAgent(opt)
+        for shard in range(3):
+            merged.add_counts(build((shard, 3)).freq)
+        assert merged.freq == dictionary.freq
+        assert merged.sort() == dictionary.sort()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,252 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree. An additional grant
+# of patent rights can be found in the PATENTS file in the same directory.
+from parlai.core import image_featurizers
+from parlai.core.dialog_teacher import DialogTeacher
+from parlai.core.image_featurizers import CnnFeaturizer, FeatureStore, \
+    ImageLoader, _greyscale
+from collections import deque
+from multiprocessing import Process
+from PIL import Image
+import numpy as np
+import os
+import random
+import shutil
+import threading
+import time
+import unittest
+
+TMP_PATH = '/tmp/parlai_test_image_featurizers/'
+
+
+class ImageTeacher(DialogTeacher):
+    """Episodes of one or two questions about one of 10 small images."""
+
+    def __init__(self, opt, shared=None):
+        opt['datafile'] = 'images'
+        super().__init__(opt, shared)
+
+    def setup_data(self, path):
+        for e in range(30):
+            img = os.path.join(TMP_PATH, '{}.png'.format(e % 10))
+            yield ('what is {}?'.format(e), [str(e)], None, None, img), True
+            if e % 3 == 0:
+                yield ('and now?', [str(e)], None, None, img), False
+
+
+class TestImagePrefetch(unittest.TestCase):
+    """Make sure teachers send the same images with prefetching."""
+
+    def setUp(self):
+        os.makedirs(TMP_PATH, exist_ok=True)
+        for i in range(10):
+            pixels = np.full((8, 12, 3), i * 25, dtype=np.uint8)
+            path = os.path.join(TMP_PATH, '{}.png'.format(i))
+            Image.fromarray(pixels).save(path)
+
+    def tearDown(self):
+        shutil.rmtree(TMP_PATH)
+
+    def actions(self, datatype, num, **kwargs):
+        opt = {'datatype': datatype, 'image_mode': 'raw'}
+        opt.update(kwargs)
+        teacher = ImageTeacher(opt)
+        random.seed(4)
+        actions = []
+        for _ in range(num):
+            action = teacher.act()
+            actions.append((action['text'], action['image'].tobytes()))
+        return actions, teacher
+
+    def test_prefetch(self):
+        for datatype in ('train', 'valid'):
+            actions, _ = self.actions(datatype, 40)
+            prefetched, teacher = self.actions(datatype, 40, image_prefetch=4)
+            assert prefetched == actions
+            # the images of the next episodes are loading
+            assert 0 < len(teacher.data.image_loader._pending()) <= 4 * 2
+
+        # images which are dropped at a reset are not loaded for nothing
+        teacher.reset()
+        assert len(teacher.data.image_loader._pending()) == 0
+        assert teacher.act()['text'] == 'what is 0?'
+
+
+class TestFeatureStore(unittest.TestCase):
+    """Make sure features are appended to and read from one mapped file."""
+
+    def setUp(self):
+        os.makedirs(TMP_PATH, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(TMP_PATH)
+
+    def test_store(self):
+        store = FeatureStore(TMP_PATH, 'float16')
+        assert store.get('a/1.jpg') is None
+        feature = np.arange(6, dtype=np.float32).reshape(1, 6)
+        view = store.add('a/1.jpg', feature)
+        assert view.dtype == np.float16 and (view == feature).all()
+        with self.assertRaises(RuntimeError):
+            store.add('a/2.jpg', np.zeros((1, 5)))
+
+        # rows added by other processes are found
+        def add():
+            FeatureStore(TMP_PATH).add('a/2.jpg', feature + 1)
+        p = Process(target=add)
+        p.start()
+        p.join()
+        assert (store.get('b/2.jpg') == feature + 1).all()
+        assert (store.get('1.jpg') == feature).all()
+        assert len(store) == 2
+
+        other = FeatureStore(TMP_PATH)
+        assert other.dtype == np.float16 and len(other) == 2
+        assert (other.get('2.jpg') == feature + 1).all()
+
+    def test_loader(self):
+        opt = {'image_mode': 'resnet152', 'image_feature_store': True}
+        loader = ImageLoader(opt)
+        path = os.path.join(TMP_PATH, 'img.jpg')
+        # features saved in .npy files are moved to the store
+        np.save(loader.feature_path(path), np.ones((1, 4)))
+        assert not loader.has_feature(path)
+        assert (loader.load(path) == 1).all()
+        assert loader.has_feature(path)
+        assert os.path.isfile(
+            os.path.join(TMP_PATH, 'resnet152', 'features.bin'))
+
+
+class StubFeaturizer(CnnFeaturizer):
+    """``CnnFeaturizer`` whose model returns the mean color of each image and
+    records the sizes of the batches it is given.
+    """
+
+    def __init__(self, batchsize):
+        self.image_size = 8
+        self.crop_size = 4
+        self.batchsize = batchsize
+        self.transform = lambda image: np.asarray(image, dtype=np.float32)
+        self.queue = deque()
+        self.queue_lock = threading.Lock()
+        self.cnn_lock = threading.Lock()
+        self.batches = []
+        self.wait_for = 0
+
+    def extract_batch(self, tensors):
+        self.batches.append(len(tensors))
+        # hold the first batch until the other threads queued their images
+        while sum(self.batches) + len(self.queue) < self.wait_for:
+            time.sleep(0.001)
+        self.wait_for = 0
+        return [t.mean(axis=(0, 1))[None] for t in tensors]
+
+
+class TestCnnFeaturizer(unittest.TestCase):
+    """Make sure images are run through the CNN in batches and get their own
+    features back.
+    """
+
+    def setUp(self):
+        os.makedirs(TMP_PATH, exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree(TMP_PATH)
+
+    def test_extract(self):
+        featurizer = StubFeaturizer(4)
+        featurizer.wait_for = 10
+        features = [None] * 10
+
+        def extract(i):
+            image = Image.new('RGB', (8, 8), (i, i, i))
+            features[i] = featurizer.extract(image)
+        threads = [threading.Thread(target=extract, args=(i,))
+                   for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # images queued while the CNN runs make batches of up to 4
+        batches = featurizer.batches
+        assert sum(batches) == 10 and max(batches) == 4
+        assert all(b == 4 for b in batches[1:-1])
+        for i, feature in enumerate(features):
+            assert feature.shape == (1, 3) and (feature == i).all()
+
+    def test_extract_files(self):
+        paths = []
+        for i in range(10):
+            paths.append(os.path.join(TMP_PATH, '{}.png'.format(i)))
+            Image.new('RGB', (12, 8), (i, i, i)).save(paths[-1])
+        loader = ImageLoader({'image_mode': 'resnet18'})
+        get_featurizer = image_featurizers._get_featurizer
+        for num_workers in (0, 2):
+            featurizer = StubFeaturizer(4)
+            image_featurizers._get_featurizer = lambda opt: featurizer
+            try:
+                assert loader.extract_files(paths, num_workers) == 10
+            finally:
+                image_featurizers._get_featurizer = get_featurizer
+            assert featurizer.batches == [4, 4, 2]
+            # features are saved for the right images
+            for i, path in enumerate(paths):
+                feature = np.load(loader.feature_path(path))
+                assert feature.shape == (1, 3) and (feature == i).all()
+            assert loader.extract_files(paths) == 0
+            shutil.rmtree(os.path.join(TMP_PATH, 'resnet18'))
+
+
+class TestPixelStore(unittest.TestCase):
+    """Make sure packed images load the same as the image files."""
+
+    def setUp(self):
+        os.makedirs(TMP_PATH, exist_ok=True)
+        rng = np.random.RandomState(2)
+        self.paths = []
+        for i, size in enumerate([(28, 28), (90, 70), (5, 300)]):
+            pixels = rng.randint(0, 256, size + (3,)).astype(np.uint8)
+            path = os.path.join(TMP_PATH, '{}.bmp'.format(i))
+            Image.fromarray(pixels).save(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(TMP_PATH)
+
+    def test_ascii(self):
+        loader = ImageLoader({'image_mode': 'ascii'})
+        for path in self.paths:
+            im = Image.open(path)
+            im.thumbnail((60, 40), Image.BICUBIC)
+            im = im.convert('L')
+            asc = []
+            for y in range(im.size[1]):
+                for x in range(im.size[0]):
+                    lum = 255 - im.getpixel((x, y))
+                    asc.append(_greyscale[lum * len(_greyscale) // 256])
+                asc.append('\n')
+            assert loader.load(path) == ''.join(asc)
+
+    def test_pack(self):
+        for mode in ('raw', 'ascii'):
+            loader = ImageLoader({'image_mode': mode})
+            packed = ImageLoader({'image_mode': mode,
+                                  'image_pixel_store': True})
+            assert packed.pixel_store(self.paths[0]) is None
+            assert packed.pack_files(self.paths[:2]) == 2
+            # new images are added to the packed ones
+            assert packed.pack_files(self.paths, num_workers=2) == 1
+            assert packed.pack_files(self.paths) == 0
+            assert len(packed.pixel_store(self.paths[0])) == 3
+            for path in self.paths:
+                expected, image = loader.load(path), packed.load(path)
+                if mode == 'raw':
+                    assert image.mode == 'RGB' and image.size == expected.size
+                    expected, image = expected.tobytes(), image.tobytes()
+                assert image == expected
+
+
+if __name__ == '__main__':
+    unittest.main()
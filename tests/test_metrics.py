@@ -0,0 +1,58 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree. An additional grant
+# of patent rights can be found in the PATENTS file in the same directory.
+from parlai.core.metrics import Timings
+from multiprocessing import Process
+import unittest
+
+
+class TestTimings(unittest.TestCase):
+    """Make sure timings are counted and percentiles are close."""
+
+    def test_percentiles(self):
+        t = Timings(['a.act'])
+        for i in range(1, 101):
+            t.add('a.act', i / 1000)
+        t.add('unknown', 1)
+        t.parley(4)
+        r = t.report()
+        assert 'unknown' not in r
+        assert r['a.act']['count'] == 100
+        assert abs(r['a.act']['mean'] - 0.0505) < 1e-6
+        for p in (50, 95, 99):
+            # buckets are about 12% wide
+            est = r['a.act']['p' + str(p)]
+            assert abs(est - p / 1000) / (p / 1000) < 0.07, (p, est)
+        assert list(t.throughput) == [1, 4]
+
+    def test_add_key(self):
+        t = Timings()
+        t.add_key('a.act')
+        t.add('a.act', 0.5)
+        t.add_key('b.observe')
+        t.add('b.observe', 0.1)
+        r = t.report()
+        assert r['a.act']['count'] == 1 and r['b.observe']['count'] == 1
+        t.clear()
+        assert 'a.act' not in t.report()
+
+    def test_shared(self):
+        t = Timings(['a.act'], shared=True)
+
+        def add():
+            for _ in range(50):
+                t.add('a.act', 0.01)
+                t.parley()
+        procs = [Process(target=add) for _ in range(2)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        assert t.report()['a.act']['count'] == 100
+        assert t.throughput[0] == 100
+
+
+if __name__ == '__main__':
+    unittest.main()
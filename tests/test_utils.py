@@ -5,6 +5,12 @@
 # of patent rights can be found in the PATENTS file in the same directory.
 
 from parlai.core.utils import Timer, round_sigfigs
+from parlai.core.utils import CandidatePool, CandidateSet
+from parlai.core.mmap_utils import ColumnTable, encode_columns
+from parlai.core.mmap_utils import load_json_columns
+import json
+import os
+import tempfile
 import time
 import unittest
 
@@ -62,6 +68,59 @@ class TestUtils(unittest.TestCase):
         assert less > 0
         assert less < t.time()
 
+    def test_candidate_pool(self):
+        pool = CandidatePool(['a', 'b', 'c', 'b'])
+        assert len(pool) == 3 and list(pool) == ['a', 'b', 'c']
+        assert pool.ids['c'] == 2 and pool[1] == 'b'
+
+        cands = pool.view(['b', 'd', 'd'])
+        assert isinstance(cands, CandidateSet)
+        assert len(cands) == 4
+        assert 'd' in cands and 'a' in cands and 'e' not in cands
+        assert list(cands) == ['a', 'b', 'c', 'd']
+        assert cands[3] == 'd' and cands[0] == 'a'
+        # negative indices count from the last extra candidate
+        assert cands[-1] == 'd' and cands[-2] == 'c' and cands[-4] == 'a'
+        for idx in (4, -5):
+            with self.assertRaises(IndexError):
+                cands[idx]
+        assert cands == {'a', 'b', 'c', 'd'}
+        assert cands | {'e'} == {'a', 'b', 'c', 'd', 'e'}
+        # the pool itself is not changed by views
+        assert len(pool) == 3 and 'd' not in pool
+        assert len(pool.view()) == 3
+
+
+class TestColumnTable(unittest.TestCase):
+    """Make sure json records read back the same from columns."""
+
+    def test_columns(self):
+        records = [{'question': 'what is {}?'.format(i), 'image_id': i * 7,
+                    'answers': [str(i % 3), 'yes'][:i % 3], 'other': i}
+                   for i in range(20)]
+        columns = {'question': 'str', 'image_id': 'int', 'answers': 'list'}
+        table = ColumnTable(encode_columns(records, columns))
+        assert len(table) == 20
+        for i, record in enumerate(records):
+            del record['other']
+            assert table[i] == record
+        assert table[-1] == records[-1]
+        with self.assertRaises(IndexError):
+            table[20]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'questions.json')
+            with open(path, 'w') as write:
+                json.dump({'questions': records}, write)
+            compile_path = path + '.columns'
+            table = load_json_columns(path, columns, lambda d: d['questions'],
+                                      compile_path)
+            assert list(table) == records
+            # the compiled columns are read on later runs
+            os.utime(path, (0, 0))
+            table = load_json_columns(path, columns, None, compile_path)
+            assert list(table) == records
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,401 @@
+# Copyright (c) 2017-present, Facebook, Inc.
+# All rights reserved.
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree. An additional grant
+# of patent rights can be found in the PATENTS file in the same directory.
+from parlai.agents.remote_agent.remote_agent import RemoteAgentAgent
+from parlai.core.agents import Agent, LazyTasks, create_agent_from_shared
+from parlai.core.dialog_teacher import DialogTeacher, StreamDialogTeacher
+from parlai.core.params import Opt
+from parlai.core.worlds import AsyncDialogPartnerWorld, AsyncWorld, \
+    BatchWorld, DialogPartnerWorld, HogwildWorld, MultiWorld, ShardedWorld, \
+    agent_call, create_task
+import asyncio
+import copy
+import json
+import os
+import tempfile
+import threading
+import unittest
+import zmq
+
+
+class EpisodeTeacher(DialogTeacher):
+    """101 episodes of one to four turns."""
+
+    def __init__(self, opt, shared=None):
+        opt['datafile'] = 'episodes'
+        super().__init__(opt, shared)
+
+    def setup_data(self, path):
+        for e in range(101):
+            for t in range(e % 4 + 1):
+                yield ('{} {}'.format(e, t), ['{} {}'.format(e % 3, t)]), t == 0
+
+
+class StreamEpisodeTeacher(StreamDialogTeacher):
+    """Streams the episodes of ``EpisodeTeacher``."""
+
+    def __init__(self, opt, shared=None):
+        opt['datafile'] = 'episodes'
+        super().__init__(opt, shared)
+
+    setup_data = EpisodeTeacher.setup_data
+
+
+class ShortTeacher(EpisodeTeacher):
+    """20 episodes of one turn."""
+
+    def setup_data(self, path):
+        for e in range(20):
+            yield ('{} 0'.format(e), ['{} 0'.format(e % 3)]), True
+
+
+class LengthTeacher(EpisodeTeacher):
+    """40 episodes of one turn, episode ``e`` is ``e + 2`` words long."""
+
+    def setup_data(self, path):
+        for e in range(40):
+            text = '{} 0'.format(e) + ' w' * e
+            yield (text, ['{} 0'.format(e % 3)]), True
+
+
+class GuessAgent(Agent):
+    """Answers right for some of the examples."""
+
+    def observe(self, observation):
+        self.observation = observation
+        return observation
+
+    def act(self):
+        text = self.observation.get('text', '0 0')
+        return {'id': 'guess', 'text': '1 ' + text.split()[1]}
+
+
+class AsyncGuessAgent(GuessAgent):
+    """Answers like ``GuessAgent`` after waiting on the event loop."""
+
+    async def act_async(self):
+        await asyncio.sleep(0.001)
+        return self.act()
+
+
+class TestShardedWorld(unittest.TestCase):
+    """Make sure evaluating in processes gives the same metrics."""
+
+    def evaluate(self, teacher_class=EpisodeTeacher, **kwargs):
+        opt = {'task': 'episodes', 'datatype': 'valid', 'image_mode': 'none'}
+        opt.update(kwargs)
+        world = DialogPartnerWorld(opt, [teacher_class(opt), GuessAgent(opt)])
+        if opt.get('eval_processes', 1) > 1:
+            world = ShardedWorld(opt, world)
+        elif opt.get('batchsize', 1) > 1:
+            world = BatchWorld(opt, world)
+        while not world.epoch_done():
+            world.parley()
+        report = world.report()
+        world.shutdown()
+        return report
+
+    def test_sharded(self):
+        report = self.evaluate()
+        assert report['total'] == 251
+        for bs in (1, 4):
+            for num in (2, 3, 8):
+                sharded = self.evaluate(batchsize=bs, eval_processes=num,
+                                        numthreads=num)
+                assert sharded == report, (bs, num, sharded, report)
+
+    def test_shutdown(self):
+        opt = {'task': 'episodes', 'datatype': 'valid', 'image_mode': 'none',
+               'eval_processes': 2, 'numthreads': 2}
+        agent = GuessAgent(opt)
+        agent.shutdown = lambda: setattr(agent, 'closed', True)
+        world = ShardedWorld(opt, DialogPartnerWorld(
+            opt, [EpisodeTeacher(opt), agent]))
+        world.parley()
+        world.shutdown()
+        # the agents of the main process are shut down too
+        assert agent.closed
+
+
+class TestHogwildWorld(unittest.TestCase):
+    """Make sure hogwild processes count every queued example once."""
+
+    def run_hogwild(self, world_class, agents, opt, num):
+        world = HogwildWorld(world_class, opt, agents)
+        for _ in range(num):
+            world.parley()
+        world.synchronize()
+        report = world.report()
+        world.shutdown()
+        return report
+
+    def test_multitask(self):
+        tasks = ('tests.test_worlds:EpisodeTeacher',
+                 'tests.test_worlds:ShortTeacher')
+        opt = {'task': ','.join(tasks), 'datatype': 'train',
+               'image_mode': 'none', 'numthreads': 2}
+        report = self.run_hogwild(MultiWorld, [GuessAgent(opt)], opt, 300)
+        assert report['total'] == 300
+        totals = [report['tasks'][task]['total'] for task in tasks]
+        assert sum(totals) == 300 and min(totals) > 0, totals
+
+    def test_chunks(self):
+        opt = {'task': 'episodes', 'datatype': 'train', 'image_mode': 'none',
+               'numthreads': 3}
+        for chunk in (1, 7):
+            opt['hogwild_chunk'] = chunk
+            agents = [EpisodeTeacher(opt), GuessAgent(opt)]
+            # 7 doesn't divide 500, the last chunk is queued by synchronize()
+            report = self.run_hogwild(DialogPartnerWorld, agents, opt, 500)
+            assert report['total'] == 500, (chunk, report)
+
+
+class TestAsyncWorld(unittest.TestCase):
+    """Make sure conversations mixing async and sync agents run
+    concurrently and give the same metrics."""
+
+    def test_mixed(self):
+        report = TestShardedWorld.evaluate(self)
+        opt = {'task': 'tests.test_worlds:EpisodeTeacher', 'datatype': 'valid',
+               'image_mode': 'none', 'async_conversations': 4}
+        world = create_task(opt, [AsyncGuessAgent(opt)])
+        assert isinstance(world, AsyncWorld) and len(world.worlds) == 4
+        while not world.epoch_done():
+            world.parley()
+        world.synchronize()
+        assert world.report() == report
+        world.shutdown()
+
+    def test_loop(self):
+        opt = {'task': 'episodes', 'datatype': 'valid', 'image_mode': 'none'}
+        world = AsyncDialogPartnerWorld(
+            opt, [EpisodeTeacher(opt), AsyncGuessAgent(opt)])
+        world.parley()
+        loop = world.loop
+        world.parley()
+        # every parley runs on the same event loop
+        assert world.loop is loop and world.report()['total'] == 2
+        world.shutdown()
+        assert loop.is_closed()
+
+    def test_remote(self):
+        context = zmq.Context()
+        partner = context.socket(zmq.REP)
+        port = partner.bind_to_random_port('tcp://127.0.0.1')
+
+        def answer():
+            msg = json.loads(partner.recv_unicode())
+            partner.send_unicode(json.dumps({'text': msg['text'] + '!'}))
+        thread = threading.Thread(target=answer)
+        thread.start()
+        agent = RemoteAgentAgent({'remote_address': '127.0.0.1', 'port': port,
+                                  'remote_host': False})
+        agent.observe({'text': 'hi'})
+        loop = asyncio.new_event_loop()
+        reply = loop.run_until_complete(agent_call(agent, 'act', None))
+        loop.close()
+        thread.join()
+        assert reply == {'text': 'hi!'}
+        agent.socket.close()
+        partner.close()
+
+
+class TestStreamDialogTeacher(unittest.TestCase):
+    """Make sure streamed data gives the same results as loaded data."""
+
+    evaluate = TestShardedWorld.evaluate
+
+    def test_ordered(self):
+        report = self.evaluate()
+        for bs in (1, 4):
+            for num in (1, 3):
+                streamed = self.evaluate(StreamEpisodeTeacher, batchsize=bs,
+                                         eval_processes=num, numthreads=num)
+                assert streamed == report, (bs, num, streamed, report)
+
+    def first_entries(self, teacher, num_episodes):
+        texts = []
+        for _ in range(num_episodes):
+            action = teacher.act()
+            texts.append(action['text'])
+            while not action['episode_done']:
+                action = teacher.act()
+        return texts
+
+    def test_threads(self):
+        texts = []
+        for i in range(2):
+            opt = {'datatype': 'valid', 'image_mode': 'none', 'numthreads': 2,
+                   'threadindex': i}
+            teacher = StreamEpisodeTeacher(opt)
+            texts.extend(self.first_entries(teacher, 51 - i))
+            assert teacher.epoch_done()
+        assert sorted(texts) == sorted('{} 0'.format(e) for e in range(101))
+
+    def test_shuffle(self):
+        opt = {'datatype': 'train', 'image_mode': 'none',
+               'stream_buffer_size': 20}
+        teacher = StreamEpisodeTeacher(opt)
+        texts = self.first_entries(teacher, 202)
+        # the second pass only reaches the buffer after 101 - 20 episodes
+        assert len(set(texts[:81])) == 81
+        assert texts[:81] != ['{} 0'.format(e) for e in range(81)]
+        assert set(texts) <= set('{} 0'.format(e) for e in range(101))
+        assert len(teacher) == 251
+
+
+class TestBatchWorld(unittest.TestCase):
+    """Make sure the copies of a batch world get their own batch index."""
+
+    def test_batchindex(self):
+        opt = Opt({'task': 'episodes', 'datatype': 'valid',
+                   'image_mode': 'none', 'batchsize': 5, 'list': [1]})
+        copied = copy.deepcopy(opt)
+        assert type(copied) == Opt and copied == opt
+        assert copied['list'] is not opt['list']
+
+        world = BatchWorld(opt, DialogPartnerWorld(
+            opt, [EpisodeTeacher(opt), GuessAgent(opt)]))
+        for i, w in enumerate(world.worlds):
+            teacher, agent = w.get_agents()
+            assert teacher.data_offset == i
+            assert agent.opt['batchindex'] == i
+            assert teacher.data is world.world.get_agents()[0].data
+
+
+class TestPrefetch(unittest.TestCase):
+    """Make sure prefetched batches keep the turns of each episode."""
+
+    def test_workers(self):
+        for workers in (1, 2, 3):
+            opt = {'task': 'episodes', 'datatype': 'train',
+                   'image_mode': 'none', 'batchsize': 5,
+                   'prefetch_batches': 2, 'prefetch_workers': workers}
+            world = BatchWorld(opt, DialogPartnerWorld(
+                opt, [EpisodeTeacher(opt), GuessAgent(opt)]))
+            assert len(world.prefetchers) == workers
+            last = [None] * 5
+            for _ in range(30):
+                world.parley()
+                for i, w in enumerate(world.worlds):
+                    act = w.get_acts()[0]
+                    episode, turn = map(int, act['text'].split())
+                    if last[i] is None or last[i]['episode_done']:
+                        assert turn == 0, (workers, i, act, last[i])
+                    else:
+                        assert (episode, turn) == (
+                            int(last[i]['text'].split()[0]),
+                            int(last[i]['text'].split()[1]) + 1), \
+                            (workers, i, act, last[i])
+                    last[i] = act
+            world.shutdown()
+
+    def test_batch_sort(self):
+        opt = {'task': 'episodes', 'datatype': 'train', 'image_mode': 'none',
+               'batchsize': 4, 'batch_sort': True, 'prefetch_batches': 2,
+               'prefetch_workers': 2}
+        world = BatchWorld(opt, DialogPartnerWorld(
+            opt, [LengthTeacher(opt), GuessAgent(opt)]))
+        # all slots take their episodes from one LengthBuckets
+        assert len(world.prefetchers) == 1
+        batches = []
+        for _ in range(10):
+            world.parley()
+            batches.append(sorted(int(w.get_acts()[0]['text'].split()[0])
+                                  for w in world.worlds))
+        world.shutdown()
+        # one epoch of batches of episodes of similar lengths
+        assert sorted(batches) == [list(range(i, i + 4))
+                                   for i in range(0, 40, 4)]
+
+
+class TestLazyTasks(unittest.TestCase):
+    """Make sure tasks are loaded when used and dropped when unused."""
+
+    def tasks(self, datatype, shared=None, **kwargs):
+        opt = {'task': 'a,b,c', 'datatype': datatype, 'image_mode': 'none',
+               'lazy_tasks': True}
+        opt.update(kwargs)
+        self.created = []
+
+        def create(o):
+            self.created.append(o['task'])
+            return EpisodeTeacher(o)
+        return LazyTasks(opt, create, create_agent_from_shared, shared)
+
+    def test_lazy(self):
+        with tempfile.TemporaryDirectory() as datapath:
+            tasks = self.tasks('train', datapath=datapath, max_loaded_tasks=2)
+            assert len(tasks) == 3 and self.created == []
+            tasks[0].act()
+            tasks[1]
+            tasks[0]
+            # the least recently used task is dropped to load another one
+            tasks[2]
+            assert self.created == ['a', 'b', 'c']
+            assert tasks.loaded() == [tasks[0], tasks[2]]
+            assert [r[1]['total'] for r in tasks.task_reports()] == [0, 0, 0]
+
+            # lengths of tasks which were seen are cached
+            assert tasks.length(2) == 251
+            with open(os.path.join(datapath, 'task_lengths.json')) as read:
+                assert json.load(read) == {'c:train': 251}
+            tasks = self.tasks('train:ordered', datapath=datapath)
+            assert tasks.length(2) == 251 and self.created == []
+            assert tasks.length(0) == 251 and self.created == ['a']
+
+    def test_ordered(self):
+        tasks = self.tasks('valid', max_loaded_tasks=1)
+        tasks[0]
+        tasks[1]
+        # a task can't be dropped before the end of its epoch
+        assert len(tasks.loaded()) == 2
+        while not tasks[0].epoch_done():
+            tasks[0].act()
+        tasks[2]
+        assert self.created == ['a', 'b', 'c'] and len(tasks.loaded()) == 2
+        assert tasks.epoch_done(0) and not tasks.epoch_done(1)
+        tasks.reset()
+        assert not tasks.epoch_done(0)
+
+    def test_copies(self):
+        tasks = self.tasks('valid', batchindex=0)
+        shared = tasks.share()
+        copies = []
+        for i in (1, 2):
+            opt = {'task': 'a,b,c', 'datatype': 'valid', 'batchindex': i,
+                   'image_mode': 'none', 'lazy_tasks': True}
+            copies.append(LazyTasks(opt, None, create_agent_from_shared,
+                                    shared))
+        teacher = copies[0][1]
+        # the task is loaded once, and the copies read their own part
+        assert self.created == ['b']
+        assert teacher.data is tasks[1].data
+        assert [tasks[1].data_offset, teacher.data_offset] == [0, 1]
+        # it is created for all copies before they use (and clear) metrics
+        assert copies[1].loaded()[0].data_offset == 2
+        teacher.act()
+        teacher.observe({'text': '1 0'})
+        assert copies[1][1].report()['total'] == 1
+
+    def test_timing(self):
+        opt = {'task': 'tests.test_worlds:EpisodeTeacher,'
+                       'tests.test_worlds:ShortTeacher',
+               'datatype': 'valid', 'image_mode': 'none', 'lazy_tasks': True}
+        world = MultiWorld(opt, [GuessAgent(opt)])
+        world.enable_timing()
+        assert world.worlds.loaded() == []
+        while not world.epoch_done():
+            world.parley()
+        # the agents of both tasks are timed once their task is loaded
+        report = world.report()['timing']
+        teachers = [w.agents[0] for w in world.worlds.loaded()]
+        assert len(teachers) == 2
+        for teacher in teachers:
+            assert report[teacher.getID() + '.act']['count'] == len(teacher)
+        assert report['agent.act']['count'] == 271
+
+if __name__ == '__main__':
+    unittest.main()